@@ -1,12 +1,15 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from database import get_database
 from models import UserInDB, TokenData
+from cache import TTLCache
 import os
 
 # Security settings
@@ -14,8 +17,15 @@ SECRET_KEY = os.getenv("SECRET_KEY", "hemensatbana-super-secret-key-2024")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Authenticated users keyed by token subject (email); profiles change rarely
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -23,6 +33,73 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# bcrypt is deliberately slow, so it runs in a bounded pool off the event loop.
+# PASSWORD_HASH_WORKERS=0 hashes inline (only useful for benchmarks).
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+
+_hash_executor: Optional[Executor] = None
+_hash_in_flight = 0
+
+def configure_password_pool(
+    workers: int = PASSWORD_HASH_WORKERS,
+    queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT,
+    kind: str = PASSWORD_HASH_EXECUTOR
+):
+    """(Re)create the hashing pool; called lazily and by benchmarks"""
+    global _hash_executor, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_LIMIT
+    shutdown_password_pool()
+    PASSWORD_HASH_WORKERS = workers
+    PASSWORD_HASH_QUEUE_LIMIT = queue_limit
+    if workers <= 0:
+        return
+    if kind == "process":
+        _hash_executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        _hash_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+def shutdown_password_pool():
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+
+def password_pool_stats() -> dict:
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "queueLimit": PASSWORD_HASH_QUEUE_LIMIT,
+        "inFlight": _hash_in_flight,
+    }
+
+async def _run_in_password_pool(fn, *args):
+    global _hash_in_flight
+    if PASSWORD_HASH_WORKERS <= 0:
+        return fn(*args)
+    if _hash_executor is None:
+        configure_password_pool()
+    
+    # Fail fast instead of letting a login storm queue up unbounded work
+    if _hash_in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service is busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+    
+    _hash_in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_in_flight -= 1
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_in_password_pool(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_in_password_pool(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -43,14 +120,11 @@ async def authenticate_user(db: AsyncIOMotorDatabase, email: str, password: str)
     user = await get_user_by_email(db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     return user
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncIOMotorDatabase = Depends(get_database)
-):
+async def get_user_from_token(db: AsyncIOMotorDatabase, token: str) -> UserInDB:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -58,7 +132,6 @@ async def get_current_user(
     )
     
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
@@ -67,11 +140,40 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = await get_user_by_email(db, email=token_data.email)
+    user = user_cache.get(token_data.email)
     if user is None:
-        raise credentials_exception
+        user = await get_user_by_email(db, email=token_data.email)
+        if user is None:
+            raise credentials_exception
+        user_cache.set(token_data.email, user)
     return user
 
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    return await get_user_from_token(db, credentials.credentials)
+
+async def get_stream_user(
+    token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Authenticate a header or a ``?token=`` query parameter.
+
+    Browsers' EventSource cannot send an Authorization header, so event
+    streams also accept the access token in the URL.
+    """
+    if credentials is not None:
+        token = credentials.credentials
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_user_from_token(db, token)
+
 async def get_current_user_optional(
     credentials: HTTPAuthorizationCredentials = Depends(security, use_cache=False),
     db: AsyncIOMotorDatabase = Depends(get_database)
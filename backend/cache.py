@@ -0,0 +1,175 @@
+"""Small in-process caches.
+
+These are per-worker: every uvicorn process holds its own copy, so
+entries must be safe to serve slightly stale until their TTL runs out.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+_MISSING = object()
+
+# Result of a fill whose computing request was cancelled
+_ABANDONED = object()
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+class ResponseCache:
+    """TTL cache of rendered responses with tag invalidation and single-flight fills.
+
+    Each entry remembers the generation of its tags when it was computed;
+    invalidating a tag bumps its generation, which makes every entry carrying
+    that tag stale without having to find them. Concurrent misses for the same
+    key share one computation instead of stampeding the database.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 15.0):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations: Dict[str, int] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    def _snapshot(self, tags: Iterable[str]) -> Tuple[Tuple[str, int], ...]:
+        return tuple((tag, self._generations.get(tag, 0)) for tag in tags)
+
+    def _is_current(self, snapshot) -> bool:
+        return all(self._generations.get(tag, 0) == generation for tag, generation in snapshot)
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        tags: Iterable[str],
+        compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        while True:
+            entry = self._entries.get(key)
+            if entry is not None:
+                snapshot, value = entry
+                if self._is_current(snapshot):
+                    return value
+                self._entries.invalidate(key)
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            value = await asyncio.shield(pending)
+            if value is not _ABANDONED:
+                return value
+            # The computing request was cancelled; one of its waiters takes over
+
+        # Tag generations are read before computing, so an invalidation that
+        # lands mid-computation leaves the stored entry already stale
+        snapshot = self._snapshot(tags)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            # A client disconnect must not fail the requests waiting on it
+            future.set_result(_ABANDONED)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark retrieved so waiter-less failures aren't logged as unhandled
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            del self._inflight[key]
+
+        self._entries.set(key, (snapshot, value))
+        return value
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {**self._entries.stats(), "coalesced": self.coalesced}
+
+ALL_CATEGORIES_TAG = "category:*"
+
+def _category_tag(category) -> str:
+    return f"category:{getattr(category, 'value', category)}"
+
+def feed_page_tags(category=None) -> List[str]:
+    """Tags for a cached feed page filtered by ``category`` (or unfiltered)"""
+    return [_category_tag(category)] if category else [ALL_CATEGORIES_TAG]
+
+def feed_cache_tags(*categories) -> List[str]:
+    """Tags for feed pages affected by a write to ``categories``.
+
+    Pages without a category filter show every category, so they are
+    tagged with (and invalidated through) ``ALL_CATEGORIES_TAG``.
+    """
+    tags = [ALL_CATEGORIES_TAG]
+    for category in categories:
+        if category:
+            tags.append(_category_tag(category))
+    return tags
+
+# Rendered public listing feeds (GET /listings and category pages)
+feed_cache = ResponseCache(
+    maxsize=int(os.getenv("FEED_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("FEED_CACHE_TTL_SECONDS", "15"))
+)
@@ -0,0 +1,98 @@
+"""Denormalized conversation threads backing the messages inbox.
+
+A conversation is the thread between a listing's owner (the buyer who
+posted the request) and one seller about that listing. Each document
+stores the last-message snippet, its timestamp and an unread counter per
+participant, so the inbox is one indexed query on ``participants``
+instead of an aggregation over every message.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+SNIPPET_LENGTH = 120
+
+def conversation_id(listing_id: str, buyer_id: str, seller_id: str) -> str:
+    return f"{listing_id}:{buyer_id}:{seller_id}"
+
+def message_conversation_id(message: dict) -> str:
+    """Conversation of a stored message, deriving it for messages older than the field.
+
+    Messages are always sent by a seller to the listing owner, so the
+    receiver is the buyer.
+    """
+    return message.get("conversationId") or conversation_id(
+        message["listingId"], message["receiverId"], message["senderId"]
+    )
+
+def snippet(content: str) -> str:
+    if len(content) <= SNIPPET_LENGTH:
+        return content
+    return content[:SNIPPET_LENGTH - 1].rstrip() + "…"
+
+async def record_message(db: AsyncIOMotorDatabase, message: dict, listing: dict):
+    """Upsert the conversation for a newly stored message"""
+    buyer_id = listing["userId"]
+    seller_id = message["senderId"] if message["senderId"] != buyer_id else message["receiverId"]
+    created_at: datetime = message["createdAt"]
+
+    await db.conversations.update_one(
+        {"_id": message["conversationId"]},
+        {
+            "$set": {
+                "listingTitle": listing.get("title"),
+                "lastMessage": {
+                    "_id": message["_id"],
+                    "senderId": message["senderId"],
+                    "content": snippet(message["content"]),
+                    "createdAt": created_at,
+                },
+                "lastMessageAt": created_at,
+            },
+            "$inc": {f"unread.{message['receiverId']}": 1},
+            "$setOnInsert": {
+                "listingId": listing["_id"],
+                "buyerId": buyer_id,
+                "sellerId": seller_id,
+                "participants": [buyer_id, seller_id],
+                f"unread.{message['senderId']}": 0,
+                "createdAt": created_at,
+            },
+        },
+        upsert=True
+    )
+
+async def record_read(db: AsyncIOMotorDatabase, conversation: str, user_id: str, count: int = 1):
+    """Take ``count`` newly read messages off ``user_id``'s unread counter"""
+    await record_reads(db, user_id, {conversation: count})
+
+async def record_reads(db: AsyncIOMotorDatabase, user_id: str, counts: Dict[str, int]):
+    """Apply ``{conversation_id: newly_read}`` to ``user_id``'s unread counters"""
+    operations = [
+        UpdateOne({"_id": conversation}, {"$inc": {f"unread.{user_id}": -count}})
+        for conversation, count in counts.items()
+        if count > 0
+    ]
+    if operations:
+        await db.conversations.bulk_write(operations, ordered=False)
+
+async def unread_counts(db: AsyncIOMotorDatabase, user_id: str, conversations: Iterable[str]) -> Dict[str, int]:
+    """Current unread counters of ``user_id`` in ``conversations``"""
+    docs = await db.conversations.find(
+        {"_id": {"$in": list(conversations)}},
+        {f"unread.{user_id}": 1}
+    ).to_list(length=None)
+    return {doc["_id"]: max(doc.get("unread", {}).get(user_id, 0), 0) for doc in docs}
+
+def to_inbox_entry(conversation: dict, user_id: str) -> dict:
+    """Shape a stored conversation for ``user_id``'s inbox"""
+    counterpart: Optional[str] = next(
+        (participant for participant in conversation["participants"] if participant != user_id),
+        None
+    )
+    return {
+        **conversation,
+        "counterpartId": counterpart,
+        "unreadCount": max(conversation.get("unread", {}).get(user_id, 0), 0),
+    }
@@ -1,18 +1,37 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 import os
 from typing import Optional
+from indexes import ensure_indexes
+from db_metrics import CommandMetrics, PoolMetrics
 
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
 database_name = os.environ.get('DB_NAME', 'hemensatbana')
 
+# Connection pool; unset timeouts keep the driver defaults
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_POOL_OPTIONS = {
+    'maxIdleTimeMS': os.environ.get('MONGO_MAX_IDLE_TIME_MS'),
+    'waitQueueTimeoutMS': os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+    'connectTimeoutMS': os.environ.get('MONGO_CONNECT_TIMEOUT_MS'),
+    'socketTimeoutMS': os.environ.get('MONGO_SOCKET_TIMEOUT_MS'),
+    'serverSelectionTimeoutMS': os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS'),
+}
+
 client: Optional[AsyncIOMotorClient] = None
 database: Optional[AsyncIOMotorDatabase] = None
 
 async def connect_to_mongo():
     """Create database connection"""
     global client, database
-    client = AsyncIOMotorClient(mongo_url)
+    client = AsyncIOMotorClient(
+        mongo_url,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        event_listeners=[CommandMetrics(), PoolMetrics()],
+        **{option: int(value) for option, value in MONGO_POOL_OPTIONS.items() if value}
+    )
     database = client[database_name]
     
     # Create indexes for better performance
@@ -29,22 +48,6 @@ async def get_database() -> AsyncIOMotorDatabase:
     return database
 
 async def create_indexes():
-    """Create database indexes for better performance"""
+    """Create the indexes registered in ``indexes.INDEXES``"""
     if database is not None:
-        # User indexes
-        await database.users.create_index("email", unique=True)
-        
-        # Listing indexes
-        await database.listings.create_index([("category", 1), ("createdAt", -1)])
-        await database.listings.create_index([("userId", 1), ("createdAt", -1)])
-        await database.listings.create_index([("status", 1), ("createdAt", -1)])
-        await database.listings.create_index("createdAt")
-        
-        # Message indexes
-        await database.messages.create_index([("listingId", 1), ("createdAt", -1)])
-        await database.messages.create_index([("senderId", 1), ("createdAt", -1)])
-        await database.messages.create_index([("receiverId", 1), ("createdAt", -1)])
-        
-        # Favorite indexes
-        await database.favorites.create_index([("userId", 1), ("createdAt", -1)])
-        await database.favorites.create_index([("userId", 1), ("listingId", 1)], unique=True)
\ No newline at end of file
+        await ensure_indexes(database)
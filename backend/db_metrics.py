@@ -0,0 +1,164 @@
+"""MongoDB command and connection-pool monitoring.
+
+The listeners are registered on the client in ``database.connect_to_mongo``.
+pymongo calls them synchronously on the thread that runs the operation
+(one of Motor's executor threads), so they only record numbers.
+"""
+import threading
+import time
+from typing import Dict, Tuple
+from pymongo import monitoring
+from metrics import registry, current_route, COUNT_BUCKETS
+
+COMMAND_LABELS = ("collection", "command", "route")
+
+command_duration = registry.histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command latency",
+    COMMAND_LABELS
+)
+command_documents = registry.histogram(
+    "mongodb_command_documents",
+    "Documents returned or written per MongoDB command",
+    COMMAND_LABELS,
+    buckets=COUNT_BUCKETS
+)
+command_failures = registry.counter(
+    "mongodb_command_failures_total",
+    "MongoDB commands that returned an error",
+    COMMAND_LABELS
+)
+pool_checkout_wait = registry.histogram(
+    "mongodb_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    ("address",)
+)
+pool_checkout_failures = registry.counter(
+    "mongodb_pool_checkout_failures_total",
+    "Connection checkouts that failed or timed out",
+    ("address", "reason")
+)
+pool_checked_out = registry.gauge(
+    "mongodb_pool_checked_out_connections",
+    "Connections currently checked out of the pool",
+    ("address",)
+)
+pool_open = registry.gauge(
+    "mongodb_pool_open_connections",
+    "Connections currently open in the pool",
+    ("address",)
+)
+
+# Handshakes, auth and session bookkeeping aren't application queries
+IGNORED_COMMANDS = frozenset({
+    "hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue",
+    "authenticate", "buildInfo", "endSessions", "getnonce", "killCursors",
+})
+
+# Commands whose reply "n" counts the documents written or counted
+WRITE_COMMANDS = frozenset({"insert", "update", "delete", "count"})
+
+def _address(address) -> str:
+    host, port = address
+    return f"{host}:{port}"
+
+def _documents(command_name: str, reply: dict) -> int:
+    if command_name in WRITE_COMMANDS:
+        return reply.get("n", 0)
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    return 0
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started: Dict[Tuple[int, tuple], Tuple[str, str]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else event.command.get("collection", "-")
+        with self._lock:
+            self._started[(event.request_id, event.connection_id)] = (collection, current_route.get())
+
+    def _finish(self, event) -> Tuple[str, str]:
+        with self._lock:
+            return self._started.pop((event.request_id, event.connection_id), (None, None))
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        collection, route = self._finish(event)
+        if collection is None:
+            return
+        labels = (collection, event.command_name, route)
+        command_duration.observe(event.duration_micros / 1e6, *labels)
+        command_documents.observe(_documents(event.command_name, event.reply), *labels)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        collection, route = self._finish(event)
+        if collection is None:
+            return
+        labels = (collection, event.command_name, route)
+        command_duration.observe(event.duration_micros / 1e6, *labels)
+        command_failures.inc(*labels)
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Checkout wait times and pool occupancy per server"""
+
+    def __init__(self):
+        # Checkout start and end are reported on the same thread
+        self._checkout_started = threading.local()
+
+    def pool_created(self, event):
+        pool_open.set(0, _address(event.address))
+        pool_checked_out.set(0, _address(event.address))
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pool_open.inc(_address(event.address))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pool_open.dec(_address(event.address))
+
+    def connection_check_out_started(self, event):
+        self._checkout_started.at = time.perf_counter()
+
+    def _waited(self) -> float:
+        started = getattr(self._checkout_started, "at", None)
+        self._checkout_started.at = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_failed(self, event):
+        address = _address(event.address)
+        pool_checkout_wait.observe(self._waited(), address)
+        pool_checkout_failures.inc(address, str(event.reason))
+
+    def connection_checked_out(self, event):
+        address = _address(event.address)
+        pool_checkout_wait.observe(self._waited(), address)
+        pool_checked_out.inc(address)
+
+    def connection_checked_in(self, event):
+        pool_checked_out.dec(_address(event.address))
+
+def pool_stats() -> Dict[str, dict]:
+    """Open and checked-out connections per server address"""
+    return {
+        address: {
+            "open": pool_open.value(address),
+            "checkedOut": pool_checked_out.value(address),
+        }
+        for (address,) in pool_open.series()
+    }
@@ -0,0 +1,113 @@
+"""Active-listing counts per category and urgency for the filter sidebar.
+
+Counts are kept in memory per (category, urgency) pair, so every facet
+breakdown is a sum over a small fixed grid no matter how many listings
+there are. The listing write paths (create, update, delete, expiry)
+adjust them as they go, and a periodic ``$group`` over active listings
+replaces them wholesale, which repairs any drift. Like the caches they
+are per worker: changes made through another worker show up here after
+the next reconcile.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import database
+from models import Category, UrgencyLevel, ListingStatus
+from listing_purge import NOT_DELETED
+from tasks import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+FACET_RECONCILE_SECONDS = float(os.getenv("FACET_RECONCILE_SECONDS", "300"))
+
+def _value(value) -> str:
+    return getattr(value, "value", value)
+
+def _key(listing: dict) -> Tuple[str, str]:
+    return _value(listing["category"]), _value(listing["urgency"])
+
+def _counted(listing: Optional[dict]) -> bool:
+    return (
+        listing is not None
+        and _value(listing.get("status")) == ListingStatus.ACTIVE.value
+        and "deletedAt" not in listing
+    )
+
+class FacetCounts:
+    def __init__(self, reconcile_interval: float):
+        # (category, urgency) -> active listings
+        self._counts: Counter = Counter()
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self.reconciled_at: Optional[datetime] = None
+        self._task = PeriodicTask("facet-reconcile", reconcile_interval, self._reconcile_job)
+
+    def record(self, before: Optional[dict], after: Optional[dict]):
+        """Apply a listing write; ``before``/``after`` are None when it didn't/doesn't exist"""
+        if _counted(before):
+            self._counts[_key(before)] -= 1
+        if _counted(after):
+            self._counts[_key(after)] += 1
+
+    def facets(self, category: Optional[Category] = None, urgency: Optional[UrgencyLevel] = None) -> dict:
+        """Counts per category and per urgency; each honours the other's filter"""
+        category, urgency = _value(category), _value(urgency)
+        categories = {value.value: 0 for value in Category}
+        urgencies = {value.value: 0 for value in UrgencyLevel}
+        total = 0
+        for (listing_category, listing_urgency), count in self._counts.items():
+            if count <= 0:
+                continue
+            if urgency is None or listing_urgency == urgency:
+                if listing_category in categories:
+                    categories[listing_category] += count
+            if category is None or listing_category == category:
+                if listing_urgency in urgencies:
+                    urgencies[listing_urgency] += count
+            if urgency in (None, listing_urgency) and category in (None, listing_category):
+                total += count
+        return {"total": total, "categories": categories, "urgency": urgencies}
+
+    async def reconcile(self, db: AsyncIOMotorDatabase):
+        """Recount active listings from the database"""
+        pipeline = [
+            {"$match": {"status": ListingStatus.ACTIVE, **NOT_DELETED}},
+            {"$group": {"_id": {"category": "$category", "urgency": "$urgency"}, "count": {"$sum": 1}}},
+        ]
+        counts: Counter = Counter()
+        async for row in db.listings.aggregate(pipeline):
+            counts[(row["_id"]["category"], row["_id"]["urgency"])] = row["count"]
+        self._counts = counts
+        self._loaded = True
+        self.reconciled_at = datetime.utcnow()
+
+    async def ensure_loaded(self, db: AsyncIOMotorDatabase):
+        """Load the counts on first use; concurrent callers share one query"""
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self.reconcile(db)
+
+    async def _reconcile_job(self):
+        if database.database is not None:
+            await self.reconcile(database.database)
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self._loaded,
+            "listings": sum(count for count in self._counts.values() if count > 0),
+            "reconciledAt": self.reconciled_at.isoformat() if self.reconciled_at else None,
+        }
+
+    def start(self):
+        self._task.start()
+
+    async def stop(self):
+        await self._task.stop()
+
+facet_counts = FacetCounts(FACET_RECONCILE_SECONDS)
@@ -0,0 +1,97 @@
+"""Sparse fieldsets and the summary projection for listing feeds.
+
+Feed cards need a title, a description snippet, the budget and a city, so
+list endpoints default to ``view=summary``: only ``SUMMARY_FIELDS`` are
+projected, and the description is cut to ``SUMMARY_DESCRIPTION_LENGTH``
+characters inside ``$project``, before the document leaves MongoDB.
+``view=full`` returns every field in ``LISTING_FIELDS``. ``fields=`` picks
+the fields explicitly, under either view. Fields needed for sorting and
+cursors are still read but dropped from the output.
+"""
+import os
+from typing import Iterable, List, Optional, Tuple
+from fastapi import HTTPException, status
+
+LISTING_FIELDS = (
+    "title",
+    "description",
+    "category",
+    "location",
+    "budgetMin",
+    "budgetMax",
+    "urgency",
+    "status",
+    "userId",
+    "views",
+    "messageCount",
+    "city",
+    "district",
+    "createdAt",
+    "updatedAt",
+    "user",
+)
+
+# What a feed card shows
+SUMMARY_FIELDS = (
+    "title",
+    "description",
+    "budgetMin",
+    "budgetMax",
+    "city",
+    "createdAt",
+)
+
+SUMMARY_DESCRIPTION_LENGTH = int(os.getenv("SUMMARY_DESCRIPTION_LENGTH", "160"))
+
+LISTING_VIEW_PATTERN = "^(summary|full)$"
+
+def parse_listing_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Validate a comma-separated ``fields`` parameter into a sorted tuple"""
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    requested.discard("_id")
+    unknown = requested - set(LISTING_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown listing fields: {', '.join(sorted(unknown))}"
+        )
+    return tuple(sorted(requested))
+
+def resolve_listing_fields(fields: Optional[Tuple[str, ...]], view: str) -> Optional[Tuple[str, ...]]:
+    """The fields a page returns: the requested ones, else the view's; None means all"""
+    if fields:
+        return fields
+    return SUMMARY_FIELDS if view == "summary" else None
+
+def listing_projection(fields: Optional[Iterable[str]], view: str, sort_fields: Iterable[str] = ()) -> dict:
+    """Build the ``$project`` stage body for a listing page"""
+    selected = set(resolve_listing_fields(tuple(fields or ()), view) or LISTING_FIELDS)
+    projection = {}
+    for field in selected:
+        if field == "user":
+            # Hydrated from userId after the query
+            projection["userId"] = 1
+        elif field == "description" and view == "summary":
+            projection["description"] = {"$substrCP": ["$description", 0, SUMMARY_DESCRIPTION_LENGTH]}
+        else:
+            projection[field] = 1
+    for field in sort_fields:
+        if field != "_id":
+            projection.setdefault(field, 1)
+    return projection
+
+def wants_user(fields: Optional[Iterable[str]]) -> bool:
+    return fields is None or "user" in fields
+
+def trim_to_fields(docs: List[dict], fields: Optional[Iterable[str]]) -> List[dict]:
+    """Drop helper fields (sort keys, userId) that were read but not requested"""
+    if fields is None:
+        return docs
+    keep = set(fields) | {"_id"}
+    for doc in docs:
+        for key in list(doc):
+            if key not in keep:
+                del doc[key]
+    return docs
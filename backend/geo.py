@@ -0,0 +1,125 @@
+"""Location normalization against a bundled gazetteer of Turkish cities.
+
+``data/tr_cities.json`` holds the 81 provinces, with aliases such as
+"Antep" or "İzmit", and districts of the largest metros. The free-text
+``location`` of a listing is matched against it at write time, storing
+``city``, ``district`` and a GeoJSON ``geo`` point (the district's
+centre if one was recognized, else the city's). Coordinates are
+approximate centres, which is enough for radius filtering at city
+scale. Unrecognized locations store nulls and simply don't match city
+or radius filters.
+"""
+import json
+import math
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from fastapi import HTTPException, status
+from search import fold
+
+GAZETTEER_PATH = Path(__file__).parent / "data" / "tr_cities.json"
+
+EARTH_RADIUS_KM = 6378.1
+MAX_RADIUS_KM = 500
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Case endings a place name may carry in folded form ("İzmir'de", "Kadıköyden")
+_PLACE_SUFFIXES = ("daki", "deki", "taki", "teki", "dan", "den", "tan", "ten", "da", "de", "ta", "te", "")
+
+def _load_gazetteer(path: Path):
+    with open(path, encoding="utf-8") as file:
+        cities = json.load(file)
+    by_name: Dict[str, dict] = {}
+    districts: Dict[str, List[Tuple[dict, dict]]] = {}
+    for city in cities:
+        for name in [city["name"]] + city.get("aliases", []):
+            by_name[fold(name)] = city
+        for district in city.get("districts", []):
+            districts.setdefault(fold(district["name"]), []).append((city, district))
+    return by_name, districts
+
+CITIES, DISTRICTS = _load_gazetteer(GAZETTEER_PATH)
+
+def _point(place: dict) -> dict:
+    return {"type": "Point", "coordinates": [place["lng"], place["lat"]]}
+
+def _bases(text: str) -> Iterator[str]:
+    """Each word of ``text`` with, then without, a case ending"""
+    for word in _WORD_RE.findall(fold(text)):
+        for suffix in _PLACE_SUFFIXES:
+            if word.endswith(suffix) and len(word) > len(suffix):
+                yield word[:len(word) - len(suffix)] if suffix else word
+
+def find_city(name: str) -> Optional[dict]:
+    """The gazetteer entry for a city name or alias, if any"""
+    return CITIES.get("".join(_WORD_RE.findall(fold(name))))
+
+def normalize_location(location: Optional[str]) -> dict:
+    """``city``, ``district`` and ``geo`` fields for a free-text location"""
+    tokens = list(_bases(location)) if location else []
+    city = next((CITIES[token] for token in tokens if token in CITIES), None)
+
+    district = None
+    for token in tokens:
+        candidates = DISTRICTS.get(token, [])
+        if city is not None:
+            candidates = [entry for entry in candidates if entry[0] is city]
+        # A district alone identifies its city only when the name is unique
+        if len(candidates) == 1:
+            city, district = candidates[0]
+            break
+
+    if city is None:
+        return {"city": None, "district": None, "geo": None}
+    return {
+        "city": city["name"],
+        "district": district["name"] if district else None,
+        "geo": _point(district or city),
+    }
+
+def distance_km(a: List[float], b: List[float]) -> float:
+    """Great-circle distance between two [lng, lat] points, on the sphere $centerSphere uses"""
+    lng1, lat1, lng2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+def build_location_query(
+    city: Optional[str],
+    lat: Optional[float],
+    lng: Optional[float],
+    radius_km: Optional[float]
+) -> dict:
+    """Filter for listings in ``city``, or within ``radius_km`` of it or of lat/lng"""
+    if (lat is None) != (lng is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="lat and lng must be given together"
+        )
+
+    center = None
+    if city:
+        entry = find_city(city)
+        if entry is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown city: {city}"
+            )
+        center = [entry["lng"], entry["lat"]]
+    if lat is not None:
+        center = [lng, lat]
+
+    if radius_km is None:
+        if lat is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="radius_km is required with lat and lng"
+            )
+        return {"city": entry["name"]} if city else {}
+    if center is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="radius_km needs a city or lat and lng"
+        )
+    # A radius may cross province borders, so it replaces the city match
+    return {"geo": {"$geoWithin": {"$centerSphere": [center, radius_km / EARTH_RADIUS_KM]}}}
@@ -0,0 +1,108 @@
+"""HTTP request metrics and event-loop lag monitoring.
+
+``MetricsMiddleware`` is plain ASGI rather than ``BaseHTTPMiddleware``,
+so it adds no extra task per request and does not buffer streaming
+responses. Requests are labelled with their route template (set on the
+scope by the router), which keeps the label set bounded.
+"""
+import os
+import time
+from metrics import registry, LATENCY_BUCKETS
+from tasks import PeriodicTask
+
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+SIZE_BUCKETS = (100, 1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+requests_total = registry.counter(
+    "http_requests_total",
+    "HTTP requests by route and status",
+    ("method", "route", "status")
+)
+request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Time from request start until the response is complete",
+    ("method", "route")
+)
+response_size = registry.histogram(
+    "http_response_size_bytes",
+    "Response body size",
+    ("method", "route"),
+    buckets=SIZE_BUCKETS
+)
+requests_in_flight = registry.gauge(
+    "http_requests_in_flight",
+    "Requests currently being served",
+    ("method",)
+)
+loop_lag = registry.gauge(
+    "event_loop_lag_seconds",
+    "How late the last event-loop lag probe woke up"
+)
+loop_lag.set(0)
+loop_lag_histogram = registry.histogram(
+    "event_loop_lag_probe_seconds",
+    "Event-loop lag probe delays",
+    buckets=LATENCY_BUCKETS
+)
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        started = time.perf_counter()
+        status_code = 500
+        body_bytes = 0
+
+        async def send_with_metrics(message):
+            nonlocal status_code, body_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                body_bytes += len(message.get("body", b""))
+            await send(message)
+
+        requests_in_flight.inc(method)
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            requests_in_flight.dec(method)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            requests_total.inc(method, route, str(status_code))
+            request_duration.observe(time.perf_counter() - started, method, route)
+            response_size.observe(body_bytes, method, route)
+
+class LoopLagMonitor:
+    """Measure how late a periodic probe runs; a blocked loop makes it late"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._last = None
+        self._task = PeriodicTask("loop-lag", interval, self._probe)
+
+    @property
+    def lag(self) -> float:
+        return loop_lag.value()
+
+    async def _probe(self):
+        now = time.perf_counter()
+        if self._last is not None:
+            lag = max(0.0, now - self._last - self.interval)
+            loop_lag.set(lag)
+            loop_lag_histogram.observe(lag)
+        self._last = now
+
+    def start(self):
+        self._last = None
+        self._task.start()
+
+    async def stop(self):
+        await self._task.stop()
+
+loop_lag_monitor = LoopLagMonitor(LOOP_LAG_INTERVAL_SECONDS)
@@ -0,0 +1,173 @@
+"""Declarative MongoDB index registry.
+
+``INDEXES`` lists every index the application relies on, by collection.
+Each query shape the routes build should be served by one of them; the
+explain-based check in ``tests/test_index_coverage.py`` fails when one
+falls back to a collection scan or an in-memory sort.
+
+``ensure_indexes`` creates missing indexes and never drops any. To
+change an index, register the new definition under a new name and drop
+the old one in a migration (see ``migrations.py``). That way the
+replacement is built before the old index goes, and a rolling deploy
+does not pull an index out from under workers still running the
+previous release. Indexes that differ from their registered definition,
+or are no longer registered, are only reported.
+
+Keyset-paginated sorts end in ``_id`` (see ``pagination.keyset_sort``),
+so their indexes do too; without it the tiebreaker forces a blocking
+sort.
+"""
+import logging
+import os
+from typing import Dict, List
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT, GEOSPHERE
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from search import SEARCH_FIELDS, SEARCH_WEIGHTS
+
+logger = logging.getLogger(__name__)
+
+# Notifications are dropped this long after they were created
+NOTIFICATION_TTL_DAYS = int(os.getenv("NOTIFICATION_TTL_DAYS", "30"))
+
+# Filter of the partial listing indexes; queries must include it to use them
+ACTIVE_LISTING = {"status": "active"}
+
+def _active(keys, name: str) -> IndexModel:
+    """A listing index limited to active listings, which is all the feed reads"""
+    return IndexModel(keys, name=name, partialFilterExpression=ACTIVE_LISTING)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel("email", unique=True),
+    ],
+    "listings": [
+        # My listings, in every status
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="userId_createdAt_id"),
+        # Feed, per sort order, with and without a category filter. The
+        # newest-first ones end in the budget bounds (equality, sort, range)
+        # so budget filters are applied to index keys before any fetch
+        _active(
+            [("createdAt", DESCENDING), ("_id", DESCENDING), ("budgetMax", ASCENDING), ("budgetMin", ASCENDING)],
+            "active_createdAt_budget"
+        ),
+        _active(
+            [
+                ("category", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING),
+                ("budgetMax", ASCENDING), ("budgetMin", ASCENDING)
+            ],
+            "active_category_createdAt_budget"
+        ),
+        _active([("views", DESCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], "active_views"),
+        _active(
+            [("category", ASCENDING), ("views", DESCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+            "active_category_views"
+        ),
+        _active([("messageCount", DESCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], "active_messageCount"),
+        _active(
+            [("category", ASCENDING), ("messageCount", DESCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+            "active_category_messageCount"
+        ),
+        _active(
+            [("trendingScore", DESCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+            "active_trendingScore"
+        ),
+        _active(
+            [("category", ASCENDING), ("trendingScore", DESCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+            "active_category_trendingScore"
+        ),
+        # City and radius filters
+        _active([("city", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], "active_city_createdAt"),
+        _active([("createdAt", DESCENDING), ("_id", DESCENDING), ("geo", GEOSPHERE)], "active_createdAt_geo"),
+        # Expiry sweep
+        _active([("expiresAt", ASCENDING)], "active_expiresAt"),
+        # Purge of tombstoned listings
+        IndexModel("deletedAt", partialFilterExpression={"deletedAt": {"$exists": True}}),
+        IndexModel(
+            [("status", ASCENDING)] + [(f"searchText.{field}", TEXT) for field in SEARCH_FIELDS],
+            name="listing_search",
+            default_language="none",
+            weights={f"searchText.{field}": weight for field, weight in SEARCH_WEIGHTS.items()}
+        ),
+    ],
+    "messages": [
+        IndexModel([("listingId", ASCENDING), ("createdAt", DESCENDING)]),
+        # Both arms of the sent-or-received $or, merged in createdAt order
+        IndexModel([("senderId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="senderId_createdAt_id"),
+        IndexModel(
+            [("receiverId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+            name="receiverId_createdAt_id"
+        ),
+        IndexModel([("receiverId", ASCENDING), ("isRead", ASCENDING)]),
+        IndexModel(
+            [("conversationId", ASCENDING), ("createdAt", ASCENDING), ("_id", ASCENDING)],
+            name="conversationId_createdAt_id"
+        ),
+    ],
+    "conversations": [
+        IndexModel([("participants", ASCENDING), ("lastMessageAt", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel("listingId"),
+    ],
+    "favorites": [
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="userId_createdAt_id"),
+        IndexModel([("userId", ASCENDING), ("listingId", ASCENDING)], unique=True),
+        IndexModel("listingId"),
+    ],
+    "saved_searches": [
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING)]),
+    ],
+    "notifications": [
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="userId_createdAt_id"),
+        # Unread-only pages and the unread count
+        IndexModel(
+            [("userId", ASCENDING), ("isRead", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)],
+            name="userId_isRead_createdAt_id"
+        ),
+        # One notification per seller and listing, however often it is matched
+        IndexModel([("userId", ASCENDING), ("listingId", ASCENDING)], unique=True),
+        IndexModel("listingId"),
+        IndexModel("createdAt", name="createdAt_ttl", expireAfterSeconds=NOTIFICATION_TTL_DAYS * 24 * 3600),
+    ],
+    "listing_activity": [
+        # Trending window scan, and expiry of buckets once they leave it
+        IndexModel("hour"),
+        IndexModel("expiresAt", expireAfterSeconds=0),
+    ],
+}
+
+# Options compared when checking an existing index against its definition
+COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds", "weights", "default_language")
+
+def _key(key) -> list:
+    # Text fields are stored as _fts/_ftsx and compared through their weights
+    return [
+        (field, direction if isinstance(direction, str) else int(direction))
+        for field, direction in key
+        if direction != TEXT and field not in ("_fts", "_ftsx")
+    ]
+
+def _matches(spec: dict, existing: dict) -> bool:
+    if _key(spec["key"].items()) != _key(existing["key"]):
+        return False
+    return all(spec.get(option) == existing.get(option) for option in COMPARED_OPTIONS)
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> Dict[str, List[str]]:
+    """Create the registered indexes that don't exist yet; returns their names by collection"""
+    built: Dict[str, List[str]] = {}
+    for name, models in INDEXES.items():
+        collection = db[name]
+        existing = await collection.index_information()
+        missing = []
+        for model in models:
+            spec = model.document
+            current = existing.get(spec["name"])
+            if current is None:
+                missing.append(model)
+            elif not _matches(spec, current):
+                logger.warning("Index %s.%s differs from its registered definition", name, spec["name"])
+        if missing:
+            built[name] = await collection.create_indexes(missing)
+
+        unregistered = set(existing) - {model.document["name"] for model in models} - {"_id_"}
+        if unregistered:
+            logger.info("Unregistered indexes on %s: %s", name, ", ".join(sorted(unregistered)))
+    return built
@@ -0,0 +1,120 @@
+"""Expiry of stale listings.
+
+Every listing carries ``expiresAt``: the time it was posted (or last
+renewed) plus a lifetime that depends on its urgency, so an ``acil``
+request lapses after a week while an ``acil-degil`` one stays up for a
+quarter. A periodic sweeper flips active listings past that point to
+``expired`` in bounded batches, keeping the active set (and the partial
+feed indexes limited to it) proportional to the live inventory.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import database
+import user_stats
+from models import UrgencyLevel, ListingStatus
+from cache import feed_cache, feed_cache_tags
+from loaders import listing_summary_cache
+from facets import facet_counts
+from listing_purge import NOT_DELETED
+from tasks import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+LISTING_EXPIRY_INTERVAL_SECONDS = float(os.getenv("LISTING_EXPIRY_INTERVAL_SECONDS", "300"))
+EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "500"))
+EXPIRY_BATCHES_PER_RUN = int(os.getenv("EXPIRY_BATCHES_PER_RUN", "20"))
+
+# How long a listing stays active, by urgency
+LISTING_LIFETIME_DAYS: Dict[UrgencyLevel, int] = {
+    UrgencyLevel.ACIL: 7,
+    UrgencyLevel.BU_HAFTA: 14,
+    UrgencyLevel.BU_AY: 45,
+    UrgencyLevel.ACIL_DEGIL: 90,
+}
+
+def expires_at(urgency, start: datetime) -> datetime:
+    """When a listing posted or renewed at ``start`` expires"""
+    return start + timedelta(days=LISTING_LIFETIME_DAYS[UrgencyLevel(urgency)])
+
+async def expire_batch(db: AsyncIOMotorDatabase, now: datetime, limit: int = EXPIRY_BATCH_SIZE) -> int:
+    """Expire up to ``limit`` overdue active listings; returns how many"""
+    # Tombstoned listings were already taken out of the stats and facets
+    overdue = {"status": ListingStatus.ACTIVE, "expiresAt": {"$lte": now}, **NOT_DELETED}
+    batch = await db.listings.find(
+        overdue,
+        {"userId": 1, "category": 1, "urgency": 1, "status": 1, "deletedAt": 1}
+    ).sort("expiresAt", 1).limit(limit).to_list(length=None)
+    if not batch:
+        return 0
+
+    # The stamp tells this run's updates apart from a concurrent sweep
+    # in another worker, so each listing is counted exactly once
+    stamp = datetime.utcnow()
+    ids = [listing["_id"] for listing in batch]
+    result = await db.listings.update_many(
+        {"_id": {"$in": ids}, **overdue},
+        {"$set": {"status": ListingStatus.EXPIRED, "expiredAt": stamp, "updatedAt": stamp}}
+    )
+    expired: List[dict] = batch
+    if result.modified_count != len(batch):
+        ours = set(await db.listings.distinct("_id", {"_id": {"$in": ids}, "expiredAt": stamp}))
+        expired = [listing for listing in batch if listing["_id"] in ours]
+
+    deltas: Dict[str, Dict[str, int]] = {}
+    for listing in expired:
+        fields = deltas.setdefault(listing["userId"], {"activeListings": 0, "expiredListings": 0})
+        fields["activeListings"] -= 1
+        fields["expiredListings"] += 1
+        listing_summary_cache.invalidate(listing["_id"])
+        facet_counts.record(listing, None)
+    await user_stats.increment_many(db, deltas)
+    if expired:
+        feed_cache.invalidate_tags(feed_cache_tags(*{listing["category"] for listing in expired}))
+    return len(expired)
+
+async def expire_listings(db: AsyncIOMotorDatabase, max_batches: int = EXPIRY_BATCHES_PER_RUN) -> int:
+    """Expire overdue listings batch by batch; ``max_batches=0`` means no limit"""
+    now = datetime.utcnow()
+    expired = batches = 0
+    while not max_batches or batches < max_batches:
+        count = await expire_batch(db, now)
+        expired += count
+        batches += 1
+        if count < EXPIRY_BATCH_SIZE:
+            break
+        # Let request handlers run between batches
+        await asyncio.sleep(0)
+    return expired
+
+async def backfill_expires_at(db: AsyncIOMotorDatabase) -> int:
+    """Set listings.expiresAt on listings created before it existed"""
+    updated = 0
+    operations = []
+    async for listing in db.listings.find({"expiresAt": {"$exists": False}}, {"urgency": 1, "createdAt": 1}):
+        operations.append(UpdateOne(
+            {"_id": listing["_id"]},
+            {"$set": {"expiresAt": expires_at(listing["urgency"], listing["createdAt"])}}
+        ))
+        if len(operations) >= EXPIRY_BATCH_SIZE:
+            result = await db.listings.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+
+    if operations:
+        result = await db.listings.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+
+    return updated
+
+async def _expiry_job():
+    if database.database is not None:
+        expired = await expire_listings(database.database)
+        if expired:
+            logger.info("Expired %d listings", expired)
+
+expiry_task = PeriodicTask("listing-expiry", LISTING_EXPIRY_INTERVAL_SECONDS, _expiry_job)
@@ -0,0 +1,121 @@
+"""Soft deletion of listings and the background purge of what hangs off them.
+
+Deleting a listing only stamps ``deletedAt`` on it (a tombstone) and drops
+its conversations, so the request returns immediately. Read paths skip
+tombstoned listings with ``NOT_DELETED``. A periodic worker then deletes
+the listing's messages, favorites and notifications in bounded batches, adjusting user
+stats as it goes, and removes the tombstone last. All progress lives in
+the database, so a purge interrupted by a restart simply continues on the
+next run. Every worker runs the purge task, so a run first leases the job
+(``tasks.claim_run``): two workers deleting the same batch would both
+count it down in the stats.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import database
+import user_stats
+from tasks import PeriodicTask, claim_run, release_run
+
+logger = logging.getLogger(__name__)
+
+LISTING_PURGE_INTERVAL_SECONDS = float(os.getenv("LISTING_PURGE_INTERVAL_SECONDS", "60"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+PURGE_LISTINGS_PER_RUN = int(os.getenv("PURGE_LISTINGS_PER_RUN", "20"))
+PURGE_LEASE_SECONDS = float(os.getenv("PURGE_LEASE_SECONDS", "600"))
+
+# Listings visible to read paths
+NOT_DELETED = user_stats.LIVE_LISTING
+
+async def tombstone_listing(db: AsyncIOMotorDatabase, listing: dict) -> bool:
+    """Hide a listing right away; returns False if it was already deleted"""
+    result = await db.listings.update_one(
+        {"_id": listing["_id"], **NOT_DELETED},
+        {"$set": {"deletedAt": datetime.utcnow()}}
+    )
+    if not result.modified_count:
+        return False
+    await user_stats.record_listing_removed(db, listing)
+    await db.conversations.delete_many({"listingId": listing["_id"]})
+    return True
+
+async def _purge_in_batches(
+    collection,
+    listing_id: str,
+    projection: dict,
+    record: Callable[[AsyncIOMotorDatabase, List[dict]], Awaitable[None]],
+    db: AsyncIOMotorDatabase
+) -> int:
+    purged = 0
+    while True:
+        batch = await collection.find({"listingId": listing_id}, projection).limit(PURGE_BATCH_SIZE).to_list(length=None)
+        if not batch:
+            return purged
+        # Delete before counting down: a crash in between leaves stats
+        # too high, which the periodic reconcile repairs
+        await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        await record(db, batch)
+        purged += len(batch)
+        # Let request handlers run between batches
+        await asyncio.sleep(0)
+
+async def purge_listing(db: AsyncIOMotorDatabase, listing_id: str) -> int:
+    """Delete a tombstoned listing's messages, favorites, notifications and finally itself"""
+    purged = await _purge_in_batches(
+        db.messages, listing_id,
+        {"senderId": 1, "receiverId": 1, "isRead": 1},
+        user_stats.record_messages_removed, db
+    )
+    purged += await _purge_in_batches(
+        db.favorites, listing_id,
+        {"userId": 1},
+        user_stats.record_favorites_removed, db
+    )
+    # Nothing is counted per notification, so they go in one pass
+    result = await db.notifications.delete_many({"listingId": listing_id})
+    purged += result.deleted_count
+    await db.conversations.delete_many({"listingId": listing_id})
+    await db.listings.delete_one({"_id": listing_id, "deletedAt": {"$exists": True}})
+    return purged
+
+async def purge_deleted_listings(db: AsyncIOMotorDatabase, limit: int = PURGE_LISTINGS_PER_RUN) -> int:
+    """Purge up to ``limit`` tombstoned listings, oldest first"""
+    tombstones = await db.listings.find(
+        {"deletedAt": {"$exists": True}},
+        {"_id": 1}
+    ).sort("deletedAt", 1).limit(limit).to_list(length=None)
+    for listing in tombstones:
+        purged = await purge_listing(db, listing["_id"])
+        logger.info("Purged listing %s and %d dependent documents", listing["_id"], purged)
+    return len(tombstones)
+
+async def run_purge(
+    db: AsyncIOMotorDatabase,
+    limit: int = PURGE_LISTINGS_PER_RUN,
+    lease_seconds: float = PURGE_LEASE_SECONDS
+) -> Optional[int]:
+    """Purge under the job lease until the backlog is gone or the lease is nearly up; None if leased elsewhere"""
+    token = await claim_run(db, "listing-purge", lease_seconds)
+    if token is None:
+        return None
+    deadline = time.monotonic() + lease_seconds * 0.8
+    purged = 0
+    try:
+        while True:
+            count = await purge_deleted_listings(db, limit)
+            purged += count
+            # Keep going while full runs suggest a backlog
+            if not limit or count < limit or time.monotonic() >= deadline:
+                return purged
+    finally:
+        await release_run(db, "listing-purge", token)
+
+async def _purge_job():
+    if database.database is not None:
+        await run_purge(database.database)
+
+purge_task = PeriodicTask("listing-purge", LISTING_PURGE_INTERVAL_SECONDS, _purge_job)
@@ -0,0 +1,129 @@
+"""Batched hydration of the user and listing summaries embedded in responses.
+
+Instead of a ``$lookup`` per row, a request collects the distinct ids on a
+page and fetches them with one ``$in`` query per collection, using a slim
+projection. A ``Hydrator`` is created per request (see ``get_hydrator``)
+and memoizes what it has loaded; behind it, short-lived per-worker caches
+share summaries across requests.
+"""
+import asyncio
+import os
+from typing import Dict, Iterable, List, Optional
+from fastapi import Depends
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from cache import TTLCache
+from database import get_database
+from listing_purge import NOT_DELETED
+
+# Public profile fields shown next to listings and messages; never
+# includes hashed_password, email or phone
+USER_SUMMARY_PROJECTION = {
+    "firstName": 1,
+    "lastName": 1,
+    "location": 1,
+    "rating": 1,
+    "verified": 1,
+    "avatar": 1,
+    "createdAt": 1,
+}
+
+LISTING_SUMMARY_PROJECTION = {
+    "title": 1,
+    "category": 1,
+    "location": 1,
+    "budgetMin": 1,
+    "budgetMax": 1,
+    "urgency": 1,
+    "status": 1,
+    "userId": 1,
+    "views": 1,
+    "messageCount": 1,
+    "createdAt": 1,
+}
+
+SUMMARY_CACHE_TTL_SECONDS = float(os.getenv("SUMMARY_CACHE_TTL_SECONDS", "30"))
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "20000"))
+
+user_summary_cache = TTLCache(maxsize=SUMMARY_CACHE_SIZE, ttl=SUMMARY_CACHE_TTL_SECONDS)
+listing_summary_cache = TTLCache(maxsize=SUMMARY_CACHE_SIZE, ttl=SUMMARY_CACHE_TTL_SECONDS)
+
+class BatchLoader:
+    """Load documents by id from one collection, one ``$in`` query per batch"""
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        collection: str,
+        projection: dict,
+        shared_cache: TTLCache,
+        query: Optional[dict] = None
+    ):
+        self.db = db
+        self.collection = collection
+        self.projection = projection
+        self.shared_cache = shared_cache
+        self.query = query or {}
+        self._loaded: Dict[str, Optional[dict]] = {}
+
+    async def load_many(self, ids: Iterable[str]) -> Dict[str, Optional[dict]]:
+        wanted = {id_ for id_ in ids if id_ is not None}
+        missing: List[str] = []
+        for id_ in wanted:
+            if id_ in self._loaded:
+                continue
+            cached = self.shared_cache.get(id_)
+            if cached is not None:
+                self._loaded[id_] = cached
+            else:
+                missing.append(id_)
+
+        if missing:
+            docs = await self.db[self.collection].find(
+                {"_id": {"$in": missing}, **self.query},
+                self.projection
+            ).to_list(length=None)
+            for doc in docs:
+                self._loaded[doc["_id"]] = doc
+                self.shared_cache.set(doc["_id"], doc)
+            # Remember misses for this request only
+            for id_ in missing:
+                self._loaded.setdefault(id_, None)
+
+        return {id_: self._loaded[id_] for id_ in wanted}
+
+    async def load(self, id_: str) -> Optional[dict]:
+        return (await self.load_many([id_])).get(id_)
+
+class Hydrator:
+    """Request-scoped loaders for user and listing summaries"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.users = BatchLoader(db, "users", USER_SUMMARY_PROJECTION, user_summary_cache)
+        # Tombstoned listings hydrate as missing
+        self.listings = BatchLoader(
+            db, "listings", LISTING_SUMMARY_PROJECTION, listing_summary_cache, NOT_DELETED
+        )
+
+    @staticmethod
+    async def _attach(loader: BatchLoader, docs: List[dict], id_field: str, target: str) -> List[dict]:
+        found = await loader.load_many(doc.get(id_field) for doc in docs)
+        for doc in docs:
+            doc[target] = found.get(doc.get(id_field))
+        return docs
+
+    async def attach_users(self, docs: List[dict], id_field: str = "userId", target: str = "user") -> List[dict]:
+        return await self._attach(self.users, docs, id_field, target)
+
+    async def attach_listings(self, docs: List[dict], id_field: str = "listingId", target: str = "listing") -> List[dict]:
+        return await self._attach(self.listings, docs, id_field, target)
+
+    async def attach_message_refs(self, messages: List[dict]) -> List[dict]:
+        """Attach ``sender`` and ``listing`` summaries to messages"""
+        await asyncio.gather(
+            self.attach_users(messages, "senderId", "sender"),
+            self.attach_listings(messages)
+        )
+        return messages
+
+def get_hydrator(db: AsyncIOMotorDatabase = Depends(get_database)) -> Hydrator:
+    return Hydrator(db)
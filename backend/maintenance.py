@@ -0,0 +1,211 @@
+"""One-shot maintenance jobs for denormalized fields.
+
+Run from the backend directory:
+
+    python maintenance.py
+"""
+import asyncio
+import logging
+from typing import List
+from pymongo import UpdateMany, UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import database
+from search import SEARCH_FIELDS, build_search_text
+from geo import normalize_location
+from conversations import conversation_id, snippet
+from listing_purge import run_purge
+from listing_expiry import backfill_expires_at, expire_listings
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+async def _reconcile_message_count_batch(db: AsyncIOMotorDatabase, listings: List[dict]) -> int:
+    # Counted right before the write, so messages sent meanwhile are rarely missed
+    pipeline = [
+        {"$match": {"listingId": {"$in": [listing["_id"] for listing in listings]}}},
+        {"$group": {"_id": "$listingId", "count": {"$sum": 1}}}
+    ]
+    actual = {row["_id"]: row["count"] async for row in db.messages.aggregate(pipeline)}
+    operations = [
+        UpdateOne({"_id": listing["_id"]}, {"$set": {"messageCount": actual.get(listing["_id"], 0)}})
+        for listing in listings
+        if listing.get("messageCount") != actual.get(listing["_id"], 0)
+    ]
+    if not operations:
+        return 0
+    result = await db.listings.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+async def reconcile_message_counts(db: AsyncIOMotorDatabase) -> int:
+    """Backfill listings.messageCount and repair any drift from the messages collection"""
+    repaired = 0
+    batch: List[dict] = []
+    async for listing in db.listings.find({}, {"messageCount": 1}):
+        batch.append(listing)
+        if len(batch) >= BATCH_SIZE:
+            repaired += await _reconcile_message_count_batch(db, batch)
+            batch = []
+
+    if batch:
+        repaired += await _reconcile_message_count_batch(db, batch)
+
+    return repaired
+
+async def backfill_search_text(db: AsyncIOMotorDatabase, missing_only: bool = False) -> int:
+    """Recompute listings.searchText, e.g. after the tokenizer changes"""
+    updated = 0
+    operations = []
+    projection = {field: 1 for field in SEARCH_FIELDS}
+    projection["searchText"] = 1
+    query = {"searchText": {"$exists": False}} if missing_only else {}
+    async for listing in db.listings.find(query, projection):
+        search_text = build_search_text(listing)
+        if listing.get("searchText") != search_text:
+            operations.append(UpdateOne(
+                {"_id": listing["_id"]},
+                {"$set": {"searchText": search_text}}
+            ))
+        if len(operations) >= BATCH_SIZE:
+            result = await db.listings.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+
+    if operations:
+        result = await db.listings.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+
+    return updated
+
+async def normalize_listing_locations(db: AsyncIOMotorDatabase, missing_only: bool = False) -> int:
+    """Recompute listings' city, district and geo, e.g. after the gazetteer changes"""
+    updated = 0
+    operations = []
+    query = {"geo": {"$exists": False}} if missing_only else {}
+    async for listing in db.listings.find(query, {"location": 1, "city": 1, "district": 1, "geo": 1}):
+        fields = normalize_location(listing.get("location"))
+        if any(listing.get(field, ...) != value for field, value in fields.items()):
+            operations.append(UpdateOne({"_id": listing["_id"]}, {"$set": fields}))
+        if len(operations) >= BATCH_SIZE:
+            result = await db.listings.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+
+    if operations:
+        result = await db.listings.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+
+    return updated
+
+async def _write_conversations(db: AsyncIOMotorDatabase, conversations: list, messages: list) -> int:
+    # Rows first, so an interrupted run never leaves messages tagged with a missing conversation
+    await db.conversations.bulk_write(conversations, ordered=False)
+    await db.messages.bulk_write(messages, ordered=False)
+    return len(conversations)
+
+async def rebuild_conversations(db: AsyncIOMotorDatabase, missing_only: bool = False) -> int:
+    """Rebuild the conversations collection and messages.conversationId from messages.
+
+    With ``missing_only``, only messages without a conversationId are read,
+    and they are merged into their conversation instead of replacing it, so
+    messages sent meanwhile keep their place as the thread's last message
+    and in the unread counter.
+    """
+    pipeline = [
+        {"$sort": {"createdAt": 1}},
+        {
+            "$group": {
+                "_id": {
+                    "listingId": "$listingId",
+                    "buyerId": "$receiverId",
+                    "sellerId": "$senderId"
+                },
+                "last": {"$last": "$$ROOT"},
+                "first": {"$first": "$createdAt"},
+                "unread": {"$sum": {"$cond": ["$isRead", 0, 1]}}
+            }
+        }
+    ]
+    untagged = {"conversationId": {"$exists": False}} if missing_only else {}
+    if missing_only:
+        pipeline.insert(0, {"$match": untagged})
+
+    titles = {}
+    rebuilt = 0
+    conversations = []
+    messages = []
+    async for group in db.messages.aggregate(pipeline, allowDiskUse=True):
+        key = group["_id"]
+        conversation = conversation_id(key["listingId"], key["buyerId"], key["sellerId"])
+        if key["listingId"] not in titles:
+            listing = await db.listings.find_one({"_id": key["listingId"]}, {"title": 1})
+            titles[key["listingId"]] = listing.get("title") if listing else None
+
+        last = group["last"]
+        fields = {
+            "listingId": key["listingId"],
+            "listingTitle": titles[key["listingId"]],
+            "buyerId": key["buyerId"],
+            "sellerId": key["sellerId"],
+            "participants": [key["buyerId"], key["sellerId"]],
+            "lastMessage": {
+                "_id": last["_id"],
+                "senderId": last["senderId"],
+                "content": snippet(last["content"]),
+                "createdAt": last["createdAt"],
+            },
+            "lastMessageAt": last["createdAt"],
+        }
+        if missing_only:
+            # Untagged messages predate any the send path recorded here
+            update = {
+                "$setOnInsert": {**fields, f"unread.{key['sellerId']}": 0},
+                "$inc": {f"unread.{key['buyerId']}": group["unread"]},
+                "$min": {"createdAt": group["first"]},
+            }
+        else:
+            update = {"$set": {
+                **fields,
+                "unread": {key["buyerId"]: group["unread"], key["sellerId"]: 0},
+                "createdAt": group["first"],
+            }}
+        conversations.append(UpdateOne({"_id": conversation}, update, upsert=True))
+        messages.append(UpdateMany(
+            {"listingId": key["listingId"], "receiverId": key["buyerId"], "senderId": key["sellerId"], **untagged},
+            {"$set": {"conversationId": conversation}}
+        ))
+        if len(conversations) >= BATCH_SIZE:
+            rebuilt += await _write_conversations(db, conversations, messages)
+            conversations, messages = [], []
+
+    if conversations:
+        rebuilt += await _write_conversations(db, conversations, messages)
+
+    return rebuilt
+
+async def main():
+    await database.connect_to_mongo()
+    try:
+        repaired = await reconcile_message_counts(database.database)
+        logger.info("Reconciled messageCount on %d listings", repaired)
+        updated = await backfill_search_text(database.database)
+        logger.info("Rebuilt searchText on %d listings", updated)
+        normalized = await normalize_listing_locations(database.database)
+        logger.info("Normalized locations on %d listings", normalized)
+        rebuilt = await rebuild_conversations(database.database)
+        logger.info("Rebuilt %d conversations", rebuilt)
+        backfilled = await backfill_expires_at(database.database)
+        logger.info("Set expiresAt on %d listings", backfilled)
+        expired = await expire_listings(database.database, max_batches=0)
+        logger.info("Expired %d listings", expired)
+        purged = await run_purge(database.database, limit=0, lease_seconds=24 * 3600)
+        if purged is None:
+            logger.info("Skipped the purge; a worker is running it")
+        else:
+            logger.info("Purged %d deleted listings", purged)
+    finally:
+        await database.close_mongo_connection()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
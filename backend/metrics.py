@@ -0,0 +1,191 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+Metrics are per worker, like the caches; a scraper should hit every
+worker (or aggregate by instance). Observations may come from pymongo's
+monitoring threads as well as the event loop, so series updates take a
+lock.
+
+``current_route`` carries the route template of the request being
+served. The ``bind_route`` app dependency sets it, and Motor copies the
+context into its executor threads, so database metrics can be broken
+down by the route that issued the command. Background tasks label
+themselves ``task:<name>``.
+"""
+import threading
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+from fastapi import Request
+
+current_route: ContextVar[str] = ContextVar("current_route", default="-")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 500, 1000, 5000)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, label_names, label_values, value in self.samples():
+            lines.append(f"{name}{_format_labels(label_names, label_values)} {_format_number(value)}")
+        return lines
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, self.labels, label_values, value
+
+class Gauge(Metric):
+    """A settable gauge, or one read from ``fn`` at render time"""
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        fn: Callable[[], Dict[tuple, float]] = None
+    ):
+        super().__init__(name, help, labels)
+        self.fn = fn
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def series(self) -> Dict[tuple, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        if self.fn is not None:
+            items = list(self.fn().items())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, self.labels, label_values, value
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[tuple, List[float]] = {}
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def snapshot(self, *label_values) -> dict:
+        """Count and sum of one series (for health checks and tests)"""
+        series = self._series.get(label_values)
+        if series is None:
+            return {"count": 0, "sum": 0.0}
+        return {"count": sum(series[:-1]), "sum": series[-1]}
+
+    def samples(self):
+        with self._lock:
+            items = [(label_values, list(series)) for label_values, series in self._series.items()]
+        bucket_labels = self.labels + ("le",)
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", bucket_labels, label_values + (_format_number(bound),), cumulative
+            yield f"{self.name}_sum", self.labels, label_values, series[-1]
+            yield f"{self.name}_count", self.labels, label_values, cumulative
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), fn=None) -> Gauge:
+        return self.register(Gauge(name, help, labels, fn))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+async def bind_route(request: Request):
+    """App dependency labelling everything a request does with its route template"""
+    route = request.scope.get("route")
+    current_route.set(getattr(route, "path", "-"))
@@ -0,0 +1,175 @@
+"""One-off schema migrations and data backfills, applied once per database.
+
+Each entry in ``MIGRATIONS`` runs at most once, in order, at startup, and
+is recorded in the ``migrations`` collection. A worker claims a migration by
+inserting its record, so when several workers start together only one
+runs it. The others stop at the first migration that is still running
+elsewhere and pick up the remainder on their next start. A migration
+that raises gives up its claim and is retried next time, so migrations
+must be safe to re-run. A worker killed mid-migration leaves its record
+``running``; delete the record to have it retried.
+
+Everything in ``MIGRATIONS`` runs before the worker starts serving, so
+it is limited to index and schema steps. Data rewrites that scale with a
+collection go in ``BACKFILLS``. ``backfill_task`` runs those in the
+background once the worker is serving. Each backfill runs under a job
+lease (``tasks.claim_run``) and is recorded in ``migrations`` when it is
+done. Backfills must be batched and resumable: a lease that lapses mid-run
+lets another worker pick the work up where it stopped.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, List, Tuple
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import database
+from listing_expiry import backfill_expires_at
+from maintenance import (
+    backfill_search_text,
+    normalize_listing_locations,
+    rebuild_conversations,
+    reconcile_message_counts
+)
+from trending import backfill_trending_score
+from tasks import PeriodicTask, claim_run, release_run
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_INTERVAL_SECONDS = float(os.getenv("BACKFILL_INTERVAL_SECONDS", "300"))
+BACKFILL_LEASE_SECONDS = float(os.getenv("BACKFILL_LEASE_SECONDS", "3600"))
+
+async def _drop_indexes(collection, names) -> int:
+    dropped = 0
+    for name in names:
+        try:
+            await collection.drop_index(name)
+            dropped += 1
+        except OperationFailure:
+            # Never created, or already dropped
+            pass
+    return dropped
+
+async def drop_full_history_feed_indexes(db: AsyncIOMotorDatabase) -> int:
+    """The feed reads active listings only; the partial indexes replace these"""
+    return await _drop_indexes(db.listings, (
+        "category_1_createdAt_-1",
+        "status_1_createdAt_-1",
+        "createdAt_1",
+        "status_1_messageCount_-1_createdAt_-1",
+    ))
+
+async def drop_keyset_indexes_without_id(db: AsyncIOMotorDatabase) -> int:
+    """Superseded by the ``_id``-suffixed indexes keyset pagination sorts on"""
+    dropped = await _drop_indexes(db.listings, ("userId_1_createdAt_-1",))
+    dropped += await _drop_indexes(db.messages, (
+        "senderId_1_createdAt_-1",
+        "receiverId_1_createdAt_-1",
+        "conversationId_1_createdAt_1",
+    ))
+    dropped += await _drop_indexes(db.favorites, ("userId_1_createdAt_-1",))
+    return dropped
+
+async def drop_feed_indexes_without_budget(db: AsyncIOMotorDatabase) -> int:
+    """Superseded by the newest-first feed indexes that end in the budget bounds"""
+    return await _drop_indexes(db.listings, ("active_createdAt", "active_category_createdAt"))
+
+async def backfill_listing_locations(db: AsyncIOMotorDatabase) -> int:
+    """Set city, district and geo on listings created before location normalization"""
+    return await normalize_listing_locations(db, missing_only=True)
+
+async def backfill_listing_search_text(db: AsyncIOMotorDatabase) -> int:
+    """Set searchText on listings created before the text index, which search reads exclusively"""
+    return await backfill_search_text(db, missing_only=True)
+
+async def backfill_conversations(db: AsyncIOMotorDatabase) -> int:
+    """Thread messages sent before conversations into the inbox"""
+    return await rebuild_conversations(db, missing_only=True)
+
+Step = Tuple[str, Callable[[AsyncIOMotorDatabase], Awaitable[object]]]
+
+# Ids are shared by both lists and recorded in the same collection;
+# append only, never reorder or rename
+
+# (id, migration), run at startup
+MIGRATIONS: List[Step] = [
+    ("0001_drop_full_history_feed_indexes", drop_full_history_feed_indexes),
+    ("0003_drop_keyset_indexes_without_id", drop_keyset_indexes_without_id),
+    ("0004_drop_feed_indexes_without_budget", drop_feed_indexes_without_budget),
+]
+
+# (id, backfill), run in the background
+BACKFILLS: List[Step] = [
+    ("0002_backfill_listing_expires_at", backfill_expires_at),
+    ("0005_backfill_listing_locations", backfill_listing_locations),
+    ("0006_backfill_trending_score", backfill_trending_score),
+    ("0007_backfill_search_text", backfill_listing_search_text),
+    ("0008_backfill_conversations", backfill_conversations),
+    ("0009_backfill_message_counts", reconcile_message_counts),
+]
+
+async def run_migrations(db: AsyncIOMotorDatabase) -> List[str]:
+    """Apply pending migrations in order; returns the ids applied by this call"""
+    applied = []
+    for migration_id, migrate in MIGRATIONS:
+        try:
+            await db.migrations.insert_one({"_id": migration_id, "state": "running", "startedAt": datetime.utcnow()})
+        except DuplicateKeyError:
+            record = await db.migrations.find_one({"_id": migration_id}, {"state": 1})
+            if record is not None and record["state"] == "done":
+                continue
+            # Running in another worker; later migrations may depend on it
+            logger.info("Migration %s is running elsewhere, deferring the rest", migration_id)
+            break
+
+        logger.info("Applying migration %s", migration_id)
+        try:
+            result = await migrate(db)
+        except Exception:
+            await db.migrations.delete_one({"_id": migration_id})
+            raise
+        await db.migrations.update_one(
+            {"_id": migration_id},
+            {"$set": {"state": "done", "finishedAt": datetime.utcnow(), "result": result}}
+        )
+        applied.append(migration_id)
+    return applied
+
+async def run_backfills(db: AsyncIOMotorDatabase) -> Tuple[List[str], bool]:
+    """Run pending backfills in order; returns the ids finished by this call and whether none remain"""
+    done = set(await db.migrations.distinct("_id", {"_id": {"$in": [id_ for id_, _ in BACKFILLS]}, "state": "done"}))
+    finished = []
+    for backfill_id, backfill in BACKFILLS:
+        if backfill_id in done:
+            continue
+        token = await claim_run(db, f"backfill:{backfill_id}", BACKFILL_LEASE_SECONDS)
+        if token is None:
+            # Running in another worker; later backfills may depend on it
+            return finished, False
+
+        logger.info("Running backfill %s", backfill_id)
+        started = datetime.utcnow()
+        try:
+            result = await backfill(db)
+        finally:
+            await release_run(db, f"backfill:{backfill_id}", token)
+        await db.migrations.update_one(
+            {"_id": backfill_id},
+            {"$set": {"state": "done", "startedAt": started, "finishedAt": datetime.utcnow(), "result": result}},
+            upsert=True
+        )
+        finished.append(backfill_id)
+    return finished, True
+
+# Set once every backfill is recorded done, after which the task idles
+_backfills_complete = False
+
+async def _backfill_job():
+    global _backfills_complete
+    if _backfills_complete or database.database is None:
+        return
+    finished, _backfills_complete = await run_backfills(database.database)
+    if finished:
+        logger.info("Finished backfills: %s", ", ".join(finished))
+
+backfill_task = PeriodicTask("backfills", BACKFILL_INTERVAL_SECONDS, _backfill_job)
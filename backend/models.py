@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 from enum import Enum
 import uuid
@@ -87,6 +87,8 @@ class ListingResponse(ListingBase):
     userId: str
     views: int = 0
     messageCount: int = 0
+    city: Optional[str] = None
+    district: Optional[str] = None
     createdAt: datetime
     updatedAt: datetime
     user: Optional[dict] = None
@@ -94,13 +96,53 @@ class ListingResponse(ListingBase):
     class Config:
         populate_by_name = True
 
+class ListingPartialResponse(BaseModel):
+    """Listing as returned by list endpoints, which may project a subset of fields"""
+    id: str = Field(alias="_id")
+    title: Optional[str] = None
+    description: Optional[str] = None
+    category: Optional[Category] = None
+    location: Optional[str] = None
+    budgetMin: Optional[float] = None
+    budgetMax: Optional[float] = None
+    urgency: Optional[UrgencyLevel] = None
+    status: Optional[ListingStatus] = None
+    userId: Optional[str] = None
+    views: Optional[int] = None
+    messageCount: Optional[int] = None
+    city: Optional[str] = None
+    district: Optional[str] = None
+    createdAt: Optional[datetime] = None
+    updatedAt: Optional[datetime] = None
+    user: Optional[dict] = None
+
+    class Config:
+        populate_by_name = True
+
+class ListingFacetsResponse(BaseModel):
+    total: int
+    categories: Dict[str, int]
+    urgency: Dict[str, int]
+
 # Message Models
 class MessageCreate(BaseModel):
     content: str
     listingId: str
 
+class MessageBulkRead(BaseModel):
+    """Either a thread (listingId + counterpartId) or explicit messageIds"""
+    listingId: Optional[str] = None
+    counterpartId: Optional[str] = None
+    messageIds: Optional[List[str]] = Field(None, max_length=500)
+
+class MessageBulkReadResponse(BaseModel):
+    modifiedCount: int
+    unreadCount: int
+    conversationUnread: Dict[str, int] = {}
+
 class MessageResponse(BaseModel):
     id: str = Field(alias="_id")
+    conversationId: Optional[str] = None
     listingId: str
     senderId: str
     receiverId: str
@@ -113,6 +155,22 @@ class MessageResponse(BaseModel):
     class Config:
         populate_by_name = True
 
+# Conversation Models
+class ConversationResponse(BaseModel):
+    id: str = Field(alias="_id")
+    listingId: str
+    listingTitle: Optional[str] = None
+    buyerId: str
+    sellerId: str
+    counterpartId: Optional[str] = None
+    lastMessage: Optional[dict] = None
+    lastMessageAt: datetime
+    unreadCount: int = 0
+    createdAt: datetime
+
+    class Config:
+        populate_by_name = True
+
 # Favorite Models
 class FavoriteResponse(BaseModel):
     id: str = Field(alias="_id")
@@ -124,6 +182,49 @@ class FavoriteResponse(BaseModel):
     class Config:
         populate_by_name = True
 
+# Saved Search Models
+class SavedSearchCreate(BaseModel):
+    name: Optional[str] = Field(None, max_length=100)
+    category: Optional[Category] = None
+    urgency: Optional[UrgencyLevel] = None
+    keywords: Optional[str] = Field(None, max_length=200)
+    city: Optional[str] = None
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lng: Optional[float] = Field(None, ge=-180, le=180)
+    radiusKm: Optional[float] = Field(None, gt=0)
+    budgetMin: Optional[float] = Field(None, ge=0)
+    budgetMax: Optional[float] = Field(None, ge=0)
+
+class SavedSearchResponse(SavedSearchCreate):
+    id: str = Field(alias="_id")
+    userId: str
+    createdAt: datetime
+
+    class Config:
+        populate_by_name = True
+
+# Notification Models
+class NotificationResponse(BaseModel):
+    id: str = Field(alias="_id")
+    userId: str
+    type: str
+    listingId: str
+    savedSearchIds: List[str] = []
+    isRead: bool = False
+    createdAt: datetime
+    listing: Optional[dict] = None
+
+    class Config:
+        populate_by_name = True
+
+class NotificationBulkRead(BaseModel):
+    """Explicit notificationIds, or all of the user's notifications when omitted"""
+    notificationIds: Optional[List[str]] = Field(None, max_length=500)
+
+class NotificationBulkReadResponse(BaseModel):
+    modifiedCount: int
+    unreadCount: int
+
 # Token Models
 class Token(BaseModel):
     access_token: str
@@ -162,14 +263,23 @@ class ListingInDB(BaseModel):
     status: ListingStatus = ListingStatus.ACTIVE
     userId: str
     views: int = 0
+    messageCount: int = 0
+    # Normalized from location by geo.normalize_location
+    city: Optional[str] = None
+    district: Optional[str] = None
+    geo: Optional[dict] = None
+    # Decayed recent activity, maintained by trending.py
+    trendingScore: float = 0.0
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
+    expiresAt: Optional[datetime] = None
 
     class Config:
         populate_by_name = True
 
 class MessageInDB(BaseModel):
     id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
+    conversationId: Optional[str] = None
     listingId: str
     senderId: str
     receiverId: str
@@ -180,6 +290,29 @@ class MessageInDB(BaseModel):
     class Config:
         populate_by_name = True
 
+class SavedSearchInDB(SavedSearchCreate):
+    id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
+    userId: str
+    # Keyword search terms and the radius centre, as the matcher reads them
+    terms: List[str] = []
+    center: Optional[List[float]] = None
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        populate_by_name = True
+
+class NotificationInDB(BaseModel):
+    id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
+    userId: str
+    type: str = "listing.match"
+    listingId: str
+    savedSearchIds: List[str] = []
+    isRead: bool = False
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        populate_by_name = True
+
 class FavoriteInDB(BaseModel):
     id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
     userId: str
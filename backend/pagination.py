@@ -0,0 +1,97 @@
+"""Keyset (cursor) pagination helpers.
+
+A cursor is an opaque, URL-safe token holding the sort-key values and
+``_id`` of the last document on a page. The next page is fetched with a
+range predicate on those values, so page N costs the same index walk as
+page 1 instead of skipping over every earlier document.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from fastapi import HTTPException, Response, status
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+SortSpec = List[Tuple[str, int]]
+
+def keyset_sort(sort: SortSpec) -> SortSpec:
+    """Append _id as a unique tiebreaker so the sort order is total"""
+    if sort and sort[-1][0] == "_id":
+        return list(sort)
+    return list(sort) + [("_id", sort[-1][1] if sort else -1)]
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if set(value) != {"$date"}:
+            raise ValueError("Unsupported cursor value")
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+def encode_cursor(doc: dict, sort: SortSpec) -> str:
+    values = [_encode_value(doc.get(field)) for field, _ in sort]
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: SortSpec) -> list:
+    """Decode a cursor produced for the same sort; raises ValueError otherwise"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Malformed cursor") from exc
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise ValueError("Cursor does not match sort order")
+    return [_decode_value(value) for value in values]
+
+def parse_cursor(cursor: Optional[str], sort: SortSpec) -> Optional[list]:
+    """Decode the cursor query parameter, turning bad input into a 400"""
+    if not cursor:
+        return None
+    try:
+        return decode_cursor(cursor, sort)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def keyset_filter(sort: SortSpec, values: list) -> dict:
+    """Match documents strictly after ``values`` in ``sort`` order"""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {sort[j][0]: values[j] for j in range(i)}
+        clause[field] = {"$lt" if direction < 0 else "$gt": values[i]}
+        clauses.append(clause)
+
+    # Bound the leading key as well so the index scan starts at the cursor
+    leading_field, leading_direction = sort[0]
+    bound = {"$lte" if leading_direction < 0 else "$gte": values[0]}
+    return {"$and": [{leading_field: bound}, {"$or": clauses}]}
+
+def apply_cursor(query: dict, sort: SortSpec, values: Optional[list]) -> dict:
+    if values is None:
+        return query
+    return {"$and": [query, keyset_filter(sort, values)]}
+
+def next_cursor(docs: List[dict], limit: int, sort: SortSpec) -> Optional[str]:
+    """Cursor for the following page, or None on the last page"""
+    if len(docs) < limit or not docs:
+        return None
+    return encode_cursor(docs[-1], sort)
+
+def cursor_headers(cursor: Optional[str]) -> Optional[dict]:
+    """Headers carrying ``cursor`` for handlers that build their own Response"""
+    return {NEXT_CURSOR_HEADER: cursor} if cursor else None
+
+def set_next_cursor(response: Response, docs: List[dict], limit: int, sort: SortSpec) -> Optional[str]:
+    """Expose the cursor for the following page, if there may be one"""
+    cursor = next_cursor(docs, limit, sort)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+    return cursor
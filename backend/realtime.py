@@ -0,0 +1,211 @@
+"""Per-process pub/sub for pushing message events to connected clients.
+
+Handlers publish events addressed to user ids; every API worker keeps the
+subscriptions of its own open streams and delivers the events addressed
+to them. How an event gets from the publishing worker to all the others
+is up to the backend, chosen with ``PUBSUB_BACKEND``:
+
+* ``local``: delivery stays in this process. Enough for a single worker
+  and for tests.
+* ``mongo``: events are appended to a capped collection that every worker
+  tails, so no extra infrastructure is needed to fan out across workers.
+
+Delivery is best-effort. Clients reconcile through the REST endpoints
+after reconnecting or when they receive a ``resync`` event.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+import database
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "local")
+PUBSUB_COLLECTION = os.getenv("PUBSUB_COLLECTION", "realtime_events")
+PUBSUB_COLLECTION_BYTES = int(os.getenv("PUBSUB_COLLECTION_BYTES", str(16 * 1024 * 1024)))
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SUBSCRIBER_QUEUE_SIZE", "100"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+# Event types
+MESSAGE_NEW = "message.new"
+MESSAGE_READ = "message.read"
+LISTING_MATCH = "listing.match"
+RESYNC = "resync"
+
+class Event:
+    """An event with its JSON payload already encoded, shared by every recipient"""
+    __slots__ = ("type", "data")
+
+    def __init__(self, type: str, data: str):
+        self.type = type
+        self.data = data
+
+class Subscription:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[Optional[Event]]" = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+        self.closed = False
+
+    def offer(self, event: Event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client that can't keep up gets told to refetch instead
+            self.overflowed = True
+
+    def close(self):
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[Event]:
+        """Next event, ``RESYNC`` after an overflow, or None on timeout or close"""
+        if self.closed:
+            return None
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return Event(RESYNC, "{}")
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class LocalBackend:
+    """Deliver straight to this process's subscribers"""
+
+    def __init__(self, hub: "Hub"):
+        self.hub = hub
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, user_ids: List[str], event: Event):
+        self.hub.deliver(user_ids, event)
+
+class MongoBackend:
+    """Fan out through a capped collection tailed by every worker"""
+
+    def __init__(self, hub: "Hub", collection: str = PUBSUB_COLLECTION, size: int = PUBSUB_COLLECTION_BYTES):
+        self.hub = hub
+        self.collection_name = collection
+        self.size = size
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        return database.database[self.collection_name]
+
+    async def start(self):
+        try:
+            await database.database.create_collection(self.collection_name, capped=True, size=self.size)
+        except CollectionInvalid:
+            pass
+        # Only events published from now on are of interest
+        latest = await self.collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        self._task = asyncio.create_task(
+            self._tail(latest["_id"] if latest else None),
+            name="pubsub-tail"
+        )
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, user_ids: List[str], event: Event):
+        await self.collection.insert_one({
+            "users": user_ids,
+            "type": event.type,
+            "data": event.data,
+            "createdAt": datetime.utcnow(),
+        })
+
+    async def _tail(self, last_id):
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                while cursor.alive:
+                    async for doc in cursor:
+                        last_id = doc["_id"]
+                        self.hub.deliver(doc["users"], Event(doc["type"], doc["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Tailing %s failed, retrying", self.collection_name)
+            # The cursor dies when the collection is empty or was dropped
+            await asyncio.sleep(1)
+
+def sse_message(event: Event) -> bytes:
+    """Encode an event in the text/event-stream format"""
+    return f"event: {event.type}\ndata: {event.data}\n\n".encode()
+
+BACKENDS = {
+    "local": LocalBackend,
+    "mongo": MongoBackend,
+}
+
+class Hub:
+    def __init__(self, backend: str = PUBSUB_BACKEND):
+        self._subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+        self.backend = BACKENDS[backend](self)
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id)
+        self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscriptions.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscriptions[subscription.user_id]
+
+    def deliver(self, user_ids: Iterable[str], event: Event):
+        for user_id in user_ids:
+            for subscription in self._subscriptions.get(user_id, ()):
+                subscription.offer(event)
+
+    async def publish(self, user_ids: Iterable[str], type: str, data: str):
+        """Send an event to every stream of ``user_ids``; never raises"""
+        try:
+            await self.backend.publish(list(dict.fromkeys(user_ids)), Event(type, data))
+        except Exception:
+            logger.exception("Publishing %s failed", type)
+
+    async def start(self):
+        await self.backend.start()
+
+    async def stop(self):
+        await self.backend.stop()
+        # Ends open streams
+        for subscribers in list(self._subscriptions.values()):
+            for subscription in list(subscribers):
+                subscription.close()
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "users": len(self._subscriptions),
+            "streams": sum(len(subscribers) for subscribers in self._subscriptions.values()),
+        }
+
+hub = Hub()
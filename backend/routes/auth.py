@@ -6,7 +6,7 @@ from models import UserCreate, UserLogin, UserResponse, Token, UserInDB
 from auth import (
     authenticate_user, 
     create_access_token, 
-    get_password_hash, 
+    get_password_hash_async, 
     get_current_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
@@ -27,7 +27,7 @@ async def register_user(
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     user_in_db = UserInDB(
         firstName=user.firstName,
         lastName=user.lastName,
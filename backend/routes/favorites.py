@@ -1,56 +1,58 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List
+from typing import List, Optional, Tuple
 from database import get_database
 from models import FavoriteResponse, FavoriteInDB, UserInDB
 from auth import get_current_user
+from loaders import Hydrator, get_hydrator
+from listing_purge import NOT_DELETED
+import user_stats
+from trending import record_activity
+from pagination import SortSpec, keyset_sort, parse_cursor, apply_cursor, next_cursor, cursor_headers
+from serialization import favorite_serializer
 
 router = APIRouter(prefix="/favorites", tags=["favorites"])
 
+def favorites_pipeline(user_id: str, skip: int, limit: int, cursor: Optional[str]) -> Tuple[List[dict], SortSpec]:
+    """The user's favorites, most recently added first"""
+    sort = keyset_sort([("createdAt", -1)])
+    after = parse_cursor(cursor, sort)
+    pipeline = [
+        {"$match": apply_cursor({"userId": user_id}, sort, after)},
+        {"$sort": dict(sort)},
+        {"$skip": skip if after is None else 0},
+        {"$limit": limit}
+    ]
+    return pipeline, sort
+
 @router.get("", response_model=List[FavoriteResponse])
 async def get_user_favorites(
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = None,
     current_user: UserInDB = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
     # Get favorites with listing data
-    pipeline = [
-        {"$match": {"userId": current_user.id}},
-        {"$sort": {"createdAt": -1}},
-        {"$skip": skip},
-        {"$limit": limit},
-        {
-            "$lookup": {
-                "from": "listings",
-                "localField": "listingId",
-                "foreignField": "_id",
-                "as": "listing"
-            }
-        },
-        {
-            "$addFields": {
-                "listing": {"$arrayElemAt": ["$listing", 0]}
-            }
-        },
-        {
-            "$match": {
-                "listing": {"$ne": None}  # Only return favorites where listing still exists
-            }
-        }
-    ]
-    
+    pipeline, sort = favorites_pipeline(current_user.id, skip, limit, cursor)
     favorites = await db.favorites.aggregate(pipeline).to_list(length=None)
-    return [FavoriteResponse(**favorite) for favorite in favorites]
+    await hydrator.attach_listings(favorites)
+    # Page boundaries come from the unfiltered page so dropped rows don't end the feed early
+    headers = cursor_headers(next_cursor(favorites, limit, sort))
+    
+    # Only return favorites where listing still exists
+    return favorite_serializer.response([favorite for favorite in favorites if favorite.get("listing")], headers)
 
 @router.post("/{listing_id}", response_model=FavoriteResponse)
 async def add_to_favorites(
     listing_id: str,
     current_user: UserInDB = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
     # Check if listing exists
-    listing = await db.listings.find_one({"_id": listing_id})
+    listing = await db.listings.find_one({"_id": listing_id, **NOT_DELETED})
     if not listing:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -83,28 +85,14 @@ async def add_to_favorites(
     )
     
     # Insert favorite
-    result = await db.favorites.insert_one(favorite_in_db.dict(by_alias=True))
-    
-    # Get created favorite with listing data
-    pipeline = [
-        {"$match": {"_id": result.inserted_id}},
-        {
-            "$lookup": {
-                "from": "listings",
-                "localField": "listingId",
-                "foreignField": "_id",
-                "as": "listing"
-            }
-        },
-        {
-            "$addFields": {
-                "listing": {"$arrayElemAt": ["$listing", 0]}
-            }
-        }
-    ]
+    favorite_doc = favorite_in_db.dict(by_alias=True)
+    await db.favorites.insert_one(favorite_doc)
+    await user_stats.increment(db, current_user.id, favoritesCount=1)
+    await record_activity(db, listing_id, favorites=1)
     
-    created_favorite = await db.favorites.aggregate(pipeline).next()
-    return FavoriteResponse(**created_favorite)
+    # Return the created favorite with listing data
+    await hydrator.attach_listings([favorite_doc])
+    return favorite_serializer.response(favorite_doc)
 
 @router.delete("/{listing_id}")
 async def remove_from_favorites(
@@ -125,10 +113,12 @@ async def remove_from_favorites(
         )
     
     # Delete favorite
-    await db.favorites.delete_one({
+    result = await db.favorites.delete_one({
         "userId": current_user.id,
         "listingId": listing_id
     })
+    if result.deleted_count:
+        await user_stats.increment(db, current_user.id, favoritesCount=-1)
     
     return {"message": "Removed from favorites successfully"}
 
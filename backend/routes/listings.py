@@ -1,35 +1,85 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from database import get_database
 from models import (
     ListingCreate, 
     ListingUpdate, 
     ListingResponse, 
+    ListingPartialResponse,
     ListingInDB, 
+    ListingFacetsResponse,
     UserInDB,
     Category,
     UrgencyLevel,
     ListingStatus
 )
 from auth import get_current_user, get_current_user_optional
+from pagination import (
+    SortSpec,
+    keyset_sort,
+    parse_cursor,
+    apply_cursor,
+    keyset_filter,
+    next_cursor,
+    cursor_headers
+)
+from cache import feed_cache, feed_cache_tags, feed_page_tags
+from search import SEARCH_FIELDS, build_search_text, build_search_query
+from view_buffer import view_buffer
+from listing_purge import NOT_DELETED, tombstone_listing, purge_task
+from listing_expiry import expires_at
+from facets import facet_counts
+from saved_searches import saved_search_matcher
+from geo import MAX_RADIUS_KM, normalize_location, build_location_query
+from loaders import Hydrator, get_hydrator, listing_summary_cache
+from serialization import listing_serializer, listing_page_serializer
+from fieldsets import (
+    LISTING_VIEW_PATTERN,
+    parse_listing_fields,
+    resolve_listing_fields,
+    listing_projection,
+    wants_user,
+    trim_to_fields
+)
+import user_stats
 from datetime import datetime
-import re
 
 router = APIRouter(prefix="/listings", tags=["listings"])
 
-@router.get("", response_model=List[ListingResponse])
-async def get_listings(
-    skip: int = Query(0, ge=0),
-    limit: int = Query(20, ge=1, le=50),
-    category: Optional[Category] = None,
-    urgency: Optional[UrgencyLevel] = None,
-    search: Optional[str] = None,
-    sort_by: str = Query("newest", regex="^(newest|oldest|most_viewed|most_messages)$"),
-    db: AsyncIOMotorDatabase = Depends(get_database)
-):
+def build_budget_query(budget_min: Optional[float], budget_max: Optional[float]) -> dict:
+    """Filter for listings whose budget range overlaps [budget_min, budget_max].
+
+    A listing has to state the bound being compared: one without
+    ``budgetMax`` never matches a ``budget_min`` filter.
+    """
+    if budget_min is not None and budget_max is not None and budget_min > budget_max:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="budget_min must not exceed budget_max"
+        )
+    query = {}
+    if budget_min is not None:
+        query["budgetMax"] = {"$gte": budget_min}
+    if budget_max is not None:
+        query["budgetMin"] = {"$lte": budget_max}
+    return query
+
+def feed_pipeline(
+    skip: int,
+    limit: int,
+    category: Optional[Category],
+    urgency: Optional[UrgencyLevel],
+    text_query: Optional[dict],
+    sort_by: str,
+    cursor: Optional[str],
+    view: str = "summary",
+    fields: Optional[Tuple[str, ...]] = None,
+    filters: Optional[dict] = None
+) -> Tuple[List[dict], SortSpec]:
+    """Build the feed pipeline; returns it with the sort used for cursors"""
     # Build query
-    query = {"status": ListingStatus.ACTIVE}
+    query = {"status": ListingStatus.ACTIVE, **NOT_DELETED}
     
     if category:
         query["category"] = category
@@ -37,159 +87,190 @@ async def get_listings(
     if urgency:
         query["urgency"] = urgency
     
-    if search:
-        query["$or"] = [
-            {"title": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}},
-            {"location": {"$regex": search, "$options": "i"}}
-        ]
+    # Location and budget filters
+    if filters:
+        query.update(filters)
+    
+    # Full-text search goes through the listing_search text index
+    if text_query:
+        query.update(text_query)
     
     # Build sort
     sort_mapping = {
         "newest": [("createdAt", -1)],
         "oldest": [("createdAt", 1)],
         "most_viewed": [("views", -1), ("createdAt", -1)],
-        "most_messages": [("messageCount", -1), ("createdAt", -1)]
+        "most_messages": [("messageCount", -1), ("createdAt", -1)],
+        "trending": [("trendingScore", -1), ("createdAt", -1)],
+        "relevance": [("score", -1)]
     }
-    sort = sort_mapping.get(sort_by, [("createdAt", -1)])
+    sort = keyset_sort(sort_mapping.get(sort_by, [("createdAt", -1)]))
+    after = parse_cursor(cursor, sort)
     
-    # Execute query with user data
-    pipeline = [
-        {"$match": query},
+    # A cursor replaces skip
+    pipeline = [{"$match": query}]
+    if text_query:
+        pipeline.append({"$addFields": {"score": {"$meta": "textScore"}}})
+    if after is not None:
+        pipeline.append({"$match": keyset_filter(sort, after)})
+    pipeline += [
         {"$sort": dict(sort)},
-        {"$skip": skip},
+        {"$skip": skip if after is None else 0},
         {"$limit": limit},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "userId",
-                "foreignField": "_id",
-                "as": "user"
-            }
-        },
-        {
-            "$lookup": {
-                "from": "messages",
-                "localField": "_id",
-                "foreignField": "listingId",
-                "as": "messages"
-            }
-        },
-        {
-            "$addFields": {
-                "messageCount": {"$size": "$messages"},
-                "user": {"$arrayElemAt": ["$user", 0]}
-            }
-        },
-        {
-            "$project": {
-                "messages": 0,
-                "user.hashed_password": 0
-            }
-        }
+        {"$project": listing_projection(fields, view, (field for field, _ in sort))}
     ]
+    return pipeline, sort
+
+async def _fetch_listings(
+    db: AsyncIOMotorDatabase,
+    skip: int,
+    limit: int,
+    category: Optional[Category],
+    urgency: Optional[UrgencyLevel],
+    text_query: Optional[dict],
+    sort_by: str,
+    cursor: Optional[str],
+    view: str,
+    fields: Optional[Tuple[str, ...]],
+    filters: Optional[dict] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Run the feed pipeline; returns the page and the cursor for the next one"""
+    pipeline, sort = feed_pipeline(skip, limit, category, urgency, text_query, sort_by, cursor, view, fields, filters)
     
+    # Execute query with user data
     listings = await db.listings.aggregate(pipeline).to_list(length=None)
+    if wants_user(fields):
+        await Hydrator(db).attach_users(listings)
+    cursor_for_next = next_cursor(listings, limit, sort)
+    return trim_to_fields(listings, fields), cursor_for_next
+
+@router.get("", response_model=List[ListingPartialResponse], response_model_exclude_unset=True)
+async def get_listings(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=50),
+    category: Optional[Category] = None,
+    urgency: Optional[UrgencyLevel] = None,
+    search: Optional[str] = None,
+    sort_by: Optional[str] = Query(None, pattern="^(newest|oldest|most_viewed|most_messages|trending|relevance)$"),
+    cursor: Optional[str] = None,
+    view: str = Query("summary", pattern=LISTING_VIEW_PATTERN),
+    fields: Optional[str] = None,
+    city: Optional[str] = None,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0, le=MAX_RADIUS_KM),
+    budget_min: Optional[float] = Query(None, ge=0),
+    budget_max: Optional[float] = Query(None, ge=0),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    search = search.strip() if search else None
+    text_query = build_search_query(search) if search else None
+    if search and text_query is None:
+        # Only stopwords or punctuation: nothing can match, and the
+        # unfiltered feed must not pass for search results
+        return Response(content=listing_page_serializer.render([]), media_type="application/json")
+    selected_fields = resolve_listing_fields(parse_listing_fields(fields), view)
+    filters = {
+        **build_location_query(city, lat, lng, radius_km),
+        **build_budget_query(budget_min, budget_max)
+    }
     
-    return [ListingResponse(**listing) for listing in listings]
+    # Search results are ranked by relevance unless another order is asked for
+    if sort_by is None:
+        sort_by = "relevance" if text_query else "newest"
+    if sort_by == "relevance" and not text_query:
+        sort_by = "newest"
+    
+    # Public feed pages are served from the response cache; equivalent
+    # queries share an entry because search text is keyed by its terms
+    key = (
+        "listings",
+        category.value if category else None,
+        urgency.value if urgency else None,
+        text_query["$text"]["$search"] if text_query else None,
+        sort_by,
+        skip,
+        limit,
+        cursor,
+        view,
+        selected_fields,
+        repr(sorted(filters.items()))
+    )
+    
+    async def render():
+        listings, cursor_for_next = await _fetch_listings(
+            db, skip, limit, category, urgency, text_query, sort_by, cursor, view, selected_fields, filters
+        )
+        return listing_page_serializer.render(listings), cursor_for_next
+    
+    body, cursor_for_next = await feed_cache.get_or_compute(key, feed_page_tags(category), render)
+    return Response(content=body, media_type="application/json", headers=cursor_headers(cursor_for_next))
 
 @router.post("", response_model=ListingResponse)
 async def create_listing(
     listing: ListingCreate,
     current_user: UserInDB = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
     # Create listing
     listing_in_db = ListingInDB(
         **listing.dict(),
+        **normalize_location(listing.location),
         userId=current_user.id
     )
+    listing_in_db.expiresAt = expires_at(listing_in_db.urgency, listing_in_db.createdAt)
     
-    # Insert into database
-    result = await db.listings.insert_one(listing_in_db.dict(by_alias=True))
-    
-    # Get created listing with user data
-    pipeline = [
-        {"$match": {"_id": result.inserted_id}},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "userId",
-                "foreignField": "_id",
-                "as": "user"
-            }
-        },
-        {
-            "$addFields": {
-                "user": {"$arrayElemAt": ["$user", 0]},
-                "messageCount": 0
-            }
-        },
-        {
-            "$project": {
-                "user.hashed_password": 0
-            }
-        }
-    ]
+    # Insert into database along with its search terms
+    listing_doc = listing_in_db.dict(by_alias=True)
+    listing_doc["searchText"] = build_search_text(listing_doc)
+    await db.listings.insert_one(listing_doc)
+    await user_stats.increment(
+        db, current_user.id, totalListings=1, **{user_stats.status_field(listing_in_db.status): 1}
+    )
+    feed_cache.invalidate_tags(feed_cache_tags(listing_in_db.category))
+    facet_counts.record(None, listing_doc)
+    # Sellers with a matching saved search are notified in the background
+    saved_search_matcher.enqueue(listing_doc)
     
-    created_listing = await db.listings.aggregate(pipeline).next()
-    return ListingResponse(**created_listing)
+    # Return the created listing with the owner's summary
+    listing_doc.pop("searchText")
+    await hydrator.attach_users([listing_doc])
+    return listing_serializer.response(listing_doc)
+
+@router.get("/facets", response_model=ListingFacetsResponse)
+async def get_listing_facets(
+    category: Optional[Category] = None,
+    urgency: Optional[UrgencyLevel] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Active listing counts per category and urgency for the filter sidebar"""
+    await facet_counts.ensure_loaded(db)
+    return facet_counts.facets(category, urgency)
 
 @router.get("/{listing_id}", response_model=ListingResponse)
 async def get_listing(
     listing_id: str,
     current_user: Optional[UserInDB] = Depends(get_current_user_optional),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
-    # Increment view count if not the owner
-    if current_user and current_user.id != listing_id:
-        await db.listings.update_one(
-            {"_id": listing_id},
-            {"$inc": {"views": 1}}
-        )
-    
     # Get listing with user data
-    pipeline = [
-        {"$match": {"_id": listing_id}},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "userId",
-                "foreignField": "_id",
-                "as": "user"
-            }
-        },
-        {
-            "$lookup": {
-                "from": "messages",
-                "localField": "_id",
-                "foreignField": "listingId",
-                "as": "messages"
-            }
-        },
-        {
-            "$addFields": {
-                "messageCount": {"$size": "$messages"},
-                "user": {"$arrayElemAt": ["$user", 0]}
-            }
-        },
-        {
-            "$project": {
-                "messages": 0,
-                "user.hashed_password": 0
-            }
-        }
-    ]
-    
-    listing = await db.listings.aggregate(pipeline).next()
+    listing = await db.listings.find_one({"_id": listing_id, **NOT_DELETED}, {"searchText": 0})
     
     if not listing:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Listing not found"
         )
+    await hydrator.attach_users([listing])
+    
+    # Count the view if not the owner; the buffer writes it in bulk later
+    if current_user and current_user.id != listing["userId"]:
+        view_buffer.record(listing_id)
+    listing["views"] = listing.get("views", 0) + view_buffer.pending(listing_id)
     
-    return ListingResponse(**listing)
+    return listing_serializer.response(listing)
 
 @router.put("/{listing_id}", response_model=ListingResponse)
 async def update_listing(
@@ -199,7 +280,7 @@ async def update_listing(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     # Check if listing exists and user owns it
-    existing_listing = await db.listings.find_one({"_id": listing_id})
+    existing_listing = await db.listings.find_one({"_id": listing_id, **NOT_DELETED})
     if not existing_listing:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -216,17 +297,40 @@ async def update_listing(
     update_data = {k: v for k, v in listing_update.dict().items() if v is not None}
     
     if not update_data:
-        return await get_listing(listing_id, current_user, db)
+        return await get_listing(listing_id, current_user, db, Hydrator(db))
     
     update_data["updatedAt"] = datetime.utcnow()
     
+    # Reactivating a listing or changing its urgency renews its lifetime
+    renewed = existing_listing["status"] != ListingStatus.ACTIVE or "urgency" in update_data
+    if update_data.get("status", existing_listing["status"]) == ListingStatus.ACTIVE and renewed:
+        update_data["expiresAt"] = expires_at(
+            update_data.get("urgency", existing_listing["urgency"]), update_data["updatedAt"]
+        )
+    
+    if "location" in update_data:
+        update_data.update(normalize_location(update_data["location"]))
+    
+    # Re-tokenize when any searchable field changes
+    if any(field in update_data for field in SEARCH_FIELDS):
+        update_data["searchText"] = build_search_text({**existing_listing, **update_data})
+    
     # Update listing
     await db.listings.update_one(
         {"_id": listing_id},
         {"$set": update_data}
     )
+    feed_cache.invalidate_tags(feed_cache_tags(existing_listing["category"], update_data.get("category")))
+    listing_summary_cache.invalidate(listing_id)
+    facet_counts.record(existing_listing, {**existing_listing, **update_data})
     
-    return await get_listing(listing_id, current_user, db)
+    if "status" in update_data and update_data["status"] != existing_listing["status"]:
+        await user_stats.increment(db, current_user.id, **{
+            user_stats.status_field(existing_listing["status"]): -1,
+            user_stats.status_field(update_data["status"]): 1
+        })
+    
+    return await get_listing(listing_id, current_user, db, Hydrator(db))
 
 @router.delete("/{listing_id}")
 async def delete_listing(
@@ -235,7 +339,7 @@ async def delete_listing(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     # Check if listing exists and user owns it
-    existing_listing = await db.listings.find_one({"_id": listing_id})
+    existing_listing = await db.listings.find_one({"_id": listing_id, **NOT_DELETED})
     if not existing_listing:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -248,63 +352,67 @@ async def delete_listing(
             detail="Not authorized to delete this listing"
         )
     
-    # Delete listing and related data
-    await db.listings.delete_one({"_id": listing_id})
-    await db.messages.delete_many({"listingId": listing_id})
-    await db.favorites.delete_many({"listingId": listing_id})
+    # Tombstone the listing now; its messages and favorites are purged in the background
+    if await tombstone_listing(db, existing_listing):
+        feed_cache.invalidate_tags(feed_cache_tags(existing_listing["category"]))
+        listing_summary_cache.invalidate(listing_id)
+        facet_counts.record(existing_listing, None)
+        purge_task.wake()
     
     return {"message": "Listing deleted successfully"}
 
-@router.get("/my/listings", response_model=List[ListingResponse])
+def my_listings_pipeline(
+    user_id: str,
+    skip: int,
+    limit: int,
+    cursor: Optional[str],
+    view: str = "summary",
+    fields: Optional[Tuple[str, ...]] = None
+) -> Tuple[List[dict], SortSpec]:
+    """A user's own listings in every status, newest first"""
+    sort = keyset_sort([("createdAt", -1)])
+    after = parse_cursor(cursor, sort)
+    pipeline = [
+        {"$match": apply_cursor({"userId": user_id, **NOT_DELETED}, sort, after)},
+        {"$sort": dict(sort)},
+        {"$skip": skip if after is None else 0},
+        {"$limit": limit},
+        {"$project": listing_projection(fields, view, (field for field, _ in sort))}
+    ]
+    return pipeline, sort
+
+@router.get("/my/listings", response_model=List[ListingPartialResponse], response_model_exclude_unset=True)
 async def get_my_listings(
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = None,
+    view: str = Query("summary", pattern=LISTING_VIEW_PATTERN),
+    fields: Optional[str] = None,
     current_user: UserInDB = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
-    pipeline = [
-        {"$match": {"userId": current_user.id}},
-        {"$sort": {"createdAt": -1}},
-        {"$skip": skip},
-        {"$limit": limit},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "userId",
-                "foreignField": "_id",
-                "as": "user"
-            }
-        },
-        {
-            "$lookup": {
-                "from": "messages",
-                "localField": "_id",
-                "foreignField": "listingId",
-                "as": "messages"
-            }
-        },
-        {
-            "$addFields": {
-                "messageCount": {"$size": "$messages"},
-                "user": {"$arrayElemAt": ["$user", 0]}
-            }
-        },
-        {
-            "$project": {
-                "messages": 0,
-                "user.hashed_password": 0
-            }
-        }
-    ]
+    selected_fields = resolve_listing_fields(parse_listing_fields(fields), view)
+    pipeline, sort = my_listings_pipeline(current_user.id, skip, limit, cursor, view, selected_fields)
     
     listings = await db.listings.aggregate(pipeline).to_list(length=None)
-    return [ListingResponse(**listing) for listing in listings]
+    if wants_user(selected_fields):
+        await hydrator.attach_users(listings)
+    headers = cursor_headers(next_cursor(listings, limit, sort))
+    return listing_page_serializer.response(trim_to_fields(listings, selected_fields), headers)
 
-@router.get("/categories/{category}", response_model=List[ListingResponse])
+@router.get("/categories/{category}", response_model=List[ListingPartialResponse], response_model_exclude_unset=True)
 async def get_listings_by_category(
     category: Category,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = None,
+    view: str = Query("summary", pattern=LISTING_VIEW_PATTERN),
+    fields: Optional[str] = None,
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    return await get_listings(skip, limit, category, None, None, "newest", db)
\ No newline at end of file
+    return await get_listings(
+        skip=skip, limit=limit, category=category, urgency=None, search=None, sort_by="newest",
+        cursor=cursor, view=view, fields=fields, city=None, lat=None, lng=None, radius_km=None,
+        budget_min=None, budget_max=None, db=db
+    )
\ No newline at end of file
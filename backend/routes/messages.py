@@ -1,73 +1,90 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+from collections import defaultdict
 from database import get_database
-from models import MessageCreate, MessageResponse, MessageInDB, UserInDB
-from auth import get_current_user
+from models import (
+    MessageCreate,
+    MessageResponse,
+    MessageInDB,
+    MessageBulkRead,
+    MessageBulkReadResponse,
+    ConversationResponse,
+    UserInDB
+)
+from auth import get_current_user, get_stream_user
+from conversations import (
+    conversation_id,
+    message_conversation_id,
+    record_message,
+    record_read,
+    record_reads,
+    unread_counts,
+    to_inbox_entry
+)
+from loaders import Hydrator, get_hydrator
+from listing_purge import NOT_DELETED
+from pagination import SortSpec, keyset_sort, parse_cursor, apply_cursor, next_cursor, cursor_headers
+from serialization import message_serializer, conversation_serializer
+from trending import record_activity
+from realtime import hub, sse_message, MESSAGE_NEW, MESSAGE_READ, SSE_HEARTBEAT_SECONDS
 from datetime import datetime
+import asyncio
+import orjson
+import user_stats
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
+UNREAD_MAX_WAIT_SECONDS = 60
+
+def inbox_pipeline(user_id: str, skip: int, limit: int, cursor: Optional[str]) -> Tuple[List[dict], SortSpec]:
+    """Messages the user sent or received, newest first"""
+    sort = keyset_sort([("createdAt", -1)])
+    after = parse_cursor(cursor, sort)
+    
+    # Get messages where user is sender or receiver
+    query = {
+        "$or": [
+            {"senderId": user_id},
+            {"receiverId": user_id}
+        ]
+    }
+    pipeline = [
+        {"$match": apply_cursor(query, sort, after)},
+        {"$sort": dict(sort)},
+        {"$skip": skip if after is None else 0},
+        {"$limit": limit}
+    ]
+    return pipeline, sort
+
 @router.get("", response_model=List[MessageResponse])
 async def get_user_messages(
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = None,
     current_user: UserInDB = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
-    # Get messages where user is sender or receiver
-    pipeline = [
-        {
-            "$match": {
-                "$or": [
-                    {"senderId": current_user.id},
-                    {"receiverId": current_user.id}
-                ]
-            }
-        },
-        {"$sort": {"createdAt": -1}},
-        {"$skip": skip},
-        {"$limit": limit},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "senderId",
-                "foreignField": "_id",
-                "as": "sender"
-            }
-        },
-        {
-            "$lookup": {
-                "from": "listings",
-                "localField": "listingId",
-                "foreignField": "_id",
-                "as": "listing"
-            }
-        },
-        {
-            "$addFields": {
-                "sender": {"$arrayElemAt": ["$sender", 0]},
-                "listing": {"$arrayElemAt": ["$listing", 0]}
-            }
-        },
-        {
-            "$project": {
-                "sender.hashed_password": 0
-            }
-        }
-    ]
+    pipeline, sort = inbox_pipeline(current_user.id, skip, limit, cursor)
     
     messages = await db.messages.aggregate(pipeline).to_list(length=None)
-    return [MessageResponse(**message) for message in messages]
+    await hydrator.attach_message_refs(messages)
+    headers = cursor_headers(next_cursor(messages, limit, sort))
+    
+    # Messages of deleted listings linger until the purge worker gets to them
+    return message_serializer.response([message for message in messages if message.get("listing")], headers)
 
 @router.post("", response_model=MessageResponse)
 async def send_message(
     message: MessageCreate,
     current_user: UserInDB = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
     # Check if listing exists
-    listing = await db.listings.find_one({"_id": message.listingId})
+    listing = await db.listings.find_one({"_id": message.listingId, **NOT_DELETED})
     if not listing:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -83,6 +100,7 @@ async def send_message(
     
     # Create message
     message_in_db = MessageInDB(
+        conversationId=conversation_id(message.listingId, listing["userId"], current_user.id),
         listingId=message.listingId,
         senderId=current_user.id,
         receiverId=listing["userId"],
@@ -90,51 +108,141 @@ async def send_message(
     )
     
     # Insert message
-    result = await db.messages.insert_one(message_in_db.dict(by_alias=True))
+    message_doc = message_in_db.dict(by_alias=True)
+    await db.messages.insert_one(message_doc)
     
-    # Get created message with sender and listing data
+    # Keep the listing's denormalized message counter and the thread in step
+    await db.listings.update_one(
+        {"_id": message.listingId},
+        {"$inc": {"messageCount": 1}}
+    )
+    await record_message(db, message_doc, listing)
+    await record_activity(db, message.listingId, messages=1)
+    await user_stats.increment_many(db, {
+        current_user.id: {"sentMessages": 1},
+        listing["userId"]: {"receivedMessages": 1, "unreadMessages": 1}
+    })
+    
+    # Return the created message with sender and listing data
+    await hydrator.attach_message_refs([message_doc])
+    body = message_serializer.render(message_doc)
+    await hub.publish([listing["userId"], current_user.id], MESSAGE_NEW, body.decode())
+    return Response(content=body, media_type="application/json")
+
+@router.get("/stream")
+async def stream_message_events(
+    request: Request,
+    current_user: UserInDB = Depends(get_stream_user)
+):
+    """Server-sent events for new messages, read receipts and saved-search matches.
+
+    Replaces polling ``/messages`` and ``/messages/unread/count``: clients
+    fetch once, then apply ``message.new`` and ``message.read`` events and
+    refetch on ``resync`` or after reconnecting. ``listing.match`` says
+    ``/notifications`` has something new.
+    """
+    async def events():
+        subscription = hub.subscribe(current_user.id)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                event = await subscription.next(timeout=SSE_HEARTBEAT_SECONDS)
+                if subscription.closed:
+                    break
+                if event is None:
+                    if await request.is_disconnected():
+                        break
+                    # Keeps proxies from closing an idle connection
+                    yield b": keep-alive\n\n"
+                    continue
+                yield sse_message(event)
+        finally:
+            hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def conversations_query(user_id: str, cursor: Optional[str]) -> Tuple[dict, SortSpec]:
+    """Filter and sort of the user's conversations, most recent first"""
+    sort = keyset_sort([("lastMessageAt", -1)])
+    return apply_cursor({"participants": user_id}, sort, parse_cursor(cursor, sort)), sort
+
+@router.get("/conversations", response_model=List[ConversationResponse])
+async def get_conversations(
+    limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    # Inbox: one indexed query on the denormalized conversations
+    query, sort = conversations_query(current_user.id, cursor)
+    conversations = await db.conversations.find(query).sort(sort).limit(limit).to_list(length=None)
+    
+    return conversation_serializer.response(
+        [to_inbox_entry(conversation, current_user.id) for conversation in conversations],
+        cursor_headers(next_cursor(conversations, limit, sort))
+    )
+
+def thread_pipeline(conversation_id: str, limit: int, cursor: Optional[str]) -> Tuple[List[dict], SortSpec]:
+    """Thread messages, oldest first"""
+    sort = keyset_sort([("createdAt", 1)])
+    after = parse_cursor(cursor, sort)
     pipeline = [
-        {"$match": {"_id": result.inserted_id}},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "senderId",
-                "foreignField": "_id",
-                "as": "sender"
-            }
-        },
-        {
-            "$lookup": {
-                "from": "listings",
-                "localField": "listingId",
-                "foreignField": "_id",
-                "as": "listing"
-            }
-        },
-        {
-            "$addFields": {
-                "sender": {"$arrayElemAt": ["$sender", 0]},
-                "listing": {"$arrayElemAt": ["$listing", 0]}
-            }
-        },
-        {
-            "$project": {
-                "sender.hashed_password": 0
-            }
-        }
+        {"$match": apply_cursor({"conversationId": conversation_id}, sort, after)},
+        {"$sort": dict(sort)},
+        {"$limit": limit}
     ]
+    return pipeline, sort
+
+@router.get("/conversations/{conversation_id}", response_model=List[MessageResponse])
+async def get_conversation_messages(
+    conversation_id: str,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    hydrator: Hydrator = Depends(get_hydrator)
+):
+    conversation = await db.conversations.find_one(
+        {"_id": conversation_id},
+        {"participants": 1}
+    )
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    
+    if current_user.id not in conversation["participants"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view this conversation"
+        )
     
-    created_message = await db.messages.aggregate(pipeline).next()
-    return MessageResponse(**created_message)
+    pipeline, sort = thread_pipeline(conversation_id, limit, cursor)
+    messages = await db.messages.aggregate(pipeline).to_list(length=None)
+    await hydrator.attach_users(messages, "senderId", "sender")
+    return message_serializer.response(messages, cursor_headers(next_cursor(messages, limit, sort)))
+
+def listing_messages_pipeline(listing_id: str) -> List[dict]:
+    """Every message about a listing, oldest first"""
+    return [
+        {"$match": {"listingId": listing_id}},
+        {"$sort": {"createdAt": 1}}
+    ]
 
 @router.get("/{listing_id}", response_model=List[MessageResponse])
 async def get_listing_messages(
     listing_id: str,
     current_user: UserInDB = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
     # Check if user owns the listing or has sent messages to it
-    listing = await db.listings.find_one({"_id": listing_id})
+    listing = await db.listings.find_one({"_id": listing_id, **NOT_DELETED})
     if not listing:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -153,38 +261,99 @@ async def get_listing_messages(
                 detail="Not authorized to view these messages"
             )
     
-    # Get messages for the listing
-    pipeline = [
-        {"$match": {"listingId": listing_id}},
-        {"$sort": {"createdAt": 1}},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "senderId",
-                "foreignField": "_id",
-                "as": "sender"
-            }
-        },
-        {
-            "$addFields": {
-                "sender": {"$arrayElemAt": ["$sender", 0]}
-            }
-        },
-        {
-            "$project": {
-                "sender.hashed_password": 0
+    messages = await db.messages.aggregate(listing_messages_pipeline(listing_id)).to_list(length=None)
+    await hydrator.attach_users(messages, "senderId", "sender")
+    return message_serializer.response(messages)
+
+@router.put("/read", response_model=MessageBulkReadResponse)
+async def mark_messages_as_read(
+    bulk_read: MessageBulkRead,
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Mark a whole thread, or a set of messages, as read in one update.
+
+    Only the current user's unread messages are touched; ids that are
+    already read or were sent to someone else are skipped.
+    """
+    if bulk_read.messageIds:
+        query = {"_id": {"$in": bulk_read.messageIds}}
+        conversations = set()
+    elif bulk_read.listingId and bulk_read.counterpartId:
+        # Messages go from a seller to the listing owner, so the reader is the buyer
+        query = {"listingId": bulk_read.listingId, "senderId": bulk_read.counterpartId}
+        conversations = {conversation_id(bulk_read.listingId, current_user.id, bulk_read.counterpartId)}
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide messageIds, or listingId and counterpartId"
+        )
+    query.update({"receiverId": current_user.id, "isRead": False})
+    
+    unread = await db.messages.find(
+        query,
+        {"conversationId": 1, "listingId": 1, "senderId": 1, "receiverId": 1}
+    ).to_list(length=None)
+    
+    modified = 0
+    if unread:
+        by_conversation: Dict[str, List[dict]] = defaultdict(list)
+        for message in unread:
+            by_conversation[message_conversation_id(message)].append(message)
+        conversations.update(by_conversation)
+        
+        result = await db.messages.update_many(
+            {"_id": {"$in": [message["_id"] for message in unread]}, "isRead": False},
+            {"$set": {"isRead": True}}
+        )
+        modified = result.modified_count
+        
+        if modified == len(unread) or len(by_conversation) == 1:
+            await record_reads(db, current_user.id, {
+                conversation: len(messages) if modified == len(unread) else modified
+                for conversation, messages in by_conversation.items()
+            })
+        else:
+            # A concurrent read flipped some of these first, so which thread
+            # lost how many is unknown; recount the affected threads
+            for conversation in by_conversation:
+                remaining = await db.messages.count_documents({
+                    "conversationId": conversation,
+                    "receiverId": current_user.id,
+                    "isRead": False
+                })
+                await db.conversations.update_one(
+                    {"_id": conversation},
+                    {"$set": {f"unread.{current_user.id}": remaining}}
+                )
+        if modified:
+            await user_stats.increment(db, current_user.id, unreadMessages=-modified)
+        
+        read_at = datetime.utcnow()
+        for conversation, messages in by_conversation.items():
+            receipt = {
+                "messageIds": [message["_id"] for message in messages],
+                "conversationId": conversation,
+                "listingId": messages[0]["listingId"],
+                "readerId": current_user.id,
+                "readAt": read_at,
             }
-        }
-    ]
+            await hub.publish(
+                [messages[0]["senderId"], current_user.id], MESSAGE_READ, orjson.dumps(receipt).decode()
+            )
     
-    messages = await db.messages.aggregate(pipeline).to_list(length=None)
-    return [MessageResponse(**message) for message in messages]
+    return MessageBulkReadResponse(
+        modifiedCount=modified,
+        unreadCount=await user_stats.get_unread_count(db, current_user.id),
+        conversationUnread=await unread_counts(db, current_user.id, conversations)
+    )
 
 @router.put("/{message_id}/read", response_model=MessageResponse)
 async def mark_message_as_read(
     message_id: str,
     current_user: UserInDB = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    hydrator: Hydrator = Depends(get_hydrator)
 ):
     # Check if message exists and user is the receiver
     message = await db.messages.find_one({"_id": message_id})
@@ -200,54 +369,73 @@ async def mark_message_as_read(
             detail="Not authorized to mark this message as read"
         )
     
-    # Update message
-    await db.messages.update_one(
-        {"_id": message_id},
+    # Update message; only an actual unread -> read flip touches the counters
+    result = await db.messages.update_one(
+        {"_id": message_id, "isRead": False},
         {"$set": {"isRead": True}}
     )
-    
-    # Get updated message with sender data
-    pipeline = [
-        {"$match": {"_id": message_id}},
-        {
-            "$lookup": {
-                "from": "users",
-                "localField": "senderId",
-                "foreignField": "_id",
-                "as": "sender"
-            }
-        },
-        {
-            "$lookup": {
-                "from": "listings",
-                "localField": "listingId",
-                "foreignField": "_id",
-                "as": "listing"
-            }
-        },
-        {
-            "$addFields": {
-                "sender": {"$arrayElemAt": ["$sender", 0]},
-                "listing": {"$arrayElemAt": ["$listing", 0]}
-            }
-        },
-        {
-            "$project": {
-                "sender.hashed_password": 0
-            }
+    if result.modified_count:
+        conversation = message_conversation_id(message)
+        await record_read(db, conversation, current_user.id)
+        await user_stats.increment(db, current_user.id, unreadMessages=-1)
+        receipt = {
+            "messageIds": [message_id],
+            "conversationId": conversation,
+            "listingId": message["listingId"],
+            "readerId": current_user.id,
+            "readAt": datetime.utcnow(),
         }
-    ]
+        await hub.publish([message["senderId"], current_user.id], MESSAGE_READ, orjson.dumps(receipt).decode())
     
-    updated_message = await db.messages.aggregate(pipeline).next()
-    return MessageResponse(**updated_message)
+    # Return the updated message with sender data
+    message["isRead"] = True
+    await hydrator.attach_message_refs([message])
+    return message_serializer.response(message)
+
+def _unread_etag(count: int) -> str:
+    return f'"unread-{count}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
 
 @router.get("/unread/count")
 async def get_unread_message_count(
+    request: Request,
+    wait: float = Query(0, ge=0, le=UNREAD_MAX_WAIT_SECONDS),
     current_user: UserInDB = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    count = await db.messages.count_documents({
-        "receiverId": current_user.id,
-        "isRead": False
-    })
-    return {"unreadCount": count}
\ No newline at end of file
+    """Unread count from the materialized per-user counter.
+
+    Responses carry an ETag, and a matching If-None-Match gets a 304. With
+    ``wait`` as well, an unchanged count is held open until a message event
+    for the user arrives or ``wait`` seconds pass (long-poll).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    
+    # Subscribe before reading so an event between the two isn't missed
+    subscription = hub.subscribe(current_user.id) if wait and if_none_match else None
+    try:
+        count = await user_stats.get_unread_count(db, current_user.id)
+        if subscription is not None:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + wait
+            while _etag_matches(if_none_match, _unread_etag(count)):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                if await subscription.next(timeout=remaining) is None:
+                    break
+                count = await user_stats.get_unread_count(db, current_user.id)
+    finally:
+        if subscription is not None:
+            hub.unsubscribe(subscription)
+    
+    etag = _unread_etag(count)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content={"unreadCount": count}, headers=headers)
\ No newline at end of file
@@ -0,0 +1,79 @@
+from fastapi import APIRouter, Depends, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import List, Optional, Tuple
+from database import get_database
+from models import NotificationResponse, NotificationBulkRead, NotificationBulkReadResponse, UserInDB
+from auth import get_current_user
+from loaders import Hydrator, get_hydrator
+from pagination import SortSpec, keyset_sort, parse_cursor, apply_cursor, next_cursor, cursor_headers
+from serialization import notification_serializer
+
+router = APIRouter(prefix="/notifications", tags=["notifications"])
+
+def notifications_pipeline(
+    user_id: str,
+    skip: int,
+    limit: int,
+    cursor: Optional[str],
+    unread_only: bool = False
+) -> Tuple[List[dict], SortSpec]:
+    """The user's notifications, newest first"""
+    sort = keyset_sort([("createdAt", -1)])
+    after = parse_cursor(cursor, sort)
+    query = {"userId": user_id}
+    if unread_only:
+        query["isRead"] = False
+    pipeline = [
+        {"$match": apply_cursor(query, sort, after)},
+        {"$sort": dict(sort)},
+        {"$skip": skip if after is None else 0},
+        {"$limit": limit}
+    ]
+    return pipeline, sort
+
+async def _unread_count(db: AsyncIOMotorDatabase, user_id: str) -> int:
+    return await db.notifications.count_documents({"userId": user_id, "isRead": False})
+
+@router.get("", response_model=List[NotificationResponse])
+async def get_notifications(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = None,
+    unread_only: bool = False,
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    hydrator: Hydrator = Depends(get_hydrator)
+):
+    """Listings that matched the user's saved searches"""
+    pipeline, sort = notifications_pipeline(current_user.id, skip, limit, cursor, unread_only)
+    notifications = await db.notifications.aggregate(pipeline).to_list(length=None)
+    await hydrator.attach_listings(notifications)
+    headers = cursor_headers(next_cursor(notifications, limit, sort))
+
+    # Notifications of deleted listings linger until the purge worker gets to them
+    return notification_serializer.response(
+        [notification for notification in notifications if notification.get("listing")], headers
+    )
+
+@router.get("/unread/count")
+async def get_unread_notification_count(
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    return {"unreadCount": await _unread_count(db, current_user.id)}
+
+@router.put("/read", response_model=NotificationBulkReadResponse)
+async def mark_notifications_as_read(
+    read: NotificationBulkRead,
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    query = {"userId": current_user.id, "isRead": False}
+    if read.notificationIds is not None:
+        query["_id"] = {"$in": read.notificationIds}
+    result = await db.notifications.update_many(query, {"$set": {"isRead": True}})
+
+    return NotificationBulkReadResponse(
+        modifiedCount=result.modified_count,
+        unreadCount=await _unread_count(db, current_user.id)
+    )
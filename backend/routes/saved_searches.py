@@ -0,0 +1,89 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import List
+from database import get_database
+from models import SavedSearchCreate, SavedSearchResponse, SavedSearchInDB, UserInDB
+from auth import get_current_user
+from search import tokenize
+from geo import MAX_RADIUS_KM, build_location_query
+from routes.listings import build_budget_query
+from saved_searches import saved_search_matcher, MAX_SAVED_SEARCHES_PER_USER
+from serialization import saved_search_serializer
+
+router = APIRouter(prefix="/saved-searches", tags=["saved-searches"])
+
+@router.get("", response_model=List[SavedSearchResponse])
+async def get_saved_searches(
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    searches = await db.saved_searches.find(
+        {"userId": current_user.id}
+    ).sort("createdAt", -1).limit(MAX_SAVED_SEARCHES_PER_USER).to_list(length=None)
+    return saved_search_serializer.response(searches)
+
+@router.post("", response_model=SavedSearchResponse)
+async def create_saved_search(
+    saved_search: SavedSearchCreate,
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Save feed filters; new listings matching all of them are sent to the notifications inbox"""
+    if saved_search.radiusKm is not None and saved_search.radiusKm > MAX_RADIUS_KM:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"radiusKm must not exceed {MAX_RADIUS_KM}"
+        )
+
+    # Same validation, and the same meaning, as the feed's filters
+    location = build_location_query(saved_search.city, saved_search.lat, saved_search.lng, saved_search.radiusKm)
+    build_budget_query(saved_search.budgetMin, saved_search.budgetMax)
+
+    terms = list(dict.fromkeys(tokenize(saved_search.keywords)))
+    if saved_search.keywords and not terms:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="keywords has no searchable terms"
+        )
+
+    search_in_db = SavedSearchInDB(**saved_search.dict(), userId=current_user.id, terms=terms)
+    if "geo" in location:
+        search_in_db.center = location["geo"]["$geoWithin"]["$centerSphere"][0]
+    elif "city" in location:
+        # Stored under its canonical gazetteer name, as listings are
+        search_in_db.city = location["city"]
+
+    # A search with no criteria would match every listing
+    criteria = ("category", "urgency", "terms", "city", "center", "budgetMin", "budgetMax")
+    if not any(getattr(search_in_db, field) for field in criteria):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A saved search needs at least one filter"
+        )
+
+    if await db.saved_searches.count_documents({"userId": current_user.id}) >= MAX_SAVED_SEARCHES_PER_USER:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_SAVED_SEARCHES_PER_USER} saved searches are allowed"
+        )
+
+    search_doc = search_in_db.dict(by_alias=True)
+    await db.saved_searches.insert_one(search_doc)
+    saved_search_matcher.add(search_doc)
+    return saved_search_serializer.response(search_doc)
+
+@router.delete("/{search_id}")
+async def delete_saved_search(
+    search_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    result = await db.saved_searches.delete_one({"_id": search_id, "userId": current_user.id})
+    if not result.deleted_count:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Saved search not found"
+        )
+    saved_search_matcher.remove(search_id)
+
+    return {"message": "Saved search deleted successfully"}
@@ -2,8 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from database import get_database
 from models import UserUpdate, UserResponse, UserInDB
-from auth import get_current_user
+from auth import get_current_user, user_cache
+from loaders import user_summary_cache
 from datetime import datetime
+import user_stats
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -34,6 +36,10 @@ async def update_user_profile(
         {"$set": update_data}
     )
     
+    # Drop the cached copy so the next request sees the new profile
+    user_cache.invalidate(current_user.email)
+    user_summary_cache.invalidate(current_user.id)
+    
     # Get updated user
     updated_user = await db.users.find_one({"_id": current_user.id})
     return UserResponse(**updated_user)
@@ -43,30 +49,17 @@ async def get_user_stats(
     current_user: UserInDB = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    # Get user statistics
-    total_listings = await db.listings.count_documents({"userId": current_user.id})
-    active_listings = await db.listings.count_documents({
-        "userId": current_user.id, 
-        "status": "active"
-    })
-    completed_listings = await db.listings.count_documents({
-        "userId": current_user.id, 
-        "status": "completed"
-    })
-    
-    # Get message count
-    received_messages = await db.messages.count_documents({"receiverId": current_user.id})
-    sent_messages = await db.messages.count_documents({"senderId": current_user.id})
-    
-    # Get favorites count
-    favorites_count = await db.favorites.count_documents({"userId": current_user.id})
+    # Materialized counters: a single primary-key read
+    stats = await user_stats.get_user_stats(db, current_user.id)
+    total_listings = stats["totalListings"]
+    completed_listings = stats["completedListings"]
     
     return {
         "totalListings": total_listings,
-        "activeListings": active_listings,
+        "activeListings": stats["activeListings"],
         "completedListings": completed_listings,
-        "receivedMessages": received_messages,
-        "sentMessages": sent_messages,
-        "favoritesCount": favorites_count,
+        "receivedMessages": stats["receivedMessages"],
+        "sentMessages": stats["sentMessages"],
+        "favoritesCount": stats["favoritesCount"],
         "successRate": round((completed_listings / total_listings * 100) if total_listings > 0 else 0, 1)
     }
\ No newline at end of file
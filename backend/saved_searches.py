@@ -0,0 +1,293 @@
+"""Saved searches, and pushing newly created listings to the sellers whose searches they match.
+
+Every worker holds all saved searches in an in-memory inverted index.
+Each search is posted under as few keys as it can be: its longest
+keyword, else the grid cells its radius covers, else its city, else its
+category, else its urgency, and only a search with nothing but a budget goes in the
+catch-all posting. A new listing looks up the keys it carries (its search
+terms, city, grid cell, category and urgency), and only the searches
+found there are checked in full. Matching therefore costs in proportion
+to the searches that could plausibly match, not to all of them.
+
+``create_listing`` only queues the listing. A background task matches
+queued listings, writes one notification per interested seller with
+unordered ``insert_many`` batches (a unique index on seller and listing
+turns a repeated run into duplicate-key errors, which are skipped), and publishes a ``listing.match``
+event to them. Listings still queued when a worker dies are not
+notified, so notifications are best-effort. Searches saved or deleted
+through another worker reach this one's index on the next reload.
+"""
+import asyncio
+import logging
+import math
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set
+import orjson
+from pymongo.errors import BulkWriteError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import database
+from models import NotificationInDB
+from geo import distance_km
+from realtime import hub, LISTING_MATCH
+from tasks import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+SAVED_SEARCH_RELOAD_SECONDS = float(os.getenv("SAVED_SEARCH_RELOAD_SECONDS", "60"))
+SAVED_SEARCH_FANOUT_SECONDS = float(os.getenv("SAVED_SEARCH_FANOUT_SECONDS", "2"))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "500"))
+MAX_SAVED_SEARCHES_PER_USER = int(os.getenv("MAX_SAVED_SEARCHES_PER_USER", "20"))
+
+# Size of the lat/lng grid radius searches are posted under
+GEO_CELL_DEGREES = 1.0
+KM_PER_DEGREE = 111.2
+
+# Listing fields the matcher reads
+MATCH_FIELDS = ("_id", "userId", "title", "category", "urgency", "city", "geo", "budgetMin", "budgetMax", "searchText")
+
+DUPLICATE_KEY = 11000
+
+# Posting for searches with no selective criterion
+MATCH_ALL = "*"
+
+def _value(value) -> Optional[str]:
+    return getattr(value, "value", value)
+
+def _cell(lng: float, lat: float) -> str:
+    return f"g:{math.floor(lat / GEO_CELL_DEGREES)}:{math.floor(lng / GEO_CELL_DEGREES)}"
+
+def _cells(center: List[float], radius_km: float) -> List[str]:
+    """Grid cells overlapping the bounding box of a circle"""
+    lng, lat = center
+    dlat = radius_km / KM_PER_DEGREE
+    dlng = dlat / max(math.cos(math.radians(lat)), 0.01)
+    return [
+        f"g:{row}:{column}"
+        for row in range(math.floor((lat - dlat) / GEO_CELL_DEGREES), math.floor((lat + dlat) / GEO_CELL_DEGREES) + 1)
+        for column in range(math.floor((lng - dlng) / GEO_CELL_DEGREES), math.floor((lng + dlng) / GEO_CELL_DEGREES) + 1)
+    ]
+
+def search_keys(search: dict) -> List[str]:
+    """The posting keys a saved search is filed under"""
+    if search.get("terms"):
+        # The longest term is usually the rarest
+        return [f"t:{max(search['terms'], key=len)}"]
+    if search.get("center"):
+        return _cells(search["center"], search["radiusKm"])
+    if search.get("city"):
+        return [f"c:{search['city']}"]
+    if search.get("category"):
+        return [f"k:{_value(search['category'])}"]
+    if search.get("urgency"):
+        return [f"u:{_value(search['urgency'])}"]
+    return [MATCH_ALL]
+
+def _listing_terms(listing: dict) -> Set[str]:
+    terms: Set[str] = set()
+    for text in (listing.get("searchText") or {}).values():
+        terms.update(text.split())
+    return terms
+
+def listing_keys(listing: dict, terms: Set[str]) -> List[str]:
+    """The posting keys to look up for a listing"""
+    keys = [f"t:{term}" for term in terms]
+    if listing.get("city"):
+        keys.append(f"c:{listing['city']}")
+    if listing.get("geo"):
+        keys.append(_cell(*listing["geo"]["coordinates"]))
+    keys += [f"k:{_value(listing['category'])}", f"u:{_value(listing['urgency'])}", MATCH_ALL]
+    return keys
+
+def matches(search: dict, listing: dict, terms: Set[str]) -> bool:
+    """Whether a listing meets every criterion of a saved search, as the feed filters would"""
+    if search.get("category") and _value(search["category"]) != _value(listing["category"]):
+        return False
+    if search.get("urgency") and _value(search["urgency"]) != _value(listing["urgency"]):
+        return False
+    # Unlike feed search, which ranks any-term matches, every keyword must appear
+    if not terms.issuperset(search.get("terms") or ()):
+        return False
+    if search.get("center"):
+        if not listing.get("geo") or distance_km(search["center"], listing["geo"]["coordinates"]) > search["radiusKm"]:
+            return False
+    elif search.get("city") and search["city"] != listing.get("city"):
+        return False
+    # Budget ranges must overlap, see routes.listings.build_budget_query
+    if search.get("budgetMin") is not None:
+        if listing.get("budgetMax") is None or listing["budgetMax"] < search["budgetMin"]:
+            return False
+    if search.get("budgetMax") is not None:
+        if listing.get("budgetMin") is None or listing["budgetMin"] > search["budgetMax"]:
+            return False
+    return True
+
+class SavedSearchIndex:
+    """Inverted index from posting keys to saved searches"""
+
+    def __init__(self):
+        self._searches: Dict[str, dict] = {}
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._searches)
+
+    def add(self, search: dict):
+        self.remove(search["_id"])
+        self._searches[search["_id"]] = search
+        for key in search_keys(search):
+            self._postings[key].add(search["_id"])
+
+    def remove(self, search_id: str):
+        search = self._searches.pop(search_id, None)
+        if search is None:
+            return
+        for key in search_keys(search):
+            posting = self._postings.get(key)
+            if posting is not None:
+                posting.discard(search_id)
+                if not posting:
+                    del self._postings[key]
+
+    def match(self, listing: dict) -> List[dict]:
+        """Saved searches the listing matches, other than its owner's"""
+        terms = _listing_terms(listing)
+        candidates: Set[str] = set()
+        for key in listing_keys(listing, terms):
+            candidates.update(self._postings.get(key, ()))
+        found = []
+        for search_id in candidates:
+            search = self._searches[search_id]
+            if search["userId"] != listing["userId"] and matches(search, listing, terms):
+                found.append(search)
+        return found
+
+    def stats(self) -> dict:
+        return {
+            "searches": len(self._searches),
+            "postings": len(self._postings),
+            "matchAll": len(self._postings.get(MATCH_ALL, ())),
+        }
+
+class SavedSearchMatcher:
+    def __init__(self, reload_interval: float, fanout_interval: float):
+        self.index = SavedSearchIndex()
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._pending: List[dict] = []
+        # Changes made while a reload is reading, replayed onto its result
+        self._changes: Optional[List[Callable[[SavedSearchIndex], None]]] = None
+        self.reloaded_at: Optional[datetime] = None
+        self.notified = 0
+        self._reload_task = PeriodicTask("saved-search-reload", reload_interval, self._reload_job)
+        self._fanout_task = PeriodicTask("saved-search-fanout", fanout_interval, self.fan_out, run_on_stop=True)
+
+    async def reload(self, db: AsyncIOMotorDatabase):
+        """Rebuild the index from the database"""
+        index = SavedSearchIndex()
+        self._changes = []
+        try:
+            async for search in db.saved_searches.find({}):
+                index.add(search)
+            for change in self._changes:
+                change(index)
+        finally:
+            self._changes = None
+        self.index = index
+        self._loaded = True
+        self.reloaded_at = datetime.utcnow()
+
+    async def ensure_loaded(self, db: AsyncIOMotorDatabase):
+        """Load the index on first use; concurrent callers share one query"""
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self.reload(db)
+
+    def _apply(self, change: Callable[[SavedSearchIndex], None]):
+        change(self.index)
+        if self._changes is not None:
+            self._changes.append(change)
+
+    def add(self, search: dict):
+        self._apply(lambda index: index.add(search))
+
+    def remove(self, search_id: str):
+        self._apply(lambda index: index.remove(search_id))
+
+    def enqueue(self, listing: dict):
+        """Queue a new listing for matching"""
+        self._pending.append({field: listing[field] for field in MATCH_FIELDS if field in listing})
+        self._fanout_task.wake()
+
+    async def fan_out(self) -> int:
+        """Match queued listings and notify; returns the notifications written"""
+        if not self._pending or database.database is None:
+            return 0
+        db = database.database
+        await self.ensure_loaded(db)
+
+        listings, self._pending = self._pending, []
+        written = 0
+        for listing in listings:
+            written += await self._notify(db, listing, self.index.match(listing))
+            # Let request handlers run between listings
+            await asyncio.sleep(0)
+        self.notified += written
+        return written
+
+    async def _notify(self, db: AsyncIOMotorDatabase, listing: dict, found: Iterable[dict]) -> int:
+        # One notification per seller, however many of their searches matched
+        by_user: Dict[str, List[str]] = defaultdict(list)
+        for search in found:
+            by_user[search["userId"]].append(search["_id"])
+        if not by_user:
+            return 0
+
+        notifications = [
+            NotificationInDB(userId=user_id, listingId=listing["_id"], savedSearchIds=search_ids).dict(by_alias=True)
+            for user_id, search_ids in by_user.items()
+        ]
+        notified: List[str] = []
+        for start in range(0, len(notifications), NOTIFICATION_BATCH_SIZE):
+            batch = notifications[start:start + NOTIFICATION_BATCH_SIZE]
+            duplicates: Set[int] = set()
+            try:
+                await db.notifications.insert_many(batch, ordered=False)
+            except BulkWriteError as exc:
+                # A retried or concurrent run already notified these sellers
+                errors = exc.details.get("writeErrors", [])
+                if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                    raise
+                duplicates = {error["index"] for error in errors}
+            notified += [doc["userId"] for index, doc in enumerate(batch) if index not in duplicates]
+
+        if notified:
+            event = {"listingId": listing["_id"], "title": listing.get("title"), "category": _value(listing["category"])}
+            await hub.publish(notified, LISTING_MATCH, orjson.dumps(event).decode())
+        return len(notified)
+
+    async def _reload_job(self):
+        if database.database is not None:
+            await self.reload(database.database)
+
+    def stats(self) -> dict:
+        return {
+            **self.index.stats(),
+            "loaded": self._loaded,
+            "pending": len(self._pending),
+            "notified": self.notified,
+            "reloadedAt": self.reloaded_at.isoformat() if self.reloaded_at else None,
+        }
+
+    def start(self):
+        self._reload_task.start()
+        self._fanout_task.start()
+
+    async def stop(self):
+        await self._reload_task.stop()
+        await self._fanout_task.stop()
+
+saved_search_matcher = SavedSearchMatcher(SAVED_SEARCH_RELOAD_SECONDS, SAVED_SEARCH_FANOUT_SECONDS)
@@ -0,0 +1,86 @@
+"""Turkish-aware tokenization for listing search.
+
+Listings carry a ``searchText`` sub-document holding pre-normalized
+tokens for the title, description and location. A MongoDB text index with
+``default_language: "none"`` is built over it, so the database does no
+linguistic processing of its own: folding and stemming happen here, the
+same way at write time and at query time.
+"""
+import re
+from typing import Iterable, List, Optional
+
+SEARCH_FIELDS = ("title", "description", "location")
+
+# Relative weight of each field in the text score
+SEARCH_WEIGHTS = {"title": 5, "location": 3, "description": 1}
+
+_FOLD_TABLE = str.maketrans({
+    "ı": "i", "ş": "s", "ğ": "g", "ç": "c", "ö": "o", "ü": "u",
+    "â": "a", "î": "i", "û": "u",
+})
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset({
+    "ve", "ile", "veya", "ya", "da", "de", "ki", "mi", "bir", "bu", "su", "o",
+    "icin", "gibi", "cok", "en", "daha", "olan", "olarak", "olsun", "var",
+    "yok", "ama", "ise", "tl",
+})
+
+# Inflectional suffixes in folded form, longest first. Stripping is
+# deliberately light: the same rules run on documents and queries, so
+# consistency matters more than linguistic accuracy.
+_SUFFIXES = (
+    "lerinden", "larindan", "lerinde", "larinda", "lerini", "larini",
+    "leri", "lari", "ler", "lar",
+    "daki", "deki", "taki", "teki",
+    "dan", "den", "tan", "ten",
+    "nin", "nun", "in", "un",
+    "da", "de", "ta", "te",
+    "yi", "yu", "ya", "ye", "si", "su",
+    "i", "u", "a", "e",
+)
+
+MIN_STEM_LENGTH = 4
+
+def fold(text: str) -> str:
+    """Lowercase with Turkish casing rules and strip diacritics"""
+    # Python lowercases "İ" to "i" + combining dot, so handle both capital I's first
+    text = text.replace("İ", "i").replace("I", "ı")
+    return text.lower().translate(_FOLD_TABLE)
+
+def stem(token: str) -> str:
+    if token.isdigit():
+        return token
+    for _ in range(2):
+        for suffix in _SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LENGTH:
+                token = token[:-len(suffix)]
+                break
+        else:
+            break
+    return token
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Fold, split and stem ``text`` into index terms"""
+    if not text:
+        return []
+    return [
+        stem(token)
+        for token in _TOKEN_RE.findall(fold(text))
+        if token not in STOPWORDS
+    ]
+
+def _join(tokens: Iterable[str]) -> str:
+    return " ".join(tokens)
+
+def build_search_text(listing: dict) -> dict:
+    """Build the ``searchText`` sub-document stored on a listing"""
+    return {field: _join(tokenize(listing.get(field))) for field in SEARCH_FIELDS}
+
+def build_search_query(search: str) -> Optional[dict]:
+    """Translate a user query into a ``$text`` filter, or None if nothing is searchable"""
+    terms = list(dict.fromkeys(tokenize(search)))
+    if not terms:
+        return None
+    return {"$text": {"$search": _join(terms)}}
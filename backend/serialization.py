@@ -0,0 +1,81 @@
+"""Response serialization for documents produced by our own pipelines.
+
+Handlers used to build ``Model(**doc)`` objects that FastAPI then validated
+and serialized a second time through ``response_model``. Documents coming
+out of our queries and hydrators already have the response shape, so by
+default they are only narrowed to the model's fields (filling in defaults
+for fields older documents lack) and encoded straight to bytes with
+orjson. Handlers return the finished ``Response``, which FastAPI passes
+through untouched; ``response_model`` stays on the routes for the OpenAPI
+schema.
+
+``TRUSTED_SERIALIZATION=0`` switches back to validating every document
+through its model, e.g. while debugging a suspected shape mismatch.
+"""
+import os
+from typing import Dict, List, Optional, Type, Union
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+from models import (
+    ListingResponse,
+    ListingPartialResponse,
+    MessageResponse,
+    ConversationResponse,
+    FavoriteResponse,
+    SavedSearchResponse,
+    NotificationResponse
+)
+
+TRUSTED_SERIALIZATION = os.getenv("TRUSTED_SERIALIZATION", "1") != "0"
+
+_REQUIRED = object()
+
+Content = Union[dict, List[dict]]
+
+class Serializer:
+    """Render documents shaped like ``model`` into a JSON response body"""
+
+    def __init__(self, model: Type[BaseModel], exclude_unset: bool = False):
+        self.model = model
+        self.exclude_unset = exclude_unset
+        self._fields = [
+            (
+                field.alias or name,
+                _REQUIRED if field.is_required() else field.get_default(call_default_factory=True)
+            )
+            for name, field in model.model_fields.items()
+        ]
+
+    def shape(self, doc: dict) -> dict:
+        """Keep the model's fields, without validating their values"""
+        if self.exclude_unset:
+            return {key: doc[key] for key, _ in self._fields if key in doc}
+        shaped = {}
+        for key, default in self._fields:
+            value = doc.get(key, default)
+            if value is not _REQUIRED:
+                shaped[key] = value
+        return shaped
+
+    def validate(self, doc: dict) -> dict:
+        return self.model(**doc).model_dump(by_alias=True, exclude_unset=self.exclude_unset)
+
+    def render(self, content: Content, trusted: Optional[bool] = None) -> bytes:
+        if trusted is None:
+            trusted = TRUSTED_SERIALIZATION
+        convert = self.shape if trusted else self.validate
+        if isinstance(content, list):
+            return orjson.dumps([convert(doc) for doc in content])
+        return orjson.dumps(convert(content))
+
+    def response(self, content: Content, headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(content=self.render(content), media_type="application/json", headers=headers)
+
+listing_serializer = Serializer(ListingResponse)
+listing_page_serializer = Serializer(ListingPartialResponse, exclude_unset=True)
+message_serializer = Serializer(MessageResponse)
+conversation_serializer = Serializer(ConversationResponse)
+favorite_serializer = Serializer(FavoriteResponse)
+saved_search_serializer = Serializer(SavedSearchResponse)
+notification_serializer = Serializer(NotificationResponse)
@@ -1,15 +1,35 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import logging
+import time
 from pathlib import Path
 import os
 
 # Import database functions
-from database import connect_to_mongo, close_mongo_connection
+from database import connect_to_mongo, close_mongo_connection, MONGO_MAX_POOL_SIZE
+import database
+
+from pagination import NEXT_CURSOR_HEADER
+from auth import user_cache, shutdown_password_pool, password_pool_stats
+from cache import feed_cache
+from view_buffer import view_buffer
+from user_stats import reconcile_task as user_stats_reconcile_task
+from realtime import hub
+from listing_purge import purge_task as listing_purge_task
+from listing_expiry import expiry_task as listing_expiry_task
+from trending import trending_task
+from migrations import run_migrations, backfill_task
+from facets import facet_counts
+from saved_searches import saved_search_matcher
+from metrics import registry as metrics_registry, bind_route, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from db_metrics import pool_stats
+from http_metrics import MetricsMiddleware, loop_lag_monitor
 
 # Import routers
-from routes import auth, users, listings, messages, favorites
+from routes import auth, users, listings, messages, favorites, saved_searches, notifications
 
 # Configure logging
 logging.basicConfig(
@@ -18,15 +38,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Readiness thresholds for /api/health
+HEALTH_PING_TIMEOUT_SECONDS = float(os.getenv("HEALTH_PING_TIMEOUT_SECONDS", "2"))
+HEALTH_MAX_POOL_SATURATION = float(os.getenv("HEALTH_MAX_POOL_SATURATION", "0.9"))
+HEALTH_MAX_LOOP_LAG_SECONDS = float(os.getenv("HEALTH_MAX_LOOP_LAG_SECONDS", "1"))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up hemensatbana.com backend...")
     await connect_to_mongo()
     logger.info("Connected to MongoDB")
+    applied = await run_migrations(database.database)
+    if applied:
+        logger.info("Applied migrations: %s", ", ".join(applied))
+    # Data backfills run in the background instead of delaying startup
+    backfill_task.start()
+    backfill_task.wake()
+    view_buffer.start()
+    user_stats_reconcile_task.start()
+    listing_purge_task.start()
+    listing_expiry_task.start()
+    trending_task.start()
+    facet_counts.start()
+    saved_search_matcher.start()
+    loop_lag_monitor.start()
+    await hub.start()
     yield
     # Shutdown
     logger.info("Shutting down...")
+    await hub.stop()
+    await loop_lag_monitor.stop()
+    await saved_search_matcher.stop()
+    await facet_counts.stop()
+    await trending_task.stop()
+    await listing_expiry_task.stop()
+    await listing_purge_task.stop()
+    await user_stats_reconcile_task.stop()
+    await view_buffer.stop()
+    await backfill_task.stop()
+    shutdown_password_pool()
     await close_mongo_connection()
     logger.info("Disconnected from MongoDB")
 
@@ -35,7 +86,8 @@ app = FastAPI(
     title="Hemensatbana.com API",
     description="Turkey's first reverse marketplace API where buyers post requests and sellers contact them",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    dependencies=[Depends(bind_route)]
 )
 
 # Add CORS middleware
@@ -45,7 +97,9 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Include routers with /api prefix
 app.include_router(auth.router, prefix="/api")
@@ -53,15 +107,57 @@ app.include_router(users.router, prefix="/api")
 app.include_router(listings.router, prefix="/api")
 app.include_router(messages.router, prefix="/api")
 app.include_router(favorites.router, prefix="/api")
+app.include_router(saved_searches.router, prefix="/api")
+app.include_router(notifications.router, prefix="/api")
 
-# Health check endpoint
+async def _mongo_check() -> dict:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(database.database.command("ping"), timeout=HEALTH_PING_TIMEOUT_SECONDS)
+    except Exception as exc:
+        return {"ok": False, "error": type(exc).__name__}
+    return {"ok": True, "latencyMs": round((time.perf_counter() - started) * 1000, 2)}
+
+def _pool_check() -> dict:
+    servers = {
+        address: {**stats, "saturation": round(stats["checkedOut"] / MONGO_MAX_POOL_SIZE, 3)}
+        for address, stats in pool_stats().items()
+    }
+    saturated = any(stats["saturation"] >= HEALTH_MAX_POOL_SATURATION for stats in servers.values())
+    return {"ok": not saturated, "maxPoolSize": MONGO_MAX_POOL_SIZE, "servers": servers}
+
+# Health check endpoint; 503 tells the load balancer to drain this worker
 @app.get("/api/health")
 async def health_check():
-    return {
-        "status": "healthy",
-        "service": "hemensatbana.com",
-        "version": "1.0.0"
+    lag = loop_lag_monitor.lag
+    checks = {
+        "mongo": await _mongo_check(),
+        "pool": _pool_check(),
+        "eventLoop": {"ok": lag < HEALTH_MAX_LOOP_LAG_SECONDS, "lagSeconds": round(lag, 4)},
     }
+    healthy = all(check["ok"] for check in checks.values())
+    return JSONResponse(
+        status_code=200 if healthy else 503,
+        content={
+            "status": "healthy" if healthy else "unhealthy",
+            "service": "hemensatbana.com",
+            "version": "1.0.0",
+            "checks": checks,
+            "caches": {
+                "users": user_cache.stats(),
+                "feed": feed_cache.stats(),
+                "facets": facet_counts.stats(),
+                "savedSearches": saved_search_matcher.stats()
+            },
+            "passwordPool": password_pool_stats(),
+            "realtime": hub.stats()
+        }
+    )
+
+# Prometheus scrape endpoint; per worker
+@app.get("/api/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
 # Root endpoint
 @app.get("/api/")
@@ -0,0 +1,95 @@
+"""Background tasks that run inside each API worker.
+
+Started and stopped from the ``lifespan`` hook in ``server.py``. Jobs that
+must not run in several workers at once take a lease in ``job_runs``
+first (see ``claim_run``).
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from metrics import current_route
+
+logger = logging.getLogger(__name__)
+
+class PeriodicTask:
+    """Run ``fn`` every ``interval`` seconds, or sooner when woken"""
+
+    def __init__(
+        self,
+        name: str,
+        interval: float,
+        fn: Callable[[], Awaitable[object]],
+        run_on_stop: bool = False
+    ):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.run_on_stop = run_on_stop
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop(), name=self.name)
+
+    def wake(self):
+        """Run the next iteration now instead of waiting for the interval"""
+        self._wakeup.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.run_on_stop:
+            await self._run_once()
+
+    async def _run_once(self):
+        try:
+            await self.fn()
+        except Exception:
+            logger.exception("Background task %s failed", self.name)
+
+    async def _loop(self):
+        current_route.set(f"task:{self.name}")
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._run_once()
+
+async def claim_run(db: AsyncIOMotorDatabase, name: str, lease_seconds: float) -> Optional[str]:
+    """Lease job ``name`` for ``lease_seconds``; returns the lease token, or None if another worker holds it"""
+    now = datetime.utcnow()
+    token = str(uuid.uuid4())
+    try:
+        await db.job_runs.update_one(
+            {"_id": name, "leasedUntil": {"$not": {"$gt": now}}},
+            {"$set": {"leasedUntil": now + timedelta(seconds=lease_seconds), "owner": token, "ranAt": now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Leased elsewhere; the upsert collided with the existing record
+        return None
+    return token
+
+async def release_run(db: AsyncIOMotorDatabase, name: str, token: str, hold_seconds: float = 0):
+    """End a lease early, keeping the job for ``hold_seconds`` more; a lease taken over since is left alone"""
+    await db.job_runs.update_one(
+        {"_id": name, "owner": token},
+        {"$set": {"leasedUntil": datetime.utcnow() + timedelta(seconds=hold_seconds)}}
+    )
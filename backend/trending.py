@@ -0,0 +1,152 @@
+"""Time-decayed "trending" ranking of listings, precomputed in the background.
+
+Views, messages and favorites are counted per listing in hourly buckets
+in ``listing_activity``. Views come from the view buffer's bulk flush;
+messages and favorites are counted as they are created. A periodic job
+folds the buckets of the last ``TRENDING_WINDOW_HOURS`` into one score
+per listing with a ``$group`` on the server. Each event is weighted by
+kind and halved every ``TRENDING_HALF_LIFE_HOURS``. The scores are
+written to ``listings.trendingScore`` with unordered ``bulk_write`` batches.
+``sort_by=trending`` then reads a partial index on active listings
+(see ``indexes.py``), so the feed costs the same as ``newest``.
+
+The job is leased through ``tasks.claim_run`` so that only one worker
+per interval does the work. Each bucket carries its own ``expiresAt`` and
+is dropped by a TTL index once it has left the window.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import database
+from models import ListingStatus
+from tasks import PeriodicTask, claim_run
+
+logger = logging.getLogger(__name__)
+
+TRENDING_INTERVAL_SECONDS = float(os.getenv("TRENDING_INTERVAL_SECONDS", "600"))
+TRENDING_WINDOW_HOURS = int(os.getenv("TRENDING_WINDOW_HOURS", "72"))
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24"))
+TRENDING_BATCH_SIZE = int(os.getenv("TRENDING_BATCH_SIZE", "500"))
+
+# Score of one event of each kind in the current hour
+ACTIVITY_WEIGHTS = {"views": 1.0, "favorites": 3.0, "messages": 5.0}
+
+def activity_hour(at: datetime) -> datetime:
+    return at.replace(minute=0, second=0, microsecond=0)
+
+def activity_bucket(listing_id: str, hour: datetime, counts: Dict[str, int]) -> dict:
+    """A new bucket document holding ``counts`` for ``hour``"""
+    return {
+        "_id": f"{listing_id}:{hour:%Y%m%d%H}",
+        "listingId": listing_id,
+        "hour": hour,
+        "expiresAt": hour + timedelta(hours=TRENDING_WINDOW_HOURS + 1),
+        **counts,
+    }
+
+def _bucket_update(listing_id: str, hour: datetime, counts: Dict[str, int]) -> Tuple[dict, dict]:
+    bucket = activity_bucket(listing_id, hour, {})
+    bucket_id = bucket.pop("_id")
+    return {"_id": bucket_id}, {"$inc": counts, "$setOnInsert": bucket}
+
+def activity_update(listing_id: str, hour: datetime, counts: Dict[str, int]) -> UpdateOne:
+    """Upsert adding ``counts`` to a listing's bucket for ``hour``, for bulk writes"""
+    return UpdateOne(*_bucket_update(listing_id, hour, counts), upsert=True)
+
+async def record_activity(db: AsyncIOMotorDatabase, listing_id: str, **counts: int):
+    """Count messages or favorites of a listing towards its trending score"""
+    query, update = _bucket_update(listing_id, activity_hour(datetime.utcnow()), counts)
+    await db.listing_activity.update_one(query, update, upsert=True)
+
+def decay(age_hours: float) -> float:
+    return 0.5 ** (max(age_hours, 0.0) / TRENDING_HALF_LIFE_HOURS)
+
+def bucket_score(bucket: dict, now: datetime) -> float:
+    weight = sum(bucket.get(kind, 0) * factor for kind, factor in ACTIVITY_WEIGHTS.items())
+    # Buckets are scored from the middle of their hour
+    return weight * decay((now - bucket["hour"]).total_seconds() / 3600 - 0.5)
+
+def _bucket_score_expression(now: datetime) -> dict:
+    """``bucket_score`` as an aggregation expression over a bucket document"""
+    weight = {"$add": [
+        {"$multiply": [{"$ifNull": [f"${kind}", 0]}, factor]}
+        for kind, factor in ACTIVITY_WEIGHTS.items()
+    ]}
+    age_hours = {"$subtract": [{"$divide": [{"$subtract": [now, "$hour"]}, 3600 * 1000]}, 0.5]}
+    decayed = {"$pow": [0.5, {"$divide": [{"$max": [age_hours, 0]}, TRENDING_HALF_LIFE_HOURS]}]}
+    return {"$multiply": [weight, decayed]}
+
+async def _write_scores(db: AsyncIOMotorDatabase, scores: Iterable[Tuple[str, float]]) -> int:
+    written = 0
+    operations = []
+    for listing_id, score in scores:
+        operations.append(UpdateOne(
+            {"_id": listing_id, "status": ListingStatus.ACTIVE},
+            {"$set": {"trendingScore": score}}
+        ))
+        if len(operations) >= TRENDING_BATCH_SIZE:
+            result = await db.listings.bulk_write(operations, ordered=False)
+            written += result.modified_count
+            operations = []
+            # Let request handlers run between batches
+            await asyncio.sleep(0)
+
+    if operations:
+        result = await db.listings.bulk_write(operations, ordered=False)
+        written += result.modified_count
+
+    return written
+
+async def compute_trending(db: AsyncIOMotorDatabase, now: Optional[datetime] = None) -> int:
+    """Rescore listings with activity in the window; returns the listings updated"""
+    now = now or datetime.utcnow()
+    since = activity_hour(now) - timedelta(hours=TRENDING_WINDOW_HOURS)
+
+    # The decayed sum is computed by the server; only one row per listing comes back
+    pipeline = [
+        {"$match": {"hour": {"$gte": since}}},
+        {"$group": {"_id": "$listingId", "score": {"$sum": _bucket_score_expression(now)}}},
+    ]
+    scores: Dict[str, float] = {}
+    async for row in db.listing_activity.aggregate(pipeline):
+        scores[row["_id"]] = row["score"]
+
+    # Listings that dropped out of the window go back to zero
+    stale = db.listings.find(
+        {"status": ListingStatus.ACTIVE, "trendingScore": {"$gt": 0}},
+        {"_id": 1}
+    )
+    async for listing in stale:
+        scores.setdefault(listing["_id"], 0.0)
+
+    return await _write_scores(db, ((listing_id, round(score, 4)) for listing_id, score in scores.items()))
+
+async def backfill_trending_score(db: AsyncIOMotorDatabase) -> int:
+    """Start listings created before trending at zero, so keyset cursors never see a null score"""
+    updated = 0
+    ids = []
+    async for listing in db.listings.find({"trendingScore": {"$exists": False}}, {"_id": 1}):
+        ids.append(listing["_id"])
+        if len(ids) >= TRENDING_BATCH_SIZE:
+            result = await db.listings.update_many({"_id": {"$in": ids}}, {"$set": {"trendingScore": 0.0}})
+            updated += result.modified_count
+            ids = []
+
+    if ids:
+        result = await db.listings.update_many({"_id": {"$in": ids}}, {"$set": {"trendingScore": 0.0}})
+        updated += result.modified_count
+
+    return updated
+
+async def _trending_job():
+    if database.database is not None:
+        # The lease is not released, so the next run is at least half an interval away
+        if await claim_run(database.database, "trending", TRENDING_INTERVAL_SECONDS / 2):
+            updated = await compute_trending(database.database)
+            logger.info("Rescored %d trending listings", updated)
+
+trending_task = PeriodicTask("trending", TRENDING_INTERVAL_SECONDS, _trending_job)
@@ -0,0 +1,174 @@
+"""Materialized per-user dashboard statistics.
+
+One ``user_stats`` document per user, keyed by user id, is kept current by
+``$inc`` updates from the listing, message and favorite write paths, so
+``/api/users/stats`` is a single primary-key read. Increments never upsert:
+a user's document is seeded from real counts on first read, which avoids
+creating half-initialized counters, and a periodic reconcile repairs any
+drift (lost increments, writes from older code).
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from collections import Counter, defaultdict
+from typing import Dict, List
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import database
+from tasks import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+USER_STATS_RECONCILE_SECONDS = float(os.getenv("USER_STATS_RECONCILE_SECONDS", "3600"))
+RECONCILE_BATCH_SIZE = 500
+
+STATUS_FIELDS = {
+    "active": "activeListings",
+    "completed": "completedListings",
+    "expired": "expiredListings",
+}
+
+# Tombstoned listings (see listing_purge) no longer count
+LIVE_LISTING = {"deletedAt": {"$exists": False}}
+
+COUNTER_FIELDS = (
+    "totalListings",
+    "activeListings",
+    "completedListings",
+    "expiredListings",
+    "receivedMessages",
+    "sentMessages",
+    "favoritesCount",
+    "unreadMessages",
+)
+
+def status_field(listing_status) -> str:
+    return STATUS_FIELDS[getattr(listing_status, "value", listing_status)]
+
+async def increment_many(db: AsyncIOMotorDatabase, deltas: Dict[str, Dict[str, int]]):
+    """Apply ``{user_id: {field: delta}}`` in one unordered bulk write"""
+    operations = [
+        UpdateOne({"_id": user_id}, {"$inc": fields})
+        for user_id, fields in deltas.items()
+        if fields
+    ]
+    if operations:
+        await db.user_stats.bulk_write(operations, ordered=False)
+
+async def increment(db: AsyncIOMotorDatabase, user_id: str, **fields: int):
+    await db.user_stats.update_one({"_id": user_id}, {"$inc": fields})
+
+async def record_listing_removed(db: AsyncIOMotorDatabase, listing: dict):
+    """Take a (tombstoned) listing out of its owner's listing counters"""
+    await increment(db, listing["userId"], **{"totalListings": -1, status_field(listing["status"]): -1})
+
+async def record_messages_removed(db: AsyncIOMotorDatabase, messages: List[dict]):
+    """Count purged messages out of their senders' and receivers' counters"""
+    deltas: Dict[str, Counter] = defaultdict(Counter)
+    for message in messages:
+        deltas[message["senderId"]]["sentMessages"] -= 1
+        deltas[message["receiverId"]]["receivedMessages"] -= 1
+        if not message.get("isRead"):
+            deltas[message["receiverId"]]["unreadMessages"] -= 1
+    await increment_many(db, {user_id: dict(fields) for user_id, fields in deltas.items()})
+
+async def record_favorites_removed(db: AsyncIOMotorDatabase, favorites: List[dict]):
+    deltas = Counter(favorite["userId"] for favorite in favorites)
+    await increment_many(db, {user_id: {"favoritesCount": -count} for user_id, count in deltas.items()})
+
+async def compute_user_stats(db: AsyncIOMotorDatabase, user_id: str) -> dict:
+    """Count everything from the source collections, concurrently"""
+    listings = {"userId": user_id, **LIVE_LISTING}
+    counts = await asyncio.gather(
+        db.listings.count_documents(listings),
+        db.listings.count_documents({**listings, "status": "active"}),
+        db.listings.count_documents({**listings, "status": "completed"}),
+        db.listings.count_documents({**listings, "status": "expired"}),
+        db.messages.count_documents({"receiverId": user_id}),
+        db.messages.count_documents({"senderId": user_id}),
+        db.favorites.count_documents({"userId": user_id}),
+        db.messages.count_documents({"receiverId": user_id, "isRead": False}),
+    )
+    return dict(zip(COUNTER_FIELDS, counts))
+
+async def get_user_stats(db: AsyncIOMotorDatabase, user_id: str) -> dict:
+    stats = await db.user_stats.find_one({"_id": user_id})
+    # Also seeds counters added after the document was created
+    if stats is None or any(field not in stats for field in COUNTER_FIELDS):
+        stats = await compute_user_stats(db, user_id)
+        await db.user_stats.update_one(
+            {"_id": user_id},
+            {"$set": {**stats, "reconciledAt": datetime.utcnow()}},
+            upsert=True
+        )
+    return stats
+
+async def get_unread_count(db: AsyncIOMotorDatabase, user_id: str) -> int:
+    stats = await db.user_stats.find_one({"_id": user_id}, {"unreadMessages": 1})
+    if stats is None or "unreadMessages" not in stats:
+        stats = await get_user_stats(db, user_id)
+    return max(stats["unreadMessages"], 0)
+
+async def _grouped_counts(collection, match: dict, key: str) -> Dict[str, int]:
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": key, "count": {"$sum": 1}}},
+    ]
+    return {row["_id"]: row["count"] async for row in collection.aggregate(pipeline)}
+
+async def _reconcile_batch(db: AsyncIOMotorDatabase, user_ids: List[str]) -> int:
+    listings_by_status: Dict[str, Dict[str, int]] = {}
+    pipeline = [
+        {"$match": {"userId": {"$in": user_ids}, **LIVE_LISTING}},
+        {"$group": {"_id": {"userId": "$userId", "status": "$status"}, "count": {"$sum": 1}}},
+    ]
+    async for row in db.listings.aggregate(pipeline):
+        listings_by_status.setdefault(row["_id"]["userId"], {})[row["_id"]["status"]] = row["count"]
+
+    received, sent, favorites, unread = await asyncio.gather(
+        _grouped_counts(db.messages, {"receiverId": {"$in": user_ids}}, "$receiverId"),
+        _grouped_counts(db.messages, {"senderId": {"$in": user_ids}}, "$senderId"),
+        _grouped_counts(db.favorites, {"userId": {"$in": user_ids}}, "$userId"),
+        _grouped_counts(db.messages, {"receiverId": {"$in": user_ids}, "isRead": False}, "$receiverId"),
+    )
+
+    now = datetime.utcnow()
+    operations = []
+    for user_id in user_ids:
+        by_status = listings_by_status.get(user_id, {})
+        stats = {
+            "totalListings": sum(by_status.values()),
+            "receivedMessages": received.get(user_id, 0),
+            "sentMessages": sent.get(user_id, 0),
+            "favoritesCount": favorites.get(user_id, 0),
+            "unreadMessages": unread.get(user_id, 0),
+            "reconciledAt": now,
+        }
+        for value, field in STATUS_FIELDS.items():
+            stats[field] = by_status.get(value, 0)
+        operations.append(UpdateOne({"_id": user_id}, {"$set": stats}))
+
+    result = await db.user_stats.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+async def reconcile_user_stats(db: AsyncIOMotorDatabase) -> int:
+    """Recompute every materialized stats document in batches"""
+    repaired = 0
+    batch: List[str] = []
+    async for doc in db.user_stats.find({}, {"_id": 1}):
+        batch.append(doc["_id"])
+        if len(batch) >= RECONCILE_BATCH_SIZE:
+            repaired += await _reconcile_batch(db, batch)
+            batch = []
+    if batch:
+        repaired += await _reconcile_batch(db, batch)
+    return repaired
+
+async def _reconcile_job():
+    if database.database is not None:
+        repaired = await reconcile_user_stats(database.database)
+        if repaired:
+            logger.info("Reconciled user stats for %d users", repaired)
+
+reconcile_task = PeriodicTask("user-stats-reconcile", USER_STATS_RECONCILE_SECONDS, _reconcile_job)
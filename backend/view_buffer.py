@@ -0,0 +1,86 @@
+"""Write-behind buffering of listing view counts.
+
+Detail-page views are aggregated per listing in memory and written with
+one unordered ``bulk_write`` per flush, so write volume follows the number
+of distinct listings viewed rather than the number of page views.
+The same flush adds the views to each listing's hourly bucket in
+``listing_activity``, which the trending score is computed from.
+Increments still buffered when a worker dies are lost; view counts are
+best-effort by design.
+"""
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import database
+from tasks import PeriodicTask
+from trending import activity_hour, activity_update
+
+logger = logging.getLogger(__name__)
+
+VIEW_FLUSH_INTERVAL_SECONDS = float(os.getenv("VIEW_FLUSH_INTERVAL_SECONDS", "5"))
+VIEW_FLUSH_MAX_PENDING = int(os.getenv("VIEW_FLUSH_MAX_PENDING", "1000"))
+
+class ViewCountBuffer:
+    def __init__(self, flush_interval: float, max_pending: int):
+        self.max_pending = max_pending
+        self._pending: Counter = Counter()
+        self._task = PeriodicTask("view-flush", flush_interval, self.flush, run_on_stop=True)
+
+    def record(self, listing_id: str):
+        self._pending[listing_id] += 1
+        if len(self._pending) >= self.max_pending:
+            self._task.wake()
+
+    def pending(self, listing_id: str) -> int:
+        """Views recorded for ``listing_id`` but not yet written"""
+        return self._pending.get(listing_id, 0)
+
+    async def flush(self) -> int:
+        if not self._pending or database.database is None:
+            return 0
+
+        batch, self._pending = self._pending, Counter()
+        items = list(batch.items())
+        operations = [
+            UpdateOne({"_id": listing_id}, {"$inc": {"views": count}})
+            for listing_id, count in items
+        ]
+        error = None
+        try:
+            await database.database.listings.bulk_write(operations, ordered=False)
+        except BulkWriteError as exc:
+            # The other operations of an unordered batch were applied;
+            # retrying them would count their views twice
+            failed = {write_error["index"] for write_error in exc.details.get("writeErrors", [])}
+            self._pending.update({items[index][0]: items[index][1] for index in failed})
+            items = [item for index, item in enumerate(items) if index not in failed]
+            error = exc
+        except Exception:
+            # Put the increments back so the next flush retries them
+            self._pending.update(batch)
+            raise
+
+        hour = activity_hour(datetime.utcnow())
+        try:
+            if items:
+                await database.database.listing_activity.bulk_write(
+                    [activity_update(listing_id, hour, {"views": count}) for listing_id, count in items],
+                    ordered=False
+                )
+        except Exception:
+            # The counts are already written; a retry would count them twice
+            logger.exception("Writing view activity failed")
+        if error is not None:
+            raise error
+        return len(operations)
+
+    def start(self):
+        self._task.start()
+
+    async def stop(self):
+        await self._task.stop()
+
+view_buffer = ViewCountBuffer(VIEW_FLUSH_INTERVAL_SECONDS, VIEW_FLUSH_MAX_PENDING)
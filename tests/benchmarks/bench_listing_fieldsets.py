@@ -0,0 +1,107 @@
+"""Payload size and latency per page for the listing feed projections.
+
+Seeds listings with realistic descriptions and compares ``view=full``,
+the default ``view=summary`` (``SUMMARY_FIELDS``, description cut) and a
+narrower ``fields=`` selection. Each variant reports the fields it returned
+and its page size relative to ``view=full``:
+
+    python -m tests.benchmarks.bench_listing_fieldsets --listings 2000 --requests 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from tests.benchmarks.common import app_client, close_database, open_database, summarize
+
+from cache import feed_cache
+from geo import normalize_location
+from search import build_search_text
+
+VARIANTS = {
+    "full": {"view": "full"},
+    "summary": {},
+    "title-budget": {"fields": "title,budgetMin,budgetMax"},
+}
+
+WORDS = (
+    "arıyorum temiz kullanılmış kutulu garantili orijinal tercihen acil fiyat "
+    "pazarlık model renk teslimat kargo şehir içi elden faturalı"
+).split()
+
+async def seed(db, listings: int, description_words: int):
+    users = [
+        {"_id": str(uuid.uuid4()), "firstName": f"Kullanıcı{i}", "lastName": "Test",
+         "email": f"user{i}@example.com", "hashed_password": "x", "rating": 4.5,
+         "verified": True, "createdAt": datetime.utcnow(), "updatedAt": datetime.utcnow()}
+        for i in range(max(1, listings // 20))
+    ]
+    await db.users.insert_many(users)
+
+    now = datetime.utcnow()
+    docs = []
+    for i in range(listings):
+        doc = {
+            "_id": str(uuid.uuid4()),
+            "title": f"İlan {i} " + " ".join(random.choices(WORDS, k=5)),
+            "description": " ".join(random.choices(WORDS, k=description_words)),
+            "category": random.choice(["elektronik", "vasita", "emlak", "moda"]),
+            "location": random.choice(["İstanbul, Kadıköy", "Ankara, Çankaya", "İzmir, Konak"]),
+            "budgetMin": 1000.0, "budgetMax": 5000.0,
+            "urgency": random.choice(["acil", "bu-hafta", "bu-ay", "acil-degil"]),
+            "status": "active", "userId": random.choice(users)["_id"],
+            "views": random.randint(0, 500), "messageCount": random.randint(0, 20),
+            "createdAt": now - timedelta(minutes=i), "updatedAt": now - timedelta(minutes=i),
+        }
+        doc.update(normalize_location(doc["location"]))
+        doc["searchText"] = build_search_text(doc)
+        docs.append(doc)
+    await db.listings.insert_many(docs)
+
+async def measure(client, params: dict, requests: int, limit: int) -> dict:
+    sizes, samples, fields = [], [], set()
+    for _ in range(requests):
+        # Measure the uncached path
+        feed_cache.clear()
+        started = time.perf_counter()
+        response = await client.get("/api/listings", params={"limit": limit, **params})
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+        sizes.append(len(response.content))
+        for listing in response.json():
+            fields.update(listing)
+    return {
+        "fields": sorted(fields),
+        "bytesPerPage": round(sum(sizes) / len(sizes)),
+        "latencyMs": summarize(samples),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listings", type=int, default=2000)
+    parser.add_argument("--description-words", type=int, default=150)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    db = await open_database()
+    try:
+        await seed(db, args.listings, args.description_words)
+        async with app_client() as client:
+            results = {
+                name: await measure(client, params, args.requests, args.limit)
+                for name, params in VARIANTS.items()
+            }
+    finally:
+        await close_database()
+
+    full = results["full"]["bytesPerPage"]
+    for result in results.values():
+        result["vsFull"] = round(result["bytesPerPage"] / full, 3) if full else None
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""p99 latency of an unrelated endpoint while a login storm is running.
+
+Compares bcrypt inline on the event loop against the bounded hashing
+pool in ``auth``:
+
+    python -m tests.benchmarks.bench_login_storm --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from tests.benchmarks.common import app_client, close_database, open_database, summarize
+
+import auth
+
+EMAIL = "storm@example.com"
+PASSWORD = "storm-password"
+
+async def probe(client, stop: asyncio.Event, samples: list, interval: float):
+    while not stop.is_set():
+        # Measure from when the probe was due, so time spent waiting for a
+        # blocked event loop counts against the endpoint
+        due = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        await client.get("/api/health")
+        samples.append(time.perf_counter() - due)
+
+async def login_storm(client, logins: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses: dict = {}
+
+    async def login():
+        async with semaphore:
+            response = await client.post("/api/auth/login", json={"email": EMAIL, "password": PASSWORD})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*(login() for _ in range(logins)))
+    return statuses
+
+async def run_mode(client, mode: str, args) -> dict:
+    if mode == "inline":
+        auth.configure_password_pool(workers=0)
+    else:
+        auth.configure_password_pool(workers=args.workers, queue_limit=args.queue_limit, kind=mode)
+
+    samples: list = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(client, stop, samples, args.probe_interval))
+    started = time.perf_counter()
+    statuses = await login_storm(client, args.logins, args.concurrency)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    auth.shutdown_password_pool()
+
+    return {
+        "mode": mode,
+        "loginStatuses": statuses,
+        "stormSeconds": round(elapsed, 2),
+        "healthLatencyMs": summarize(samples),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-limit", type=int, default=64)
+    parser.add_argument("--probe-interval", type=float, default=0.01)
+    parser.add_argument("--modes", default="inline,thread")
+    args = parser.parse_args()
+
+    await open_database()
+    try:
+        async with app_client() as client:
+            await client.post("/api/auth/register", json={
+                "firstName": "Storm", "lastName": "Test", "email": EMAIL, "password": PASSWORD,
+            })
+            results = [await run_mode(client, mode, args) for mode in args.modes.split(",")]
+    finally:
+        await close_database()
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
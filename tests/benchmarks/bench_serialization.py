@@ -0,0 +1,169 @@
+"""CPU cost of rendering one response page, per endpoint shape.
+
+Compares three ways of turning the documents a handler has in hand into
+response bytes:
+
+* ``legacy``: ``Model(**doc)`` per document, then FastAPI validating and
+  serializing the result again through ``response_model``
+* ``validated``: one model validation per document, encoded with orjson
+  (``TRUSTED_SERIALIZATION=0``)
+* ``trusted``: documents narrowed to the model's fields and encoded with
+  orjson, the default
+
+No database is involved; pages are synthetic documents shaped like the
+ones our pipelines and hydrators produce:
+
+    python -m tests.benchmarks.bench_serialization --rounds 200 --page 50
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from tests.benchmarks.common import summarize
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from fieldsets import SUMMARY_FIELDS
+from serialization import (
+    Serializer,
+    conversation_serializer,
+    favorite_serializer,
+    listing_page_serializer,
+    listing_serializer,
+    message_serializer
+)
+
+def _id() -> str:
+    return str(uuid.uuid4())
+
+def user_summary(now: datetime) -> dict:
+    return {
+        "_id": _id(), "firstName": "Ayşe", "lastName": "Yılmaz", "location": "İstanbul",
+        "rating": 4.8, "verified": True, "avatar": None, "createdAt": now,
+    }
+
+def listing_doc(now: datetime, i: int, description: str) -> dict:
+    return {
+        "_id": _id(), "title": f"İkinci el bisiklet arıyorum {i}", "description": description,
+        "category": "diger", "location": "İstanbul, Kadıköy", "city": "İstanbul", "district": "Kadıköy", "budgetMin": 1500.0,
+        "budgetMax": 4000.0, "urgency": "bu-hafta", "status": "active", "userId": _id(),
+        "views": 120 + i, "messageCount": i % 7,
+        "createdAt": now - timedelta(minutes=i), "updatedAt": now - timedelta(minutes=i),
+        "user": user_summary(now),
+    }
+
+def listing_card(now: datetime, i: int, description: str) -> dict:
+    """A ``view=summary`` feed entry"""
+    doc = listing_doc(now, i, description)
+    return {"_id": doc["_id"], **{field: doc[field] for field in SUMMARY_FIELDS}}
+
+def listing_summary(now: datetime, i: int) -> dict:
+    doc = listing_doc(now, i, "")
+    for field in ("description", "updatedAt", "user"):
+        doc.pop(field)
+    return doc
+
+def message_doc(now: datetime, i: int) -> dict:
+    return {
+        "_id": _id(), "conversationId": f"{_id()}:{_id()}:{_id()}", "listingId": _id(),
+        "senderId": _id(), "receiverId": _id(), "content": "Merhaba, ilan hâlâ güncel mi? " * 3,
+        "isRead": bool(i % 2), "createdAt": now - timedelta(minutes=i),
+        "sender": user_summary(now), "listing": listing_summary(now, i),
+    }
+
+def conversation_doc(now: datetime, i: int) -> dict:
+    buyer, seller = _id(), _id()
+    return {
+        "_id": f"{_id()}:{buyer}:{seller}", "listingId": _id(), "listingTitle": f"İlan {i}",
+        "buyerId": buyer, "sellerId": seller, "participants": [buyer, seller],
+        "counterpartId": seller, "unread": {buyer: 2, seller: 0}, "unreadCount": 2,
+        "lastMessage": {"_id": _id(), "senderId": seller, "content": "Yarın uygun musunuz?",
+                        "createdAt": now},
+        "lastMessageAt": now - timedelta(minutes=i), "createdAt": now - timedelta(days=1),
+    }
+
+def favorite_doc(now: datetime, i: int) -> dict:
+    return {
+        "_id": _id(), "userId": _id(), "listingId": _id(),
+        "createdAt": now - timedelta(minutes=i), "listing": listing_summary(now, i),
+    }
+
+def endpoints(page: int):
+    now = datetime.utcnow()
+    description = "Sağlam, bakımlı ve kullanıma hazır olmalı. " * 20
+    return {
+        "GET /listings (summary)": (
+            listing_page_serializer,
+            [listing_card(now, i, description[:160]) for i in range(page)],
+        ),
+        "GET /listings/{id}": (listing_serializer, listing_doc(now, 0, description)),
+        "GET /messages": (message_serializer, [message_doc(now, i) for i in range(page)]),
+        "GET /messages/conversations": (
+            conversation_serializer,
+            [conversation_doc(now, i) for i in range(page)],
+        ),
+        "GET /favorites": (favorite_serializer, [favorite_doc(now, i) for i in range(page)]),
+    }
+
+async def render_legacy(serializer: Serializer, content) -> bytes:
+    """What handlers did before: build models, let FastAPI re-validate them"""
+    many = isinstance(content, list)
+    field = create_response_field(
+        name="response",
+        type_=List[serializer.model] if many else serializer.model
+    )
+    models = [serializer.model(**doc) for doc in content] if many else serializer.model(**content)
+    encoded = await serialize_response(
+        field=field,
+        response_content=models,
+        exclude_unset=serializer.exclude_unset,
+        is_coroutine=True
+    )
+    return JSONResponse(content=encoded).body
+
+async def time_rounds(render, rounds: int) -> dict:
+    samples = []
+    size = 0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        body = await render()
+        samples.append(time.perf_counter() - started)
+        size = len(body)
+    return {"bytes": size, "latencyMs": summarize(samples)}
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--page", type=int, default=50)
+    args = parser.parse_args()
+
+    results = {}
+    for name, (serializer, content) in endpoints(args.page).items():
+        async def legacy():
+            return await render_legacy(serializer, content)
+
+        async def validated():
+            return serializer.render(content, trusted=False)
+
+        async def trusted():
+            return serializer.render(content, trusted=True)
+
+        # Shapes must agree before timings mean anything
+        assert json.loads(await legacy()) == json.loads(await trusted()), name
+
+        results[name] = {
+            "legacy": await time_rounds(legacy, args.rounds),
+            "validated": await time_rounds(validated, args.rounds),
+            "trusted": await time_rounds(trusted, args.rounds),
+        }
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
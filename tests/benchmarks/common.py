@@ -0,0 +1,82 @@
+"""Shared helpers for the benchmark scripts.
+
+The scripts drive the FastAPI app in-process through httpx's ASGI
+transport. By default MongoDB is replaced with mongomock-motor; set
+MONGO_URL to benchmark against a real server instead. On a real server
+they write to a scratch database, ``BENCH_DB_NAME`` (default
+``<DB_NAME>_bench``), never the app's own, and drop it when they finish.
+"""
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[2] / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx
+
+import database
+
+BENCH_DB_NAME = os.environ.get("BENCH_DB_NAME", f"{database.database_name}_bench")
+
+def _patch_mongomock():
+    """Teach mongomock the aggregation operators the routes use but it lacks"""
+    from mongomock import aggregate
+
+    if getattr(aggregate._Parser, "_hemensatbana_patched", False):
+        return
+    handle_string_operator = aggregate._Parser._handle_string_operator
+
+    def _handle_string_operator(self, operator, values):
+        if operator == "$substrCP":
+            string, start, length = (self.parse(value) for value in values)
+            return (string or "")[start:start + length]
+        return handle_string_operator(self, operator, values)
+
+    aggregate._Parser._handle_string_operator = _handle_string_operator
+    aggregate._Parser._hemensatbana_patched = True
+
+async def open_database():
+    """Connect the backend's database module to Mongo or an in-memory stand-in"""
+    if os.environ.get("MONGO_URL"):
+        if BENCH_DB_NAME == database.database_name:
+            raise SystemExit(f"BENCH_DB_NAME must differ from DB_NAME ({database.database_name})")
+        # Indexes are created in the scratch database as well
+        database.database_name = BENCH_DB_NAME
+        await database.connect_to_mongo()
+        return database.database
+
+    from mongomock_motor import AsyncMongoMockClient
+    _patch_mongomock()
+    database.client = AsyncMongoMockClient()
+    database.database = database.client[database.database_name]
+    return database.database
+
+async def close_database(drop: bool = True):
+    """Disconnect, dropping the scratch database unless its data is kept for later runs"""
+    if drop and os.environ.get("MONGO_URL") and database.client is not None:
+        await database.client.drop_database(BENCH_DB_NAME)
+    await database.close_mongo_connection()
+
+def app_client() -> httpx.AsyncClient:
+    from server import app
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://benchmark")
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(samples) -> dict:
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(samples),
+        "p50": round(percentile(samples, 50) * 1000, 2),
+        "p95": round(percentile(samples, 95) * 1000, 2),
+        "p99": round(percentile(samples, 99) * 1000, 2),
+        "max": round(max(samples) * 1000, 2) if samples else 0.0,
+    }
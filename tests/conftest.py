@@ -0,0 +1,22 @@
+"""Fixtures shared by the unit tests.
+
+Unit tests never need a MongoDB server: ``db`` is a fresh in-memory
+mongomock-motor database, also installed as ``database.database`` for the
+background jobs that read it from there.
+"""
+import pytest
+
+from tests.benchmarks import common  # noqa: F401 (puts backend/ on sys.path)
+
+import database
+
+@pytest.fixture
+def db():
+    from mongomock_motor import AsyncMongoMockClient
+
+    common._patch_mongomock()
+    previous = database.client, database.database
+    database.client = AsyncMongoMockClient()
+    database.database = database.client["hemensatbana_unit"]
+    yield database.database
+    database.client, database.database = previous
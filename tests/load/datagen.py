@@ -0,0 +1,324 @@
+"""Synthetic users, listings, conversations, messages and favorites.
+
+Documents follow the ``*InDB`` models in ``backend/models.py`` plus the
+denormalized fields the app maintains (``searchText``, ``messageCount``,
+``conversationId``, the conversations collection, and ``trendingScore``
+with the activity buckets behind it), so every endpoint sees realistic
+data. Ids are derived from the document index and the
+random stream is seeded, so the same arguments always produce the same
+dataset and the load harness can address documents without loading them.
+
+Scale is driven by ``--listings`` (10k to 10M); the other collections
+follow from the per-listing ratios. Documents are generated lazily and
+written in unordered batches, so memory stays flat:
+
+    python -m tests.load.datagen --listings 100000
+    MONGO_URL=mongodb://localhost:27017/ BENCH_DB_NAME=loadtest python -m tests.load.datagen --listings 10000000
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+from tests.benchmarks.common import close_database, open_database
+
+from indexes import ensure_indexes
+from auth import get_password_hash
+from conversations import conversation_id, snippet
+from models import Category, ListingInDB, ListingStatus, MessageInDB, UrgencyLevel, UserInDB
+from search import build_search_text
+from listing_expiry import expires_at
+from geo import normalize_location
+from trending import TRENDING_WINDOW_HOURS, activity_bucket, activity_hour, bucket_score
+
+PASSWORD = "loadtest-password"
+BATCH_SIZE = 5000
+HISTORY_DAYS = 180
+ID_NAMESPACE = uuid.UUID("6f1c1f0e-8a53-4d6b-9a51-0c7c3f0b2f11")
+
+FIRST_NAMES = ("Ahmet", "Mehmet", "Ayşe", "Fatma", "Mustafa", "Emine", "Ali", "Zeynep", "Hüseyin", "Elif", "Can", "Şule")
+LAST_NAMES = ("Yılmaz", "Kaya", "Demir", "Şahin", "Çelik", "Yıldız", "Öztürk", "Aydın", "Arslan", "Doğan")
+LOCATIONS = (
+    "İstanbul, Kadıköy", "İstanbul, Beşiktaş", "İstanbul, Üsküdar", "Ankara, Çankaya",
+    "Ankara, Keçiören", "İzmir, Konak", "İzmir, Karşıyaka", "Bursa, Nilüfer",
+    "Antalya, Muratpaşa", "Adana, Seyhan", "Konya, Selçuklu", "Eskişehir, Tepebaşı",
+)
+ITEMS = {
+    Category.EMLAK: ("2+1 kiralık daire", "satılık arsa", "öğrenciye uygun stüdyo", "bahçeli müstakil ev"),
+    Category.VASITA: ("ikinci el sedan araç", "125cc motosiklet", "dizel hatchback", "çocuk bisikleti"),
+    Category.ELEKTRONIK: ("iPhone 13", "oyun bilgisayarı", "4K televizyon", "kablosuz kulaklık", "tablet"),
+    Category.EV_YASAM: ("üçlü koltuk takımı", "çamaşır makinesi", "yemek masası", "buzdolabı"),
+    Category.MODA: ("kışlık mont", "deri ceket", "spor ayakkabı", "gelinlik"),
+    Category.IS: ("yarı zamanlı garson", "freelance grafik tasarımcı", "muhasebe elemanı"),
+    Category.HIZMET: ("ev temizliği", "nakliyat", "özel ders", "boya badana ustası"),
+    Category.DIGER: ("koleksiyon pul", "akvaryum", "kamp çadırı", "el yapımı halı"),
+}
+PHRASES = (
+    "temiz ve bakımlı olmalı", "faturalı olursa tercih ederim", "pazarlık payı var",
+    "elden teslim almak istiyorum", "kargo ile gönderim de olur", "acil ihtiyacım var",
+    "garantisi devam eden ürün arıyorum", "fiyat performans önemli", "şehir içi teslimat",
+)
+MESSAGES = (
+    "Merhaba, elimde tam aradığınız gibi bir ürün var.", "Fiyat konusunda anlaşabiliriz.",
+    "Yarın akşam gösterebilirim.", "Fotoğraf gönderebilir misiniz?", "Kargo ücreti alıcıya ait.",
+    "Hâlâ arıyor musunuz?", "Teşekkürler, düşünüp dönüş yapacağım.",
+)
+
+def user_id(index: int) -> str:
+    return str(uuid.uuid5(ID_NAMESPACE, f"user-{index}"))
+
+def listing_id(index: int) -> str:
+    return str(uuid.uuid5(ID_NAMESPACE, f"listing-{index}"))
+
+def user_email(index: int) -> str:
+    return f"loadtest{index}@example.com"
+
+class Scale:
+    """Document counts for a dataset of ``listings`` listings"""
+
+    def __init__(
+        self,
+        listings: int,
+        listings_per_user: float = 5,
+        conversations_per_listing: float = 2,
+        messages_per_conversation: float = 3,
+        favorites_per_listing: float = 1.5
+    ):
+        self.listings = listings
+        self.users = max(10, int(listings / listings_per_user))
+        self.conversations_per_listing = conversations_per_listing
+        self.messages_per_conversation = messages_per_conversation
+        self.favorites_per_listing = favorites_per_listing
+
+def _count(rng: random.Random, mean: float) -> int:
+    """Skewed per-listing count: most listings get little, a few get a lot"""
+    return min(int(rng.expovariate(1 / mean)) if mean > 0 else 0, 50)
+
+def generate_users(scale: Scale, hashed_password: str, now: datetime) -> Iterator[dict]:
+    rng = random.Random(1)
+    for i in range(scale.users):
+        created = now - timedelta(days=rng.uniform(0, HISTORY_DAYS * 2))
+        yield {
+            "_id": user_id(i),
+            "firstName": rng.choice(FIRST_NAMES),
+            "lastName": rng.choice(LAST_NAMES),
+            "email": user_email(i),
+            "phone": f"+90 5{rng.randint(300000000, 599999999)}",
+            "location": rng.choice(LOCATIONS).split(",")[0],
+            "hashed_password": hashed_password,
+            "rating": round(rng.uniform(3, 5), 1),
+            "verified": rng.random() < 0.3,
+            "avatar": None,
+            "createdAt": created,
+            "updatedAt": created,
+        }
+
+def generate_listing(rng: random.Random, scale: Scale, i: int, now: datetime) -> dict:
+    category = rng.choice(list(Category))
+    item = rng.choice(ITEMS[category])
+    location = rng.choice(LOCATIONS)
+    budget_min = rng.choice((0, 500, 1000, 2500, 5000, 10000, 50000))
+    created = now - timedelta(seconds=rng.uniform(0, HISTORY_DAYS * 86400))
+    status = rng.choices(list(ListingStatus), weights=(80, 15, 5))[0]
+    listing = {
+        "_id": listing_id(i),
+        "title": f"{location.split(',')[0]}'da {item} arıyorum",
+        "description": " ".join(rng.choices(PHRASES, k=rng.randint(2, 12))).capitalize() + ".",
+        "category": category.value,
+        "location": location,
+        "budgetMin": float(budget_min) if budget_min else None,
+        "budgetMax": float(budget_min * rng.choice((2, 3, 5))) if budget_min else None,
+        "urgency": rng.choice(list(UrgencyLevel)).value,
+        "status": status.value,
+        "userId": user_id(rng.randrange(scale.users)),
+        "views": int(rng.paretovariate(1.2) * 10),
+        "messageCount": 0,
+        "createdAt": created,
+        "updatedAt": created,
+    }
+    listing.update(normalize_location(location))
+    listing["expiresAt"] = expires_at(listing["urgency"], created)
+    if status == ListingStatus.ACTIVE and listing["expiresAt"] <= now:
+        # What the expiry sweeper would have done by now
+        listing["status"] = ListingStatus.EXPIRED.value
+    listing["searchText"] = build_search_text(listing)
+    listing["trendingScore"] = 0.0
+    return listing
+
+def generate_activity(rng: random.Random, listing: dict, now: datetime) -> List[dict]:
+    """Hourly view buckets for a listing active in the trending window, and its score"""
+    start = max(listing["createdAt"], now - timedelta(hours=TRENDING_WINDOW_HOURS))
+    if listing["status"] != ListingStatus.ACTIVE.value or start >= now:
+        return []
+    buckets = []
+    hour = activity_hour(start)
+    while hour <= now:
+        if rng.random() < 0.3:
+            buckets.append(activity_bucket(listing["_id"], hour, {"views": rng.randint(1, 20)}))
+        hour += timedelta(hours=1)
+    # What the trending job would have computed by now
+    listing["trendingScore"] = round(sum(bucket_score(bucket, now) for bucket in buckets), 4)
+    return buckets
+
+def generate_thread(rng: random.Random, scale: Scale, listing: dict, now: datetime):
+    """Conversations and messages for one listing; sellers message the owner"""
+    conversations, messages = [], []
+    buyer = listing["userId"]
+    sellers = {user_id(rng.randrange(scale.users)) for _ in range(_count(rng, scale.conversations_per_listing))}
+    sellers.discard(buyer)
+    for seller in sellers:
+        thread_id = conversation_id(listing["_id"], buyer, seller)
+        sent_at = listing["createdAt"]
+        thread: List[dict] = []
+        for _ in range(max(1, _count(rng, scale.messages_per_conversation))):
+            sent_at = min(now, sent_at + timedelta(minutes=rng.uniform(1, 600)))
+            thread.append({
+                "_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "conversationId": thread_id,
+                "listingId": listing["_id"],
+                "senderId": seller,
+                "receiverId": buyer,
+                "content": rng.choice(MESSAGES),
+                "isRead": rng.random() < 0.7,
+                "createdAt": sent_at,
+            })
+        last = thread[-1]
+        conversations.append({
+            "_id": thread_id,
+            "listingId": listing["_id"],
+            "listingTitle": listing["title"],
+            "buyerId": buyer,
+            "sellerId": seller,
+            "participants": [buyer, seller],
+            "lastMessage": {
+                "_id": last["_id"],
+                "senderId": seller,
+                "content": snippet(last["content"]),
+                "createdAt": last["createdAt"],
+            },
+            "lastMessageAt": last["createdAt"],
+            "unread": {buyer: sum(not message["isRead"] for message in thread), seller: 0},
+            "createdAt": thread[0]["createdAt"],
+        })
+        messages.extend(thread)
+    listing["messageCount"] = len(messages)
+    return conversations, messages
+
+def generate_favorites(rng: random.Random, scale: Scale, listing: dict) -> List[dict]:
+    count = min(_count(rng, scale.favorites_per_listing), scale.users - 1)
+    users = {user_id(index) for index in rng.sample(range(scale.users), count)}
+    users.discard(listing["userId"])
+    return [
+        {
+            "_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "userId": favorite_user,
+            "listingId": listing["_id"],
+            "createdAt": listing["createdAt"] + timedelta(hours=rng.uniform(1, 72)),
+        }
+        for favorite_user in users
+    ]
+
+def _validate_shapes(user: dict, listing: dict):
+    """Fail fast if the generator drifts from the models"""
+    UserInDB(**user)
+    ListingInDB(**{key: value for key, value in listing.items() if key != "searchText"})
+
+class BatchWriter:
+    def __init__(self, collection, batch_size: int = BATCH_SIZE):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.pending: List[dict] = []
+        self.written = 0
+
+    async def add(self, docs: List[dict]):
+        self.pending.extend(docs)
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if self.pending:
+            await self.collection.insert_many(self.pending, ordered=False)
+            self.written += len(self.pending)
+            self.pending = []
+
+async def generate(db, scale: Scale, seed: int = 42, create_indexes: bool = True) -> dict:
+    """Write a full dataset into ``db``; returns document counts"""
+    now = datetime.utcnow()
+    hashed_password = get_password_hash(PASSWORD)
+
+    users = BatchWriter(db.users)
+    first_user = None
+    for user in generate_users(scale, hashed_password, now):
+        first_user = first_user or user
+        await users.add([user])
+    await users.flush()
+
+    rng = random.Random(seed)
+    listings = BatchWriter(db.listings)
+    conversations = BatchWriter(db.conversations)
+    messages = BatchWriter(db.messages)
+    favorites = BatchWriter(db.favorites)
+    activity = BatchWriter(db.listing_activity)
+    for i in range(scale.listings):
+        listing = generate_listing(rng, scale, i, now)
+        if i == 0:
+            _validate_shapes(first_user, listing)
+            MessageInDB(listingId=listing["_id"], senderId="s", receiverId="r", content="x")
+        threads, thread_messages = generate_thread(rng, scale, listing, now)
+        buckets = generate_activity(rng, listing, now)
+        await listings.add([listing])
+        await conversations.add(threads)
+        await messages.add(thread_messages)
+        await favorites.add(generate_favorites(rng, scale, listing))
+        await activity.add(buckets)
+    for writer in (listings, conversations, messages, favorites, activity):
+        await writer.flush()
+
+    # Building indexes after the bulk load is much faster than maintaining them
+    if create_indexes:
+        await ensure_indexes(db)
+
+    return {
+        "users": users.written,
+        "listings": listings.written,
+        "conversations": conversations.written,
+        "messages": messages.written,
+        "favorites": favorites.written,
+        "listing_activity": activity.written,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listings", type=int, default=10_000)
+    parser.add_argument("--listings-per-user", type=float, default=5)
+    parser.add_argument("--conversations-per-listing", type=float, default=2)
+    parser.add_argument("--messages-per-conversation", type=float, default=3)
+    parser.add_argument("--favorites-per-listing", type=float, default=1.5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drop", action="store_true", help="drop the existing collections first")
+    args = parser.parse_args()
+
+    scale = Scale(
+        args.listings,
+        args.listings_per_user,
+        args.conversations_per_listing,
+        args.messages_per_conversation,
+        args.favorites_per_listing
+    )
+    db = await open_database()
+    try:
+        if args.drop:
+            for name in ("users", "listings", "conversations", "messages", "favorites", "listing_activity", "user_stats"):
+                await db.drop_collection(name)
+        started = time.perf_counter()
+        counts = await generate(db, scale, args.seed)
+        print(counts, f"in {time.perf_counter() - started:.1f}s")
+    finally:
+        # Kept for the load harness
+        await close_database(drop=False)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,222 @@
+"""Replay a realistic endpoint mix and report latency and throughput.
+
+Runs against the app in-process (``httpx`` ASGI transport, with the
+``BENCH_DB_NAME`` scratch database on ``MONGO_URL`` or the in-memory
+stand-in) or against a running server with ``--base-url``. The dataset must come from
+``tests.load.datagen``, whose deterministic ids and logins the harness
+relies on; in-process runs can generate one first with ``--generate``.
+
+    python -m tests.load.harness --generate 10000 --duration 30 --concurrency 20
+    python -m tests.load.harness --base-url http://localhost:8001 --listings 1000000 \\
+        --baseline tests/load/baseline.json
+
+Results are printed as JSON. ``--save-baseline`` stores them;
+``--baseline`` compares against a stored run and exits non-zero when an
+endpoint's p95 latency or throughput regressed by more than
+``--tolerance``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+from tests.benchmarks.common import app_client, close_database, open_database, summarize
+from tests.load.datagen import PASSWORD, Scale, generate, listing_id, user_email
+
+from models import Category
+
+SEARCH_TERMS = ("iphone", "daire", "bisiklet", "koltuk", "mont", "temizlik", "televizyon", "nakliyat")
+
+class Session:
+    """One simulated client: a logged-in user with its own auth header"""
+
+    def __init__(self, client: httpx.AsyncClient, headers: dict, rng: random.Random, listings: int):
+        self.client = client
+        self.headers = headers
+        self.rng = rng
+        self.listings = listings
+
+    def any_listing(self) -> str:
+        # Popular listings get most of the detail traffic
+        return listing_id(min(int(self.rng.paretovariate(1.1)) - 1, self.listings - 1))
+
+Request = Callable[[Session], "asyncio.Future"]
+
+def _feed(session: Session):
+    return session.client.get("/api/listings", params={"limit": 20})
+
+def _feed_category(session: Session):
+    category = session.rng.choice(list(Category)).value
+    return session.client.get(f"/api/listings/categories/{category}", params={"limit": 20})
+
+def _search(session: Session):
+    return session.client.get("/api/listings", params={"search": session.rng.choice(SEARCH_TERMS), "limit": 20})
+
+def _listing_detail(session: Session):
+    return session.client.get(f"/api/listings/{session.any_listing()}", headers=session.headers)
+
+def _messages(session: Session):
+    return session.client.get("/api/messages", params={"limit": 20}, headers=session.headers)
+
+def _conversations(session: Session):
+    return session.client.get("/api/messages/conversations", headers=session.headers)
+
+def _unread(session: Session):
+    return session.client.get("/api/messages/unread/count", headers=session.headers)
+
+def _favorites(session: Session):
+    return session.client.get("/api/favorites", headers=session.headers)
+
+def _my_listings(session: Session):
+    return session.client.get("/api/listings/my/listings", headers=session.headers)
+
+def _stats(session: Session):
+    return session.client.get("/api/users/stats", headers=session.headers)
+
+# (name, weight, request); weights approximate production traffic
+ENDPOINT_MIX: List[Tuple[str, float, Request]] = [
+    ("GET /listings", 25, _feed),
+    ("GET /listings/categories/{category}", 10, _feed_category),
+    ("GET /listings?search", 8, _search),
+    ("GET /listings/{id}", 20, _listing_detail),
+    ("GET /messages", 7, _messages),
+    ("GET /messages/conversations", 7, _conversations),
+    ("GET /messages/unread/count", 12, _unread),
+    ("GET /favorites", 5, _favorites),
+    ("GET /listings/my/listings", 3, _my_listings),
+    ("GET /users/stats", 3, _stats),
+]
+
+async def login(client: httpx.AsyncClient, index: int) -> dict:
+    response = await client.post("/api/auth/login", json={"email": user_email(index), "password": PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def run_load(
+    client: httpx.AsyncClient,
+    mix: List[Tuple[str, float, Request]],
+    scale: Scale,
+    concurrency: int,
+    duration: float,
+    seed: int
+) -> dict:
+    rng = random.Random(seed)
+    users = rng.sample(range(scale.users), min(concurrency, scale.users))
+    headers = await asyncio.gather(*(login(client, index) for index in users))
+
+    names = [name for name, _, _ in mix]
+    weights = [weight for _, weight, _ in mix]
+    requests = {name: request for name, _, request in mix}
+    samples: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, Dict[str, int]] = {name: {} for name in names}
+
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_index: int):
+        session = Session(
+            client, headers[worker_index % len(headers)], random.Random(seed + worker_index), scale.listings
+        )
+        while time.perf_counter() < deadline:
+            name = session.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await requests[name](session)
+                outcome = None if response.status_code < 400 or response.status_code == 404 else str(response.status_code)
+            except httpx.HTTPError as exc:
+                outcome = type(exc).__name__
+            elapsed = time.perf_counter() - started
+            if outcome is None:
+                samples[name].append(elapsed)
+            else:
+                errors[name][outcome] = errors[name].get(outcome, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    endpoints = {
+        name: {
+            **summarize(samples[name]),
+            "rps": round(len(samples[name]) / elapsed, 2),
+            "errors": errors[name],
+        }
+        for name in names
+    }
+    total = sum(len(values) for values in samples.values())
+    return {
+        "config": {"concurrency": concurrency, "duration": duration, "listings": scale.listings, "seed": seed},
+        "total": {"count": total, "rps": round(total / elapsed, 2)},
+        "endpoints": endpoints,
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Endpoints whose p95 or throughput regressed beyond ``tolerance``"""
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous or not previous.get("count") or not current.get("count"):
+            continue
+        if current["p95"] > previous["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95']}ms -> {current['p95']}ms")
+        if current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['rps']} -> {current['rps']} req/s")
+    return regressions
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", help="load a running server instead of the in-process app")
+    parser.add_argument("--generate", type=int, metavar="LISTINGS", help="generate a dataset first (in-process only)")
+    parser.add_argument("--listings", type=int, default=10_000, help="size of the existing dataset")
+    parser.add_argument("--listings-per-user", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", type=Path, help="compare with a stored run")
+    parser.add_argument("--save-baseline", type=Path, help="store this run as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    listings = args.generate or args.listings
+    scale = Scale(listings, args.listings_per_user)
+    mix = list(ENDPOINT_MIX)
+
+    db = None
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=30)
+    else:
+        db = await open_database()
+        if args.generate:
+            print("generated", await generate(db, scale), file=sys.stderr)
+        if not os.environ.get("MONGO_URL"):
+            # The in-memory stand-in has no $text support
+            mix = [entry for entry in mix if entry[0] != "GET /listings?search"]
+        client = app_client()
+
+    try:
+        async with client:
+            results = await run_load(client, mix, scale, args.concurrency, args.duration, args.seed)
+    finally:
+        if db is not None:
+            # A dataset from datagen is kept; one generated here is dropped
+            await close_database(drop=bool(args.generate))
+
+    print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(results, indent=2) + "\n")
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,192 @@
+"""TTLCache expiry and eviction, the authenticated-user cache built on it, and
+ResponseCache single-flight fills and tag invalidation."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import cache as cache_module
+from cache import TTLCache, ResponseCache, feed_page_tags, feed_cache_tags, ALL_CATEGORIES_TAG
+from auth import create_access_token, get_user_from_token, user_cache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+def test_ttl_cache_expires_entries(clock):
+    cache = TTLCache(maxsize=4, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=30)
+    clock.now += 10
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_ttl_cache_evicts_least_recently_used(clock):
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b", "gone") == "gone"
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+def test_ttl_cache_invalidate_and_clear(clock):
+    cache = TTLCache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("a")
+    cache.invalidate("missing")
+    assert cache.get("a") is None
+    cache.clear()
+    assert len(cache) == 0
+
+USER = {"_id": "u1", "firstName": "Ayşe", "lastName": "Yılmaz", "email": "ayse@example.com", "hashed_password": "x"}
+
+@pytest.fixture
+def users(db):
+    user_cache.clear()
+    asyncio.run(db.users.insert_one(dict(USER)))
+    yield db
+    user_cache.clear()
+
+def test_token_lookups_are_served_from_the_cache(users):
+    db = users
+    token = create_access_token({"sub": USER["email"]})
+
+    async def scenario():
+        first = await get_user_from_token(db, token)
+        await db.users.update_one({"_id": "u1"}, {"$set": {"firstName": "Fatma"}})
+        cached = await get_user_from_token(db, token)
+        # Profile updates invalidate the entry
+        user_cache.invalidate(USER["email"])
+        fresh = await get_user_from_token(db, token)
+        return first, cached, fresh
+
+    first, cached, fresh = asyncio.run(scenario())
+    assert cached is first
+    assert cached.firstName == "Ayşe"
+    assert fresh.firstName == "Fatma"
+
+@pytest.mark.parametrize("token", [
+    create_access_token({"sub": "nobody@example.com"}),
+    create_access_token({}),
+    "not-a-jwt",
+])
+def test_unknown_users_and_bad_tokens_are_rejected(users, token):
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(get_user_from_token(users, token))
+    assert excinfo.value.status_code == 401
+    assert len(user_cache) == 0
+
+def _counting(value, calls: list, gate: asyncio.Event = None):
+    async def compute():
+        calls.append(value)
+        if gate is not None:
+            await gate.wait()
+        return value
+    return compute
+
+def test_concurrent_misses_share_one_computation():
+    cache = ResponseCache()
+    calls = []
+
+    async def scenario():
+        gate = asyncio.Event()
+        waiters = [asyncio.create_task(cache.get_or_compute("k", ["t"], _counting("v", calls, gate))) for _ in range(5)]
+        await asyncio.sleep(0)
+        gate.set()
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(scenario()) == ["v"] * 5
+    assert calls == ["v"]
+    assert cache.stats()["coalesced"] == 4
+
+def test_cached_value_is_served_until_a_tag_is_invalidated():
+    cache = ResponseCache()
+    calls = []
+
+    async def scenario():
+        first = await cache.get_or_compute("k", ["a", "b"], _counting(1, calls))
+        again = await cache.get_or_compute("k", ["a", "b"], _counting(2, calls))
+        cache.invalidate_tags(["c"])
+        untouched = await cache.get_or_compute("k", ["a", "b"], _counting(3, calls))
+        cache.invalidate_tags(["b"])
+        recomputed = await cache.get_or_compute("k", ["a", "b"], _counting(4, calls))
+        return first, again, untouched, recomputed
+
+    assert asyncio.run(scenario()) == (1, 1, 1, 4)
+    assert calls == [1, 4]
+
+def test_invalidation_during_a_fill_leaves_the_entry_stale():
+    cache = ResponseCache()
+    calls = []
+
+    async def compute():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            cache.invalidate_tags(["t"])
+        return len(calls)
+
+    async def scenario():
+        return await cache.get_or_compute("k", ["t"], compute), await cache.get_or_compute("k", ["t"], compute)
+
+    assert asyncio.run(scenario()) == (1, 2)
+
+def test_failed_fill_propagates_to_waiters_and_is_not_cached():
+    cache = ResponseCache()
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def failing():
+            await gate.wait()
+            raise RuntimeError("boom")
+
+        waiters = [asyncio.create_task(cache.get_or_compute("k", [], failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        after = await cache.get_or_compute("k", [], _counting("ok", []))
+        return results, after
+
+    results, after = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert after == "ok"
+
+def test_cancelled_leader_hands_the_fill_to_a_waiter():
+    cache = ResponseCache()
+    calls = []
+
+    async def scenario():
+        gate = asyncio.Event()
+        leader = asyncio.create_task(cache.get_or_compute("k", [], _counting("first", calls, gate)))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.get_or_compute("k", [], _counting("second", calls))) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results
+
+    assert asyncio.run(scenario()) == ["second"] * 3
+    # One follower recomputed, the others waited for it
+    assert calls == ["first", "second"]
+
+def test_feed_tags():
+    assert feed_page_tags() == [ALL_CATEGORIES_TAG]
+    assert feed_page_tags("emlak") == ["category:emlak"]
+    assert feed_cache_tags("emlak", None, "moda") == [ALL_CATEGORIES_TAG, "category:emlak", "category:moda"]
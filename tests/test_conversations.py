@@ -0,0 +1,91 @@
+"""Threading messages into conversations, for new messages and in the backfill of older ones."""
+import asyncio
+from datetime import datetime, timedelta
+
+from conversations import conversation_id, record_message, snippet, to_inbox_entry, SNIPPET_LENGTH
+from maintenance import rebuild_conversations
+from migrations import BACKFILLS, backfill_conversations
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+LISTING = {"_id": "l1", "userId": "buyer", "title": "Bisiklet arıyorum"}
+THREAD = conversation_id("l1", "buyer", "seller")
+
+def _message(message_id, minutes, is_read=False, **fields):
+    return {
+        "_id": message_id,
+        "listingId": "l1",
+        "senderId": "seller",
+        "receiverId": "buyer",
+        "content": f"mesaj {message_id}",
+        "isRead": is_read,
+        "createdAt": START + timedelta(minutes=minutes),
+        **fields,
+    }
+
+def test_snippet_is_cut_to_length():
+    assert snippet("kısa") == "kısa"
+    cut = snippet("a" * (SNIPPET_LENGTH + 10))
+    assert len(cut) == SNIPPET_LENGTH
+    assert cut.endswith("…")
+
+def test_record_message_upserts_the_thread(db):
+    async def scenario():
+        for message in (_message("m1", 0), _message("m2", 5)):
+            message["conversationId"] = THREAD
+            await record_message(db, message, LISTING)
+        return await db.conversations.find_one({"_id": THREAD})
+
+    conversation = asyncio.run(scenario())
+    assert conversation["participants"] == ["buyer", "seller"]
+    assert conversation["lastMessage"]["_id"] == "m2"
+    assert conversation["unread"] == {"buyer": 2, "seller": 0}
+    assert conversation["createdAt"] == START
+    assert to_inbox_entry(conversation, "seller")["counterpartId"] == "buyer"
+    assert to_inbox_entry(conversation, "buyer")["unreadCount"] == 2
+
+def test_backfill_merges_older_messages_into_live_threads(db):
+    async def scenario():
+        await db.listings.insert_one(dict(LISTING))
+        # Sent before conversations existed
+        await db.messages.insert_many([_message("m1", 0, is_read=True), _message("m2", 5)])
+        # Sent after the deploy, through the send path
+        live = _message("m3", 10, conversationId=THREAD)
+        await db.messages.insert_one(live)
+        await record_message(db, live, LISTING)
+
+        threaded = await backfill_conversations(db)
+        again = await backfill_conversations(db)
+        tagged = await db.messages.count_documents({"conversationId": THREAD})
+        return threaded, again, tagged, await db.conversations.find_one({"_id": THREAD})
+
+    threaded, again, tagged, conversation = asyncio.run(scenario())
+    assert (threaded, again, tagged) == (1, 0, 3)
+    assert conversation["lastMessage"]["_id"] == "m3"
+    assert conversation["unread"] == {"buyer": 2, "seller": 0}
+    assert conversation["createdAt"] == START
+    assert ("0008_backfill_conversations", backfill_conversations) in BACKFILLS
+
+def test_backfill_creates_threads_for_older_messages(db):
+    async def scenario():
+        await db.listings.insert_one(dict(LISTING))
+        await db.messages.insert_many([_message("m1", 0), _message("m2", 5, is_read=True)])
+        await backfill_conversations(db)
+        return await db.conversations.find_one({"_id": THREAD})
+
+    conversation = asyncio.run(scenario())
+    assert conversation["listingTitle"] == LISTING["title"]
+    assert conversation["lastMessage"]["_id"] == "m2"
+    assert conversation["lastMessageAt"] == START + timedelta(minutes=5)
+    assert conversation["unread"] == {"buyer": 1, "seller": 0}
+
+def test_full_rebuild_replaces_drifted_threads(db):
+    async def scenario():
+        await db.listings.insert_one(dict(LISTING))
+        await db.messages.insert_many([_message("m1", 0, conversationId=THREAD), _message("m2", 5)])
+        await db.conversations.insert_one({"_id": THREAD, "unread": {"buyer": 9, "seller": 4}})
+        await rebuild_conversations(db)
+        return await db.conversations.find_one({"_id": THREAD})
+
+    conversation = asyncio.run(scenario())
+    assert conversation["unread"] == {"buyer": 2, "seller": 0}
+    assert conversation["lastMessage"]["_id"] == "m2"
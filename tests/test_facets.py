@@ -0,0 +1,63 @@
+"""Active-listing counts per category and urgency for the filter sidebar."""
+import asyncio
+
+from models import Category, UrgencyLevel
+from facets import FacetCounts
+
+def _listing(listing_id, user="u1", status="active", category="emlak", urgency="acil", **extra):
+    return {"_id": listing_id, "userId": user, "status": status, "category": category, "urgency": urgency, **extra}
+
+def _seed(db):
+    asyncio.run(db.listings.insert_many([
+        _listing("l1"),
+        _listing("l2", status="completed"),
+        _listing("l3", status="expired"),
+        _listing("l4", deletedAt="2024-01-01"),
+        _listing("l5", user="u2"),
+    ]))
+
+def test_facets_follow_listing_writes():
+    facets = FacetCounts(reconcile_interval=60)
+    listing = _listing("l1", category="emlak", urgency="acil")
+    facets.record(None, listing)
+    facets.record(None, _listing("l2", category="moda", urgency="acil"))
+    facets.record(None, _listing("l3", status="expired"))
+
+    counts = facets.facets()
+    assert counts["total"] == 2
+    assert counts["categories"]["emlak"] == 1
+    assert counts["urgency"]["acil"] == 2
+
+    # Moving a listing to another category, then deleting it
+    moved = {**listing, "category": "moda"}
+    facets.record(listing, moved)
+    assert facets.facets()["categories"] == {**dict.fromkeys((c.value for c in Category), 0), "moda": 2}
+    facets.record(moved, {**moved, "deletedAt": "2024-01-01"})
+    assert facets.facets()["total"] == 1
+
+def test_facets_honour_the_other_filter():
+    facets = FacetCounts(reconcile_interval=60)
+    facets.record(None, _listing("l1", category="emlak", urgency="acil"))
+    facets.record(None, _listing("l2", category="emlak", urgency="bu-ay"))
+    facets.record(None, _listing("l3", category="moda", urgency="acil"))
+
+    by_category = facets.facets(category=Category.EMLAK)
+    assert by_category["total"] == 2
+    assert by_category["urgency"]["acil"] == 1
+    assert by_category["categories"]["moda"] == 1
+
+    by_urgency = facets.facets(urgency=UrgencyLevel.ACIL)
+    assert by_urgency["categories"] == {**dict.fromkeys((c.value for c in Category), 0), "emlak": 1, "moda": 1}
+    assert by_urgency["urgency"]["bu-ay"] == 1
+
+def test_facet_reconcile_replaces_drifted_counts(db):
+    _seed(db)
+    facets = FacetCounts(reconcile_interval=60)
+    facets.record(None, _listing("ghost", category="moda"))
+    asyncio.run(facets.ensure_loaded(db))
+    counts = facets.facets()
+    # l1 and l5 are active; the tombstoned l4 and the ghost are not counted
+    assert counts["total"] == 2
+    assert counts["categories"]["emlak"] == 2
+    assert counts["categories"]["moda"] == 0
+    assert facets.stats()["loaded"]
@@ -0,0 +1,93 @@
+"""Summary and full views and sparse fieldsets for listing feeds."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from tests.benchmarks.common import app_client
+
+from cache import feed_cache
+from fieldsets import (
+    LISTING_FIELDS,
+    SUMMARY_FIELDS,
+    SUMMARY_DESCRIPTION_LENGTH,
+    parse_listing_fields,
+    resolve_listing_fields,
+    listing_projection,
+    wants_user,
+    trim_to_fields,
+)
+
+def test_parse_listing_fields():
+    assert parse_listing_fields(None) is None
+    assert parse_listing_fields("") is None
+    assert parse_listing_fields(" title, _id,budgetMin ,title") == ("budgetMin", "title")
+    with pytest.raises(HTTPException) as excinfo:
+        parse_listing_fields("title,searchText")
+    assert excinfo.value.status_code == 400
+
+def test_views_pick_the_default_fields():
+    assert resolve_listing_fields(None, "summary") == SUMMARY_FIELDS
+    assert resolve_listing_fields(None, "full") is None
+    assert resolve_listing_fields(("title",), "summary") == ("title",)
+    assert resolve_listing_fields(("title",), "full") == ("title",)
+
+def test_summary_projection_reads_only_card_fields():
+    projection = listing_projection(None, "summary", ("views", "createdAt", "_id"))
+    assert set(projection) == set(SUMMARY_FIELDS) | {"views"}
+    assert projection["description"] == {"$substrCP": ["$description", 0, SUMMARY_DESCRIPTION_LENGTH]}
+
+def test_full_projection_reads_every_field():
+    projection = listing_projection(None, "full")
+    assert set(projection) == set(LISTING_FIELDS) - {"user"} | {"userId"}
+    assert projection["description"] == 1
+
+def test_user_is_hydrated_only_when_returned():
+    assert wants_user(None)
+    assert wants_user(("title", "user"))
+    assert not wants_user(SUMMARY_FIELDS)
+    assert listing_projection(("user",), "full") == {"userId": 1}
+
+def test_trim_drops_helper_fields():
+    docs = [{"_id": "l1", "title": "Bisiklet", "views": 3, "userId": "u1"}]
+    assert trim_to_fields(docs, ("title",)) == [{"_id": "l1", "title": "Bisiklet"}]
+    assert trim_to_fields([{"_id": "l1", "views": 3}], None) == [{"_id": "l1", "views": 3}]
+
+def _get_listings(db, **params):
+    now = datetime(2024, 5, 1, 12, 0, 0)
+
+    async def scenario():
+        feed_cache.clear()
+        await db.users.insert_one({"_id": "u1", "firstName": "Ayşe", "lastName": "Yılmaz"})
+        await db.listings.insert_many([
+            {
+                "_id": f"l{i}", "title": f"İlan {i}", "description": "uzun açıklama " * 40,
+                "category": "diger", "location": "İstanbul, Kadıköy", "city": "İstanbul", "district": "Kadıköy",
+                "budgetMin": 100.0, "budgetMax": 200.0, "urgency": "acil", "status": "active", "userId": "u1",
+                "views": i, "messageCount": 0, "createdAt": now - timedelta(minutes=i), "updatedAt": now,
+            }
+            for i in range(3)
+        ])
+        async with app_client() as client:
+            return await client.get("/api/listings", params=params)
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    return response.json()
+
+def test_summary_feed_returns_card_fields_only(db):
+    listings = _get_listings(db, sort_by="most_viewed")
+    assert [listing["_id"] for listing in listings] == ["l2", "l1", "l0"]
+    assert all(set(listing) == {"_id", *SUMMARY_FIELDS} for listing in listings)
+    assert len(listings[0]["description"]) == SUMMARY_DESCRIPTION_LENGTH
+
+def test_full_feed_returns_every_field(db):
+    listing = _get_listings(db, view="full")[0]
+    assert set(listing) == {"_id", *LISTING_FIELDS}
+    assert listing["user"]["firstName"] == "Ayşe"
+    assert len(listing["description"]) > SUMMARY_DESCRIPTION_LENGTH
+
+def test_requested_fields_override_the_view(db):
+    listings = _get_listings(db, fields="title,user")
+    assert set(listings[0]) == {"_id", "title", "user"}
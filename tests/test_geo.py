@@ -0,0 +1,66 @@
+"""Matching free-text locations against the gazetteer, and the location filters built from it."""
+import pytest
+from fastapi import HTTPException
+
+from geo import EARTH_RADIUS_KM, normalize_location, find_city, distance_km, build_location_query
+
+def test_city_with_case_ending():
+    assert normalize_location("ankaradan") == {
+        "city": "Ankara",
+        "district": None,
+        "geo": {"type": "Point", "coordinates": [32.8597, 39.9334]},
+    }
+
+def test_alias_resolves_to_its_city():
+    assert normalize_location("Antep")["city"] == "Gaziantep"
+    assert find_city("antep")["name"] == "Gaziantep"
+    assert find_city("İZMİR")["name"] == "İzmir"
+
+def test_unique_district_identifies_its_city():
+    location = normalize_location("Kadıköy'de satılık")
+    assert (location["city"], location["district"]) == ("İstanbul", "Kadıköy")
+    # The district's own centre, not the city's
+    assert location["geo"]["coordinates"] != [28.9784, 41.0082]
+
+def test_district_name_that_is_also_an_alias():
+    assert normalize_location("İzmit") == normalize_location("izmit merkez") == {
+        "city": "Kocaeli",
+        "district": "İzmit",
+        "geo": normalize_location("İzmit")["geo"],
+    }
+
+def test_city_and_district_in_any_order():
+    assert normalize_location("Buca İzmir'de")["district"] == "Buca"
+    assert normalize_location("Ankara Çankaya")["district"] == "Çankaya"
+
+@pytest.mark.parametrize("location", [None, "", "Bilinmeyen yer"])
+def test_unknown_locations_store_nulls(location):
+    assert normalize_location(location) == {"city": None, "district": None, "geo": None}
+
+def test_distance_km():
+    istanbul, ankara = [28.9784, 41.0082], [32.8597, 39.9334]
+    assert distance_km(istanbul, istanbul) == 0
+    assert distance_km(istanbul, ankara) == pytest.approx(350, abs=5)
+    assert distance_km(istanbul, ankara) == pytest.approx(distance_km(ankara, istanbul))
+
+def test_city_filter_uses_the_canonical_name():
+    assert build_location_query("antep", None, None, None) == {"city": "Gaziantep"}
+    assert build_location_query(None, None, None, None) == {}
+
+def test_radius_filter_replaces_the_city_match():
+    query = build_location_query("Istanbul", None, None, 10)
+    assert query == {"geo": {"$geoWithin": {"$centerSphere": [[28.9784, 41.0082], 10 / EARTH_RADIUS_KM]}}}
+    # lat/lng take precedence over the city's centre
+    query = build_location_query("Istanbul", 40.0, 30.0, 5)
+    assert query["geo"]["$geoWithin"]["$centerSphere"][0] == [30.0, 40.0]
+
+@pytest.mark.parametrize("city, lat, lng, radius_km", [
+    ("Atlantis", None, None, None),
+    (None, 40.0, None, 10),
+    (None, 40.0, 30.0, None),
+    (None, None, None, 10),
+])
+def test_invalid_location_filters_are_rejected(city, lat, lng, radius_km):
+    with pytest.raises(HTTPException) as excinfo:
+        build_location_query(city, lat, lng, radius_km)
+    assert excinfo.value.status_code == 400
@@ -0,0 +1,206 @@
+"""Explain every query shape the routes build and fail on unindexed plans.
+
+Each shape is built with the routes' own query builders and explained
+against a scratch database seeded by ``tests.load.datagen`` and indexed
+from ``indexes.INDEXES``. A winning plan with a collection scan, or a
+sort the index doesn't provide, fails the test, so a query change that
+loses its index shows up here instead of in production.
+
+Needs a MongoDB server; skipped unless MONGO_URL is set:
+
+    MONGO_URL=mongodb://localhost:27017 python -m pytest tests/test_index_coverage.py
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+import pytest
+
+from tests.benchmarks import common  # noqa: F401 (puts backend/ on sys.path)
+from tests.load.datagen import Scale, generate, listing_id, user_id
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pagination import encode_cursor
+from models import Category, UrgencyLevel
+from conversations import conversation_id
+from search import build_search_query
+from routes.listings import feed_pipeline, my_listings_pipeline, build_budget_query
+from geo import build_location_query
+from routes.messages import inbox_pipeline, thread_pipeline, listing_messages_pipeline, conversations_query
+from routes.favorites import favorites_pipeline
+from routes.notifications import notifications_pipeline
+from saved_searches import MAX_SAVED_SEARCHES_PER_USER
+from listing_expiry import EXPIRY_BATCH_SIZE
+from listing_purge import NOT_DELETED, PURGE_LISTINGS_PER_RUN
+from trending import TRENDING_BATCH_SIZE
+
+MONGO_URL = os.environ.get("MONGO_URL")
+SCRATCH_DB = "hemensatbana_index_coverage"
+
+pytestmark = pytest.mark.skipif(not MONGO_URL, reason="needs a MongoDB server (set MONGO_URL)")
+
+# Plan stages that mean the index didn't do its job
+UNINDEXED_STAGES = {"COLLSCAN", "SORT", "$sort"}
+
+# Values for the sort keys of a synthetic "last document on the page"
+CURSOR_VALUES = {
+    "createdAt": datetime(2026, 1, 1),
+    "lastMessageAt": datetime(2026, 1, 1),
+    "views": 10,
+    "messageCount": 2,
+    "score": 1.5,
+    "trendingScore": 3.25,
+    "_id": "00000000-0000-0000-0000-000000000000",
+}
+
+Builder = Callable[[Optional[str]], Tuple[List[dict], list]]
+
+def _find(query_and_sort: Tuple[dict, list], limit: int = 20) -> Tuple[List[dict], list]:
+    """A find() shape as the equivalent pipeline, for explain"""
+    query, sort = query_and_sort
+    return [{"$match": query}, {"$sort": dict(sort)}, {"$limit": limit}], sort
+
+def _unpaged(query: dict, sort: list, limit: int) -> Builder:
+    """A find() that takes no cursor, such as a background job's"""
+    return lambda cursor: (_find((query, sort), limit)[0], [])
+
+def _feed(sort_by: str, category=None, urgency=None, search=None, filters=None) -> Builder:
+    text_query = build_search_query(search) if search else None
+    return lambda cursor: feed_pipeline(0, 20, category, urgency, text_query, sort_by, cursor, filters=filters)
+
+USER = user_id(0)
+LISTING = listing_id(0)
+
+# (name, collection, builder, stages allowed despite UNINDEXED_STAGES)
+QUERY_SHAPES: List[Tuple[str, str, Builder, set]] = [
+    ("feed newest", "listings", _feed("newest"), set()),
+    ("feed oldest", "listings", _feed("oldest"), set()),
+    ("feed most_viewed", "listings", _feed("most_viewed"), set()),
+    ("feed most_messages", "listings", _feed("most_messages"), set()),
+    ("feed category newest", "listings", _feed("newest", Category.ELEKTRONIK), set()),
+    ("feed category most_viewed", "listings", _feed("most_viewed", Category.ELEKTRONIK), set()),
+    ("feed category most_messages", "listings", _feed("most_messages", Category.ELEKTRONIK), set()),
+    ("feed trending", "listings", _feed("trending"), set()),
+    ("feed category trending", "listings", _feed("trending", Category.ELEKTRONIK), set()),
+    ("feed urgency", "listings", _feed("newest", urgency=UrgencyLevel.ACIL), set()),
+    ("feed category urgency", "listings", _feed("newest", Category.EMLAK, UrgencyLevel.ACIL), set()),
+    ("feed budget", "listings", _feed("newest", filters=build_budget_query(5_000, 20_000)), set()),
+    (
+        "feed category budget", "listings",
+        _feed("newest", Category.EMLAK, filters=build_budget_query(5_000, 20_000)),
+        set()
+    ),
+    ("feed city", "listings", _feed("newest", filters=build_location_query("İzmir", None, None, None)), set()),
+    ("feed radius", "listings", _feed("newest", filters=build_location_query("İzmir", None, None, 30)), set()),
+    # Text matches are ranked after the fact; the text index still does the filtering
+    ("feed search", "listings", _feed("relevance", search="iphone"), {"SORT", "$sort"}),
+    ("feed search newest", "listings", _feed("newest", search="iphone"), {"SORT", "$sort"}),
+    ("my listings", "listings", lambda cursor: my_listings_pipeline(USER, 0, 20, cursor), set()),
+    ("inbox messages", "messages", lambda cursor: inbox_pipeline(USER, 0, 20, cursor), set()),
+    (
+        "conversation thread", "messages",
+        lambda cursor: thread_pipeline(conversation_id(LISTING, USER, user_id(1)), 50, cursor),
+        set()
+    ),
+    ("listing messages", "messages", lambda cursor: (listing_messages_pipeline(LISTING), []), set()),
+    ("conversations", "conversations", lambda cursor: _find(conversations_query(USER, cursor)), set()),
+    ("favorites", "favorites", lambda cursor: favorites_pipeline(USER, 0, 20, cursor), set()),
+    ("notifications", "notifications", lambda cursor: notifications_pipeline(USER, 0, 20, cursor), set()),
+    (
+        "unread notifications", "notifications",
+        lambda cursor: notifications_pipeline(USER, 0, 20, cursor, unread_only=True),
+        set()
+    ),
+    (
+        "saved searches", "saved_searches",
+        _unpaged({"userId": USER}, [("createdAt", -1)], MAX_SAVED_SEARCHES_PER_USER),
+        set()
+    ),
+    (
+        "expiry sweep", "listings",
+        _unpaged(
+            {"status": "active", "expiresAt": {"$lte": datetime(2026, 1, 1)}, **NOT_DELETED},
+            [("expiresAt", 1)], EXPIRY_BATCH_SIZE
+        ),
+        set()
+    ),
+    (
+        "trending window", "listing_activity",
+        _unpaged({"hour": {"$gte": datetime(2026, 1, 1)}}, [("hour", 1)], TRENDING_BATCH_SIZE),
+        set()
+    ),
+    (
+        "trending stale scores", "listings",
+        _unpaged({"status": "active", "trendingScore": {"$gt": 0}}, [("trendingScore", -1)], TRENDING_BATCH_SIZE),
+        set()
+    ),
+    (
+        "purge tombstones", "listings",
+        _unpaged({"deletedAt": {"$exists": True}}, [("deletedAt", 1)], PURGE_LISTINGS_PER_RUN),
+        set()
+    ),
+]
+
+def plan_stages(explain: dict) -> List[str]:
+    """Stage names of the winning plan(s) in an aggregate explain"""
+    stages: List[str] = []
+
+    def walk(node, in_plan: bool):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "rejectedPlans":
+                    continue
+                if key == "stage" and in_plan and isinstance(value, str):
+                    stages.append(value)
+                else:
+                    walk(value, in_plan or key == "winningPlan")
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, in_plan)
+
+    walk(explain, False)
+    # A $sort left in the pipeline wasn't absorbed by the query plan
+    stages.extend("$sort" for stage in explain.get("stages", ()) if "$sort" in stage)
+    return stages
+
+def _cursor_for(build: Builder) -> Optional[str]:
+    _, sort = build(None)
+    if not sort:
+        return None
+    return encode_cursor({field: CURSOR_VALUES[field] for field, _ in sort}, sort)
+
+async def _explain(collection: str, pipeline: List[dict]) -> dict:
+    client = AsyncIOMotorClient(MONGO_URL)
+    try:
+        return await client[SCRATCH_DB].command("aggregate", collection, pipeline=pipeline, explain=True)
+    finally:
+        client.close()
+
+@pytest.fixture(scope="module", autouse=True)
+def dataset():
+    async def seed():
+        client = AsyncIOMotorClient(MONGO_URL)
+        await client.drop_database(SCRATCH_DB)
+        await generate(client[SCRATCH_DB], Scale(2_000), seed=1)
+        client.close()
+
+    async def drop():
+        client = AsyncIOMotorClient(MONGO_URL)
+        await client.drop_database(SCRATCH_DB)
+        client.close()
+
+    asyncio.run(seed())
+    yield
+    asyncio.run(drop())
+
+@pytest.mark.parametrize("paged", [False, True], ids=["first-page", "with-cursor"])
+@pytest.mark.parametrize("name,collection,build,allowed", QUERY_SHAPES, ids=[shape[0] for shape in QUERY_SHAPES])
+def test_query_shape_is_indexed(name, collection, build, allowed, paged):
+    cursor = _cursor_for(build) if paged else None
+    if paged and cursor is None:
+        pytest.skip("not paginated")
+    pipeline, _ = build(cursor)
+    stages = plan_stages(asyncio.run(_explain(collection, pipeline)))
+    unindexed = sorted((set(stages) & UNINDEXED_STAGES) - allowed)
+    assert not unindexed, f"{name} runs {', '.join(unindexed)}; plan stages: {stages}"
@@ -0,0 +1,42 @@
+"""Backfilling and repairing the messageCount counter on listings."""
+import asyncio
+
+import maintenance
+from maintenance import reconcile_message_counts
+from migrations import BACKFILLS
+
+def test_reconcile_sets_missing_and_drifted_counts(db):
+    async def scenario():
+        await db.listings.insert_many([
+            {"_id": "old"},
+            {"_id": "drifted", "messageCount": 7},
+            {"_id": "correct", "messageCount": 1},
+            {"_id": "quiet"},
+        ])
+        await db.messages.insert_many([
+            {"_id": "m1", "listingId": "old"},
+            {"_id": "m2", "listingId": "old"},
+            {"_id": "m3", "listingId": "drifted"},
+            {"_id": "m4", "listingId": "correct"},
+        ])
+        repaired = await reconcile_message_counts(db)
+        again = await reconcile_message_counts(db)
+        counts = {doc["_id"]: doc["messageCount"] async for doc in db.listings.find({}, {"messageCount": 1})}
+        return repaired, again, counts
+
+    repaired, again, counts = asyncio.run(scenario())
+    assert (repaired, again) == (3, 0)
+    assert counts == {"old": 2, "drifted": 1, "correct": 1, "quiet": 0}
+
+def test_reconcile_runs_in_batches(db, monkeypatch):
+    monkeypatch.setattr(maintenance, "BATCH_SIZE", 2)
+
+    async def scenario():
+        await db.listings.insert_many([{"_id": f"l{i}"} for i in range(5)])
+        await db.messages.insert_many([{"_id": f"m{i}", "listingId": f"l{i}"} for i in range(5)])
+        return await reconcile_message_counts(db), await db.listings.count_documents({"messageCount": 1})
+
+    assert asyncio.run(scenario()) == (5, 5)
+
+def test_reconcile_is_a_background_backfill():
+    assert ("0009_backfill_message_counts", reconcile_message_counts) in BACKFILLS
@@ -0,0 +1,90 @@
+"""Keyset cursors: encoding, the range predicate, and walking a feed page by page."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import (
+    keyset_sort,
+    encode_cursor,
+    decode_cursor,
+    parse_cursor,
+    apply_cursor,
+    next_cursor,
+    cursor_headers,
+    NEXT_CURSOR_HEADER,
+)
+
+NOW = datetime(2024, 5, 1, 12, 0, 0)
+
+def test_keyset_sort_appends_id_tiebreaker():
+    assert keyset_sort([("createdAt", -1)]) == [("createdAt", -1), ("_id", -1)]
+    assert keyset_sort([("budgetMin", 1)]) == [("budgetMin", 1), ("_id", 1)]
+    assert keyset_sort([("createdAt", -1), ("_id", -1)]) == [("createdAt", -1), ("_id", -1)]
+    assert keyset_sort([]) == [("_id", -1)]
+
+def test_cursor_round_trips_datetimes_and_none():
+    sort = keyset_sort([("createdAt", -1), ("budgetMin", 1)])
+    doc = {"_id": "l1", "createdAt": NOW, "budgetMin": None}
+    cursor = encode_cursor(doc, sort)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, sort) == [NOW, None, "l1"]
+
+def test_cursor_reads_missing_sort_fields_as_none():
+    sort = keyset_sort([("trendingScore", -1)])
+    assert decode_cursor(encode_cursor({"_id": "l1"}, sort), sort) == [None, "l1"]
+
+def test_decode_rejects_malformed_and_foreign_cursors():
+    sort = keyset_sort([("createdAt", -1)])
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor!", sort)
+    other = encode_cursor({"_id": "l1", "createdAt": NOW, "views": 3}, keyset_sort([("views", -1), ("createdAt", -1)]))
+    with pytest.raises(ValueError):
+        decode_cursor(other, sort)
+
+def test_parse_cursor_turns_bad_input_into_400():
+    sort = keyset_sort([("createdAt", -1)])
+    assert parse_cursor(None, sort) is None
+    assert parse_cursor("", sort) is None
+    with pytest.raises(HTTPException) as excinfo:
+        parse_cursor("garbage", sort)
+    assert excinfo.value.status_code == 400
+
+def test_next_cursor_only_on_full_pages():
+    sort = keyset_sort([("createdAt", -1)])
+    docs = [{"_id": "a", "createdAt": NOW}, {"_id": "b", "createdAt": NOW}]
+    assert next_cursor(docs, 3, sort) is None
+    assert next_cursor([], 0, sort) is None
+    cursor = next_cursor(docs, 2, sort)
+    assert decode_cursor(cursor, sort) == [NOW, "b"]
+    assert cursor_headers(cursor) == {NEXT_CURSOR_HEADER: cursor}
+    assert cursor_headers(None) is None
+
+async def _walk(collection, query: dict, sort, limit: int) -> list:
+    seen, cursor = [], None
+    while True:
+        after = parse_cursor(cursor, sort)
+        page = await collection.find(apply_cursor(query, sort, after)).sort(sort).limit(limit).to_list(length=None)
+        seen += [doc["_id"] for doc in page]
+        cursor = next_cursor(page, limit, sort)
+        if cursor is None:
+            return seen
+
+@pytest.mark.parametrize("direction", [-1, 1])
+def test_walk_visits_every_document_once_despite_ties(db, direction):
+    # Three documents share each timestamp, so pages break inside ties
+    docs = [
+        {"_id": f"l{i:02d}", "createdAt": NOW - timedelta(minutes=i // 3), "status": "active"}
+        for i in range(20)
+    ]
+    sort = keyset_sort([("createdAt", direction)])
+
+    async def scenario():
+        await db.listings.insert_many(docs + [{"_id": "other", "createdAt": NOW, "status": "expired"}])
+        expected = await db.listings.find({"status": "active"}).sort(sort).to_list(length=None)
+        return [doc["_id"] for doc in expected], await _walk(db.listings, {"status": "active"}, sort, limit=4)
+
+    expected, walked = asyncio.run(scenario())
+    assert walked == expected
+    assert len(walked) == 20
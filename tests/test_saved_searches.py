@@ -0,0 +1,164 @@
+"""The saved-search inverted index, its matching rules, and notification fan-out."""
+import asyncio
+
+import pytest
+
+from indexes import ensure_indexes
+from realtime import hub
+from search import build_search_text
+from geo import normalize_location
+from saved_searches import (
+    MATCH_ALL,
+    SavedSearchIndex,
+    SavedSearchMatcher,
+    matches,
+    search_keys,
+    _listing_terms,
+)
+
+def _search(search_id, user="buyer", **criteria):
+    return {
+        "_id": search_id,
+        "userId": user,
+        "category": None,
+        "urgency": None,
+        "terms": [],
+        "city": None,
+        "center": None,
+        "radiusKm": None,
+        "budgetMin": None,
+        "budgetMax": None,
+        **criteria,
+    }
+
+def _listing(listing_id="l1", user="seller", title="Satılık bisiklet", location="Kadıköy", **fields):
+    listing = {
+        "_id": listing_id,
+        "userId": user,
+        "title": title,
+        "category": "diger",
+        "urgency": "acil",
+        "budgetMin": 1000,
+        "budgetMax": 2000,
+        "searchText": build_search_text({"title": title, "location": location}),
+        **normalize_location(location),
+    }
+    listing.update(fields)
+    return listing
+
+def _matches(search: dict, listing: dict) -> bool:
+    return matches(search, listing, _listing_terms(listing))
+
+def test_searches_are_posted_under_their_most_selective_key():
+    assert search_keys(_search("s", terms=["bisiklet", "dag"], city="İstanbul")) == ["t:bisiklet"]
+    assert search_keys(_search("s", city="İstanbul", category="diger")) == ["c:İstanbul"]
+    assert search_keys(_search("s", category="diger", urgency="acil")) == ["k:diger"]
+    assert search_keys(_search("s", urgency="acil")) == ["u:acil"]
+    assert search_keys(_search("s", budgetMax=500)) == [MATCH_ALL]
+    # A radius covers every grid cell it overlaps
+    assert len(search_keys(_search("s", center=[29.0, 41.0], radiusKm=80))) > 1
+
+def test_every_keyword_must_appear():
+    listing = _listing(title="Dağ bisikleti satılık")
+    assert _matches(_search("s", terms=["bisiklet", "dag"]), listing)
+    assert not _matches(_search("s", terms=["bisiklet", "kask"]), listing)
+
+def test_budget_ranges_must_overlap():
+    listing = _listing()
+    assert _matches(_search("s", budgetMin=1500, budgetMax=5000), listing)
+    assert not _matches(_search("s", budgetMin=2500), listing)
+    assert not _matches(_search("s", budgetMax=500), listing)
+    assert not _matches(_search("s", budgetMin=100), _listing(budgetMax=None))
+
+def test_radius_replaces_the_city_match():
+    listing = _listing(location="Gebze")
+    istanbul = [28.9784, 41.0082]
+    assert _matches(_search("s", city="İstanbul", center=istanbul, radiusKm=80), listing)
+    assert not _matches(_search("s", center=istanbul, radiusKm=20), listing)
+    assert not _matches(_search("s", city="İstanbul"), listing)
+    assert not _matches(_search("s", center=istanbul, radiusKm=80), _listing(location="bilinmiyor"))
+
+def test_index_matches_only_plausible_searches_of_other_users():
+    index = SavedSearchIndex()
+    index.add(_search("keyword", terms=["bisiklet"]))
+    index.add(_search("city", city="İstanbul", category="diger"))
+    index.add(_search("budget", budgetMax=1500))
+    index.add(_search("other-city", city="Ankara"))
+    index.add(_search("own", user="seller", terms=["bisiklet"]))
+
+    found = {search["_id"] for search in index.match(_listing())}
+    assert found == {"keyword", "city", "budget"}
+
+def test_index_remove_and_readd():
+    index = SavedSearchIndex()
+    index.add(_search("s", terms=["bisiklet"]))
+    index.add(_search("s", terms=["kask"]))
+    assert len(index) == 1
+    assert index.match(_listing()) == []
+    index.remove("s")
+    index.remove("missing")
+    assert index.stats() == {"searches": 0, "postings": 0, "matchAll": 0}
+
+@pytest.fixture
+def published(monkeypatch):
+    calls = []
+
+    async def publish(user_ids, type, data):
+        calls.append(sorted(user_ids))
+
+    monkeypatch.setattr(hub, "publish", publish)
+    return calls
+
+def test_fan_out_notifies_each_buyer_once(db, published):
+    matcher = SavedSearchMatcher(reload_interval=60, fanout_interval=60)
+
+    async def scenario():
+        await ensure_indexes(db)
+        await db.saved_searches.insert_many([
+            _search("s1", user="b1", terms=["bisiklet"]),
+            _search("s2", user="b1", city="İstanbul"),
+            _search("s3", user="b2", category="diger"),
+            _search("s4", user="b3", category="emlak"),
+        ])
+        matcher.enqueue(_listing())
+        written = await matcher.fan_out()
+        return written, await db.notifications.find({}, {"_id": 0, "userId": 1, "savedSearchIds": 1}).to_list(length=None)
+
+    written, notifications = asyncio.run(scenario())
+    assert written == 2
+    assert sorted((doc["userId"], sorted(doc["savedSearchIds"])) for doc in notifications) == [
+        ("b1", ["s1", "s2"]),
+        ("b2", ["s3"]),
+    ]
+    assert published == [["b1", "b2"]]
+    assert matcher.stats()["notified"] == 2
+
+def test_repeated_fan_out_skips_duplicates(db, published):
+    matcher = SavedSearchMatcher(reload_interval=60, fanout_interval=60)
+
+    async def scenario():
+        await ensure_indexes(db)
+        await db.saved_searches.insert_one(_search("s1", user="b1", terms=["bisiklet"]))
+        matcher.enqueue(_listing())
+        first = await matcher.fan_out()
+        # A search saved in between is notified; the earlier buyer is not notified again
+        matcher.add(_search("s2", user="b2", terms=["bisiklet"]))
+        matcher.enqueue(_listing())
+        second = await matcher.fan_out()
+        return first, second, await db.notifications.count_documents({})
+
+    assert asyncio.run(scenario()) == (1, 1, 2)
+    assert published == [["b1"], ["b2"]]
+
+def test_changes_during_a_reload_are_kept(db):
+    matcher = SavedSearchMatcher(reload_interval=60, fanout_interval=60)
+
+    async def scenario():
+        await db.saved_searches.insert_one(_search("stored", terms=["bisiklet"]))
+        reload = asyncio.create_task(matcher.reload(db))
+        await asyncio.sleep(0)
+        matcher.add(_search("added", city="İstanbul"))
+        await reload
+
+    asyncio.run(scenario())
+    assert {search["_id"] for search in matcher.index.match(_listing())} == {"stored", "added"}
@@ -0,0 +1,54 @@
+"""Trusted orjson rendering of pipeline documents, against full model validation."""
+from datetime import datetime
+
+import orjson
+import pytest
+from pydantic import ValidationError
+
+from pagination import NEXT_CURSOR_HEADER
+from serialization import listing_page_serializer, notification_serializer
+
+CREATED = datetime(2024, 5, 1, 12, 30, 15, 250000)
+
+NOTIFICATION = {
+    "_id": "n1",
+    "userId": "u1",
+    "type": "listing.match",
+    "listingId": "l1",
+    "createdAt": CREATED,
+    "listing": {"_id": "l1", "title": "Bisiklet"},
+}
+
+def test_shape_keeps_model_fields_and_fills_defaults():
+    shaped = notification_serializer.shape({**NOTIFICATION, "internal": "dropped"})
+    assert shaped == {**NOTIFICATION, "savedSearchIds": [], "isRead": False}
+
+def test_trusted_and_validated_render_agree():
+    for doc in (NOTIFICATION, {**NOTIFICATION, "savedSearchIds": ["s1"], "isRead": True, "listing": None}):
+        trusted = notification_serializer.render(doc, trusted=True)
+        validated = notification_serializer.render(doc, trusted=False)
+        assert orjson.loads(trusted) == orjson.loads(validated)
+
+def test_datetimes_render_as_iso_strings():
+    body = orjson.loads(notification_serializer.render([NOTIFICATION], trusted=True))
+    assert body[0]["createdAt"] == "2024-05-01T12:30:15.250000"
+
+def test_partial_pages_render_only_projected_fields():
+    docs = [{"_id": "l1", "title": "Bisiklet", "category": "diger", "searchText": {"title": "bisiklet"}}]
+    for trusted in (True, False):
+        assert orjson.loads(listing_page_serializer.render(docs, trusted=trusted)) == [
+            {"_id": "l1", "title": "Bisiklet", "category": "diger"}
+        ]
+
+def test_missing_required_fields():
+    doc = {key: value for key, value in NOTIFICATION.items() if key != "userId"}
+    # Trusted rendering does not check documents; validation catches the mismatch
+    assert "userId" not in orjson.loads(notification_serializer.render(doc, trusted=True))
+    with pytest.raises(ValidationError):
+        notification_serializer.render(doc, trusted=False)
+
+def test_response_carries_headers():
+    response = listing_page_serializer.response([], {NEXT_CURSOR_HEADER: "abc"})
+    assert response.body == b"[]"
+    assert response.media_type == "application/json"
+    assert response.headers[NEXT_CURSOR_HEADER] == "abc"
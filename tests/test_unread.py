@@ -0,0 +1,70 @@
+"""Unread counts from the materialized counter, with ETags and long-polling."""
+import asyncio
+
+import pytest
+
+from tests.benchmarks.common import app_client
+
+from auth import create_access_token, user_cache
+from user_stats import COUNTER_FIELDS, get_unread_count
+
+USER = {"_id": "u1", "firstName": "Ayşe", "lastName": "Yılmaz", "email": "ayse@example.com", "hashed_password": "x"}
+
+def _stats(unread: int) -> dict:
+    return {"_id": "u1", **dict.fromkeys(COUNTER_FIELDS, 0), "unreadMessages": unread}
+
+def test_unread_count_never_goes_negative(db):
+    asyncio.run(db.user_stats.insert_one(_stats(-2)))
+    assert asyncio.run(get_unread_count(db, "u1")) == 0
+
+def test_unread_count_is_seeded_on_first_read(db):
+    async def scenario():
+        await db.messages.insert_many([
+            {"_id": "m1", "senderId": "u2", "receiverId": "u1", "isRead": False},
+            {"_id": "m2", "senderId": "u2", "receiverId": "u1", "isRead": True},
+        ])
+        return await get_unread_count(db, "u1"), await db.user_stats.find_one({"_id": "u1"})
+
+    count, stats = asyncio.run(scenario())
+    assert count == 1
+    assert stats["unreadMessages"] == 1
+
+@pytest.fixture
+def signed_in(db):
+    user_cache.clear()
+    asyncio.run(db.users.insert_one(dict(USER)))
+    asyncio.run(db.user_stats.insert_one(_stats(3)))
+    yield db
+    user_cache.clear()
+
+def _get_unread(headers: dict = None, **params):
+    token = create_access_token({"sub": USER["email"]})
+
+    async def request():
+        async with app_client() as client:
+            return await client.get(
+                "/api/messages/unread/count",
+                headers={"Authorization": f"Bearer {token}", **(headers or {})},
+                params=params
+            )
+
+    return asyncio.run(request())
+
+def test_unread_endpoint_answers_304_while_unchanged(signed_in):
+    first = _get_unread()
+    assert first.status_code == 200
+    assert first.json() == {"unreadCount": 3}
+    etag = first.headers["ETag"]
+
+    again = _get_unread({"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+
+    asyncio.run(signed_in.user_stats.update_one({"_id": "u1"}, {"$inc": {"unreadMessages": 1}}))
+    changed = _get_unread({"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json() == {"unreadCount": 4}
+
+def test_long_poll_gives_up_after_wait(signed_in):
+    response = _get_unread({"If-None-Match": '"unread-3"'}, wait=0.05)
+    assert response.status_code == 304
@@ -0,0 +1,88 @@
+"""Materialized per-user dashboard stats."""
+import asyncio
+
+from user_stats import (
+    COUNTER_FIELDS,
+    get_user_stats,
+    increment,
+    record_listing_removed,
+    record_messages_removed,
+    record_favorites_removed,
+    reconcile_user_stats,
+)
+
+def _listing(listing_id, user="u1", status="active", category="emlak", urgency="acil", **extra):
+    return {"_id": listing_id, "userId": user, "status": status, "category": category, "urgency": urgency, **extra}
+
+def _seed(db):
+    return asyncio.run(_insert(db))
+
+async def _insert(db):
+    await db.listings.insert_many([
+        _listing("l1"),
+        _listing("l2", status="completed"),
+        _listing("l3", status="expired"),
+        _listing("l4", deletedAt="2024-01-01"),
+        _listing("l5", user="u2"),
+    ])
+    await db.messages.insert_many([
+        {"_id": "m1", "senderId": "u2", "receiverId": "u1", "isRead": False},
+        {"_id": "m2", "senderId": "u2", "receiverId": "u1", "isRead": True},
+        {"_id": "m3", "senderId": "u1", "receiverId": "u2", "isRead": False},
+    ])
+    await db.favorites.insert_many([{"_id": "f1", "userId": "u1"}, {"_id": "f2", "userId": "u1"}])
+
+EXPECTED_U1 = {
+    "totalListings": 3,
+    "activeListings": 1,
+    "completedListings": 1,
+    "expiredListings": 1,
+    "receivedMessages": 2,
+    "sentMessages": 1,
+    "favoritesCount": 2,
+    "unreadMessages": 1,
+}
+
+def test_stats_are_seeded_from_real_counts_on_first_read(db):
+    _seed(db)
+    stats = asyncio.run(get_user_stats(db, "u1"))
+    assert {field: stats[field] for field in COUNTER_FIELDS} == EXPECTED_U1
+    stored = asyncio.run(db.user_stats.find_one({"_id": "u1"}))
+    assert stored["reconciledAt"] is not None
+
+def test_increments_never_create_a_document(db):
+    asyncio.run(increment(db, "u9", sentMessages=1))
+    assert asyncio.run(db.user_stats.count_documents({})) == 0
+
+def test_removals_decrement_counters(db):
+    _seed(db)
+
+    async def scenario():
+        await get_user_stats(db, "u1")
+        await get_user_stats(db, "u2")
+        await record_listing_removed(db, _listing("l2", status="completed"))
+        await record_messages_removed(db, [
+            {"senderId": "u2", "receiverId": "u1", "isRead": False},
+            {"senderId": "u1", "receiverId": "u2", "isRead": True},
+        ])
+        await record_favorites_removed(db, [{"userId": "u1"}])
+        return await get_user_stats(db, "u1"), await get_user_stats(db, "u2")
+
+    u1, u2 = asyncio.run(scenario())
+    assert (u1["totalListings"], u1["completedListings"], u1["activeListings"]) == (2, 0, 1)
+    assert (u1["receivedMessages"], u1["unreadMessages"], u1["sentMessages"]) == (1, 0, 0)
+    assert u1["favoritesCount"] == 1
+    assert (u2["sentMessages"], u2["receivedMessages"], u2["unreadMessages"]) == (1, 0, 1)
+
+def test_reconcile_repairs_drift(db):
+    _seed(db)
+
+    async def scenario():
+        await get_user_stats(db, "u1")
+        await db.user_stats.update_one({"_id": "u1"}, {"$inc": {"activeListings": 5, "favoritesCount": -7}})
+        repaired = await reconcile_user_stats(db)
+        return repaired, await db.user_stats.find_one({"_id": "u1"})
+
+    repaired, stats = asyncio.run(scenario())
+    assert repaired == 1
+    assert {field: stats[field] for field in COUNTER_FIELDS} == EXPECTED_U1
@@ -0,0 +1,114 @@
+"""Flushing buffered view counts, including batches that fail part-way."""
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+import database
+from trending import activity_hour
+from view_buffer import ViewCountBuffer
+
+class PartlyFailingCollection:
+    """Applies a bulk write except the operations at ``failing``, as an unordered batch would"""
+
+    def __init__(self, collection, failing):
+        self.collection = collection
+        self.failing = set(failing)
+
+    async def bulk_write(self, operations, ordered=True):
+        applied = [operation for index, operation in enumerate(operations) if index not in self.failing]
+        if applied:
+            await self.collection.bulk_write(applied, ordered=False)
+        raise BulkWriteError({
+            "writeErrors": [{"index": index, "code": 2, "errmsg": "failed"} for index in sorted(self.failing)],
+            "nModified": len(applied),
+        })
+
+class DatabaseWith:
+    """``db`` with some collections swapped out"""
+
+    def __init__(self, db, **collections):
+        self._db = db
+        self.__dict__.update(collections)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+def _buffer(*listing_ids) -> ViewCountBuffer:
+    buffer = ViewCountBuffer(flush_interval=60, max_pending=1000)
+    for listing_id in listing_ids:
+        buffer.record(listing_id)
+    return buffer
+
+async def _views(db) -> dict:
+    return {doc["_id"]: doc["views"] async for doc in db.listings.find({}, {"views": 1})}
+
+async def _activity(db) -> dict:
+    return {doc["listingId"]: doc["views"] async for doc in db.listing_activity.find({})}
+
+@pytest.fixture
+def listings(db):
+    asyncio.run(db.listings.insert_many([{"_id": listing_id, "views": 0} for listing_id in ("a", "b", "c")]))
+    return db
+
+def test_flush_writes_views_and_activity(listings):
+    db = listings
+    buffer = _buffer("a", "b", "a", "c", "a")
+    assert buffer.pending("a") == 3
+
+    async def scenario():
+        flushed = await buffer.flush()
+        return flushed, await _views(db), await _activity(db)
+
+    flushed, views, activity = asyncio.run(scenario())
+    assert flushed == 3
+    assert views == {"a": 3, "b": 1, "c": 1}
+    assert activity == {"a": 3, "b": 1, "c": 1}
+    assert buffer.pending("a") == 0
+
+def test_flush_without_pending_views_or_database(listings, monkeypatch):
+    buffer = _buffer()
+    assert asyncio.run(buffer.flush()) == 0
+    buffer.record("a")
+    monkeypatch.setattr(database, "database", None)
+    assert asyncio.run(buffer.flush()) == 0
+    assert buffer.pending("a") == 1
+
+def test_partial_failure_requeues_only_the_failed_increments(listings, monkeypatch):
+    db = listings
+    buffer = _buffer("a", "b", "b", "c")
+    monkeypatch.setattr(database, "database", DatabaseWith(db, listings=PartlyFailingCollection(db.listings, [1])))
+
+    with pytest.raises(BulkWriteError):
+        asyncio.run(buffer.flush())
+    assert (buffer.pending("a"), buffer.pending("b"), buffer.pending("c")) == (0, 2, 0)
+    assert asyncio.run(_views(db)) == {"a": 1, "b": 0, "c": 1}
+    assert asyncio.run(_activity(db)) == {"a": 1, "c": 1}
+
+    # The retry counts "b" once, and nothing twice
+    monkeypatch.setattr(database, "database", db)
+    assert asyncio.run(buffer.flush()) == 1
+    assert asyncio.run(_views(db)) == {"a": 1, "b": 2, "c": 1}
+    assert asyncio.run(_activity(db)) == {"a": 1, "b": 2, "c": 1}
+
+def test_failed_flush_requeues_the_whole_batch(listings, monkeypatch):
+    db = listings
+
+    class Unreachable:
+        async def bulk_write(self, operations, ordered=True):
+            raise ConnectionError("down")
+
+    buffer = _buffer("a", "c", "c")
+    monkeypatch.setattr(database, "database", DatabaseWith(db, listings=Unreachable()))
+    with pytest.raises(ConnectionError):
+        asyncio.run(buffer.flush())
+    buffer.record("c")
+    assert (buffer.pending("a"), buffer.pending("c")) == (1, 3)
+    assert asyncio.run(_activity(db)) == {}
+
+def test_activity_buckets_are_hourly(listings):
+    db = listings
+    asyncio.run(_buffer("a").flush())
+    bucket = asyncio.run(db.listing_activity.find_one({"listingId": "a"}))
+    assert bucket["hour"] == activity_hour(bucket["hour"])
+    assert bucket["expiresAt"] > bucket["hour"]